@@ -0,0 +1,97 @@
+'''
+Compares the original generate_mapping.py loop (one pd.concat per ticker) with the process-pool
+parser of sec_mapping.py, on synthetic EDGAR submission files.
+
+For every number of files N, N submission files with one to three tickers each are written to a
+scratch directory. The original loop runs up to --legacy-max files, since it is quadratic, then
+sec_mapping runs with every number of workers. Files per second are printed and both outputs are
+checked to hold the same rows.
+
+Usage (from the repository root):
+    python benchmarks/bench_mapping.py [--files 1000 5000 50000] [--workers 1 4] [--legacy-max 5000]
+'''
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import pandas as pd
+import sec_mapping
+
+def make_submissions(files):
+    directory_path = tempfile.mkdtemp(prefix="sec_bench_")
+    rng = random.Random(0)
+    for i in range(files):
+        data = {"cik": 1000 + i, "company_name": f"Company {i} Inc",
+                "tickers": [f"T{i}{suffix}" for suffix in "ABC"[:rng.randint(1, 3)]],
+                # real submission files also carry the filing history, which dominates their size
+                "filings": {"recent": {"accessionNumber": [f"0000{i}-24-{n:06d}" for n in range(1000)]}}}
+        with open(os.path.join(directory_path, f"CIK{1000 + i:010d}.json"), 'w') as f:
+            json.dump(data, f)
+    return directory_path
+
+def legacy(directory_path, output_path):
+    '''
+    The loop of the original generate_mapping.py, without the per-file print.
+    '''
+    columns = ["cik", "company_name", "ticker"]
+    new_csv = pd.DataFrame(columns=columns)
+    for filename in os.listdir(directory_path):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory_path, filename), 'r') as file:
+                data = json.load(file)
+                for ticker in data['tickers']:
+                    new_row = pd.DataFrame([[data['cik'], data['company_name'], ticker]], columns=columns)
+                    new_csv = pd.concat([new_csv, new_row], ignore_index=True)
+    new_csv.to_csv(output_path, index=False)
+
+def streamed(directory_path, output_path, workers):
+    json_files = sec_mapping.submission_files(directory_path)
+    with sec_mapping.RowWriter(output_path) as writer:
+        for _, rows in sec_mapping.iter_parsed(json_files, workers):
+            writer.write(rows)
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return sorted(tuple(row) for row in csv.reader(f))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 5000, 50000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--legacy-max", type=int, default=5000, help="largest number of files the original loop runs on")
+    args = parser.parse_args()
+
+    print(f"parser: {sec_mapping.loads.__module__}")
+    print(f"{'files':>7} {'version':>12} {'seconds':>8} {'files/s':>9}")
+    for files in args.files:
+        directory_path = make_submissions(files)
+        try:
+            expected = None
+            runs = [("legacy", None)] if files <= args.legacy_max else []
+            runs += [(f"{workers} workers", workers) for workers in args.workers]
+            for label, workers in runs:
+                output_path = os.path.join(directory_path, "mapping.csv")
+                start = time.perf_counter()
+                if workers is None:
+                    legacy(directory_path, output_path)
+                else:
+                    streamed(directory_path, output_path, workers)
+                elapsed = time.perf_counter() - start
+                rows = read_rows(output_path)
+                assert expected is None or rows == expected, f"{label} rows differ"
+                expected = rows
+                os.remove(output_path)
+                print(f"{files:>7} {label:>12} {elapsed:>8.2f} {files / elapsed:>9.0f}")
+        finally:
+            shutil.rmtree(directory_path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
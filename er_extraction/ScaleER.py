@@ -1,40 +1,85 @@
-from pyspark.sql import SparkSession
-import pandas as pd
+import os
+import time
 import json
+import shutil
 import getpass
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import requests
-
-# Initialize Spark session for distributed processing
-spark = SparkSession.builder.appName("ScaleEntityRelationshipExtraction").getOrCreate()
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Global variables
-TOKEN = getpass('Enter token: ')
 FIELDS = "entities,facts"
 HOST = "nl.diffbot.com"
 MIN_SALIENCE = 0.5
+# Requests each partition keeps in flight at once
+MAX_IN_FLIGHT = int(os.getenv("ER_SCALE_IN_FLIGHT", 4))
+# Minimum seconds between two requests of a partition; 0 disables pacing
+REQUEST_INTERVAL = float(os.getenv("ER_SCALE_REQUEST_INTERVAL", 0))
+# spark, processes, or auto (spark when PySpark is installed, processes otherwise)
+BACKEND = os.getenv("ER_SCALE_BACKEND", "auto")
+# Documents buffered by a worker before they are written out as one Parquet file per output
+WRITE_BATCH = int(os.getenv("ER_SCALE_WRITE_BATCH", 500))
+
+def service_url():
+    """Base URL of the Natural Language API, overridable with ER_SERVICE_URLS as in http_client (diffbot=... or *=...)."""
+    urls = {}
+    for item in os.getenv("ER_SERVICE_URLS", "").split(","):
+        if "=" in item:
+            service, url = item.split("=", 1)
+            urls[service.strip()] = url.strip().rstrip("/")
+    return urls.get("diffbot", urls.get("*", f"https://{HOST}"))
+
+def get_token():
+    """Diffbot token from DIFFBOT_KEY, asked for interactively when it is not set."""
+    return os.getenv("DIFFBOT_KEY") or getpass.getpass('Enter token: ')
+
+# --- Output schemas ---
+def entity_schema():
+    from pyspark.sql.types import StructType, StructField, StringType, DoubleType
+    return StructType([
+        StructField("doc_id", StringType(), False),
+        StructField("name", StringType(), False),
+        StructField("salience", DoubleType(), True),
+        StructField("label", StringType(), True),
+    ])
 
-# --- Data Ingestion ---
-def load_data(file_path):
-    """Load ECM data from a distributed storage source."""
-    return spark.read.text(file_path)
+def fact_schema():
+    from pyspark.sql.types import StructType, StructField, StringType
+    return StructType([
+        StructField("doc_id", StringType(), False),
+        StructField("entity", StringType(), True),
+        StructField("property", StringType(), True),
+        StructField("value", StringType(), True),
+        StructField("evidence", StringType(), True),
+    ])
+
+def document_schema():
+    from pyspark.sql.types import StructType, StructField, StringType, ArrayType
+    return StructType([
+        StructField("doc_id", StringType(), False),
+        StructField("status", StringType(), False),
+        StructField("error", StringType(), True),
+        StructField("entities", ArrayType(entity_schema()), False),
+        StructField("facts", ArrayType(fact_schema()), False),
+    ])
 
 # --- Entity Extraction and Classification ---
-def extract_entities(api_response):
+def extract_entities(doc_id, api_response):
     """Extract and filter entities from API response based on salience."""
     entities = api_response.get("entities", [])
-    salient_entities = [ent for ent in entities if ent["salience"] >= MIN_SALIENCE]
-
-    # Classify entities based on their types
-    classified_entities = [
+    return [
         {
+            "doc_id": doc_id,
             "name": ent["name"],
-            "salience": ent["salience"],
-            "Labels": classify_entity(ent)  # Classify based on type
+            "salience": float(ent["salience"]),
+            "label": classify_entity(ent)  # Classify based on type
         }
-        for ent in salient_entities
+        for ent in entities if ent["salience"] >= MIN_SALIENCE
     ]
-    
-    return pd.DataFrame(classified_entities)
 
 def classify_entity(entity):
     """Classify entity type based on its attributes."""
@@ -52,85 +97,246 @@ def classify_entity(entity):
     return entity_types[0] if entity_types else "unknown"
 
 # --- Relationship Extraction ---
-def extract_relationships(api_response):
-    """Extract relationships from API response data."""
-    relationships = api_response.get("relationships", [])
-    extracted_relationships = [
+def extract_relationships(doc_id, api_response):
+    """Extract relationships (the API's facts) from API response data."""
+    return [
         {
-            "subject": rel["subject"],
-            "object": rel["object"],
-            "type": rel["type"]
+            "doc_id": doc_id,
+            "entity": fact["entity"]["name"],
+            "property": fact["property"]["name"],
+            "value": fact["value"]["name"],
+            "evidence": fact["evidence"][0].get("passage") if fact.get("evidence") else None,
         }
-        for rel in relationships
+        for fact in api_response.get("facts", [])
     ]
-    return pd.DataFrame(extracted_relationships)
 
 # --- API Request Handling ---
+def new_session(pool_size = MAX_IN_FLIGHT):
+    """Pooled keep-alive session retrying connection errors, 429 and 5xx responses with backoff."""
+    session = requests.Session()
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                    allowed_methods=["POST"], respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
 
-def get_request(payload):
+def get_request(session, url, token, payload):
   """Make a call to Diffbot's Natural Language API to retrieve entity and relationship data."""
-  res = requests.post("https://{}/v1/?fields={}&token={}".format(HOST, FIELDS, TOKEN), json=payload)
-  ret = None
+  res = session.post("{}/v1/?fields={}&token={}".format(url, FIELDS, token), json=payload)
   try:
     ret = res.json()
-  except:
-    print("Bad response: " + res.text)
-    print(res.status_code)
-    print(res.headers)
+  except ValueError:
+    return {"error": f"Bad response ({res.status_code}): {res.text[:200]}"}
+  if not isinstance(ret, dict):
+    return {"error": f"Unexpected response ({res.status_code})"}
   return ret
 
+def document_id(text):
+    """Stable id of a document: the SHA-256 of its text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def process_document(session, url, token, text):
+    """Send one document to the API once and return its entities and facts."""
+    doc_id = document_id(text)
+    try:
+        res = get_request(session, url, token, {"content": text, "lang": "en", "format": "plain text"})
+    except requests.exceptions.RequestException as e:
+        res = {"error": str(e)}
+    if "error" in res or "entities" not in res:
+        return {"doc_id": doc_id, "status": "failed", "error": str(res.get("error")), "entities": [], "facts": []}
+    return {"doc_id": doc_id, "status": "ok", "error": None,
+            "entities": extract_entities(doc_id, res), "facts": extract_relationships(doc_id, res)}
+
+def process_partition(texts, url, token):
+    """Process the documents of one partition with one pooled session, keeping at most MAX_IN_FLIGHT requests open.
+    Results are yielded in input order."""
+    texts = (text for text in texts if text and text.strip())
+    session = new_session()
+    pace_lock = threading.Lock()
+    last_request = [0.0]
+
+    def run(text):
+        if REQUEST_INTERVAL > 0:
+            with pace_lock:
+                wait = last_request[0] + REQUEST_INTERVAL - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                last_request[0] = time.monotonic()
+        return process_document(session, url, token, text)
+
+    with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT) as pool:
+        in_flight = deque()
+        for text in texts:
+            in_flight.append(pool.submit(run, text))
+            if len(in_flight) >= MAX_IN_FLIGHT:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    session.close()
+
 # --- Distributed Processing with Spark ---
-def process_entities(partition):
-    """Process entity extraction in parallel across partitions."""
-    entities = []
-    for row in partition:
-        api_response = get_request(row["value"])
-        entities_df = extract_entities(api_response)
-        entities.append(entities_df)
-    return pd.concat(entities) if entities else pd.DataFrame()
-
-def process_relationships(partition):
-    """Process relationship extraction in parallel across partitions."""
-    relationships = []
-    for row in partition:
-        api_response = get_request(row["value"])
-        rels_df = extract_relationships(api_response)
-        relationships.append(rels_df)
-    return pd.concat(relationships) if relationships else pd.DataFrame()
+def document_row(doc):
+    """Document as a tuple in the field order of document_schema."""
+    return (doc["doc_id"], doc["status"], doc["error"],
+            [(e["doc_id"], e["name"], e["salience"], e["label"]) for e in doc["entities"]],
+            [(f["doc_id"], f["entity"], f["property"], f["value"], f["evidence"]) for f in doc["facts"]])
 
-# --- Pipeline Execution ---
-def main(input_path, output_path):
-    """Main function to run the distributed Entity-Relationship Extraction pipeline."""
-    # Load data from the specified input path
-    ecm_data = load_data(input_path)
+def get_spark():
+    """Spark session; SPARK_MASTER selects the master, e.g. local[*], otherwise spark-submit's or PySpark's default."""
+    from pyspark.sql import SparkSession
+    builder = SparkSession.builder.appName("ScaleEntityRelationshipExtraction")
+    if os.getenv("SPARK_MASTER"):
+        builder = builder.master(os.getenv("SPARK_MASTER"))
+    return builder.getOrCreate()
+
+def run_spark(input_path, output_path, url, token, partitions = None):
+    """Single pass over the documents: one API call each, then entities and facts written as partitioned Parquet."""
+    from pyspark import StorageLevel
+    from pyspark.sql import functions as F
+
+    spark = get_spark()
+    if __name__ != "__main__":
+        # the partition functions are pickled by reference when ScaleER is imported, so executors must be able to import it
+        spark.sparkContext.addPyFile(os.path.abspath(__file__))
+    lines = spark.read.text(input_path).rdd.map(lambda row: row.value)
+    if partitions:
+        lines = lines.repartition(partitions)
+
+    documents = spark.createDataFrame(
+        lines.mapPartitions(lambda texts: map(document_row, process_partition(texts, url, token))), document_schema())
+    # Both outputs are read from the persisted documents, so each document is only sent to the API once
+    documents.persist(StorageLevel.MEMORY_AND_DISK)
+
+    entities = documents.select(F.explode("entities").alias("e")).select("e.*")
+    facts = documents.select(F.explode("facts").alias("f")).select("f.*")
+    entities.write.mode("overwrite").partitionBy("label").parquet(os.path.join(output_path, "entities"))
+    facts.write.mode("overwrite").partitionBy("property").parquet(os.path.join(output_path, "facts"))
+    documents.select("doc_id", "status", "error").write.mode("overwrite").parquet(os.path.join(output_path, "documents"))
+
+    counts = documents.groupBy("status").count().collect()
+    documents.unpersist()
+    return {row["status"]: row["count"] for row in counts}
+
+# --- Multi-process Processing without Spark ---
+def input_files(input_path):
+    """Files of a local input path: the file itself, or every file of a directory in name order."""
+    if os.path.isdir(input_path):
+        return [os.path.join(input_path, name) for name in sorted(os.listdir(input_path))
+                if not name.startswith((".", "_")) and os.path.isfile(os.path.join(input_path, name))]
+    return [input_path]
 
-    # Distributed Entity Extraction
-    entities_rdd = ecm_data.rdd.mapPartitions(process_entities)
-    entities_df = spark.createDataFrame(entities_rdd).cache()
+def split_input(input_path, partitions):
+    """Split the input files into byte ranges of about equal size, like Spark's text file splits.
+    A line belongs to the range its first byte falls in."""
+    files = [(path, os.path.getsize(path)) for path in input_files(input_path)]
+    total = sum(size for _, size in files)
+    target = max(1, -(-total // max(1, partitions)))
+    splits = []
+    for path, size in files:
+        for start in range(0, size, target):
+            splits.append((path, start, min(size, start + target)))
+    return splits
 
-    # Distributed Relationship Extraction
-    relationships_rdd = ecm_data.rdd.mapPartitions(process_relationships)
-    relationships_df = spark.createDataFrame(relationships_rdd).cache()
+def read_split(path, start, end):
+    """Lines of a file whose first byte is in [start, end)."""
+    with open(path, 'rb') as f:
+        if start > 0:
+            # the line running into this range belongs to the previous one
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line.decode("utf-8").rstrip("\r\n")
 
-    # Save results to JSON format
-    entities_json = entities_df.toJSON().collect()
-    relationships_json = relationships_df.toJSON().collect()
+def arrow_schemas():
+    """Arrow schemas of the entities, facts and documents outputs, matching the Spark schemas."""
+    import pyarrow as pa
+    entity = pa.schema([("doc_id", pa.string()), ("name", pa.string()), ("salience", pa.float64()), ("label", pa.string())])
+    fact = pa.schema([("doc_id", pa.string()), ("entity", pa.string()), ("property", pa.string()),
+                      ("value", pa.string()), ("evidence", pa.string())])
+    document = pa.schema([("doc_id", pa.string()), ("status", pa.string()), ("error", pa.string())])
+    return entity, fact, document
 
-    # Aggregate and store in JSON schema
-    final_output = {
-        "entities": [json.loads(ent) for ent in entities_json],
-        "relationships": [json.loads(rel) for rel in relationships_json]
-    }
+def write_shard(output_path, index, batch, documents, entities, facts):
+    """Write one batch of a worker's results in the layout Spark writes: entities/label=.../, facts/property=.../, documents/."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    entity_schema, fact_schema, document_schema = arrow_schemas()
+    name = f"part-{index:05d}-{batch:05d}-{{i}}.parquet"
+    for rows, schema, directory, partition_cols in [
+            (entities, entity_schema, "entities", ["label"]),
+            (facts, fact_schema, "facts", ["property"]),
+            (documents, document_schema, "documents", None)]:
+        if not rows:
+            continue
+        table = pa.Table.from_pylist(rows, schema=schema)
+        pq.write_to_dataset(table, os.path.join(output_path, directory), partition_cols=partition_cols,
+                            basename_template=name, existing_data_behavior="overwrite_or_ignore")
 
-    with open(output_path, "w") as f:
-        json.dump(final_output, f, indent=2)
+def run_split(index, split, output_path, url, token):
+    """Worker: process one input split and write its shard files, WRITE_BATCH documents at a time."""
+    counts = {}
+    documents, entities, facts = [], [], []
+    batch = 0
+    for doc in process_partition(read_split(*split), url, token):
+        counts[doc["status"]] = counts.get(doc["status"], 0) + 1
+        documents.append({"doc_id": doc["doc_id"], "status": doc["status"], "error": doc["error"]})
+        entities.extend(doc["entities"])
+        facts.extend(doc["facts"])
+        if len(documents) >= WRITE_BATCH:
+            write_shard(output_path, index, batch, documents, entities, facts)
+            documents, entities, facts = [], [], []
+            batch += 1
+    write_shard(output_path, index, batch, documents, entities, facts)
+    return counts
 
+def run_processes(input_path, output_path, url, token, partitions = None):
+    """Same single pass as run_spark, on one host: each input split is processed by a worker process
+    that writes its own Parquet shard files."""
+    partitions = partitions or os.cpu_count() or 1
+    splits = split_input(input_path, partitions)
+    for directory in ["entities", "facts", "documents"]:
+        shutil.rmtree(os.path.join(output_path, directory), ignore_errors=True)
+    os.makedirs(output_path, exist_ok=True)
+
+    counts = {}
+    with ProcessPoolExecutor(max_workers=min(partitions, max(1, len(splits)))) as pool:
+        futures = [pool.submit(run_split, i, split, output_path, url, token) for i, split in enumerate(splits)]
+        for future in as_completed(futures):
+            for status, count in future.result().items():
+                counts[status] = counts.get(status, 0) + count
+    return counts
+
+def use_spark():
+    """Whether main runs on Spark, per ER_SCALE_BACKEND."""
+    if BACKEND != "auto":
+        return BACKEND == "spark"
+    try:
+        import pyspark
+        return True
+    except ImportError:
+        return False
+
+# --- Pipeline Execution ---
+def main(input_path, output_path):
+    """Main function to run the distributed Entity-Relationship Extraction pipeline."""
+    url = service_url()
+    token = get_token()
+    partitions = int(os.getenv("ER_SCALE_PARTITIONS", 0)) or None
+    if use_spark():
+        counts = run_spark(input_path, output_path, url, token, partitions)
+    else:
+        counts = run_processes(input_path, output_path, url, token, partitions)
+    print(f"Documents processed: {json.dumps(counts)}")
     print(f"Entity-Relationship Extraction completed. Results saved to {output_path}")
 
 # --- Run Script ---
 if __name__ == "__main__":
-    # Input and output paths for ECM data and results
-    input_path = "s3://your-bucket/ECM_data.txt"  # Modify this to your input data path
-    output_path = "output/EntityRelationshipExtractionResults.json"  # Modify as desired
+    # Input and output paths for ECM data and results; one document per line
+    input_path = os.getenv("ER_SCALE_INPUT", "s3://your-bucket/ECM_data.txt")
+    output_path = os.getenv("ER_SCALE_OUTPUT", "output/EntityRelationshipExtractionResults")
 
-    main(input_path, output_path)
\ No newline at end of file
+    main(input_path, output_path)
@@ -0,0 +1,122 @@
+'''
+Benchmarks extract_entites / extract_relationships against the previous iterrows-based implementation.
+
+Builds a synthetic Natural Language API response with the given number of entities and facts,
+checks that both implementations return the same DataFrames and prints their timings.
+
+Usage (from the repository root):
+    python er_extraction/benchmarks/bench_extract.py [--size 2000] [--repeat 5]
+'''
+
+import os
+import sys
+import time
+import random
+import argparse
+import warnings
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from main_A import extract_entites, extract_relationships
+
+warnings.filterwarnings('ignore')
+
+TYPE_NAMES = ["organization", "field of work", "industry", "country", "location", "product",
+              "person", "skill", "event"]
+
+def legacy_extract_entites(res):
+    '''
+    extract_entites as it was before the columnar rewrite.
+    '''
+    ents = pd.DataFrame.from_dict(res["entities"])
+    if not ents.empty:
+        salient_ents = ents[ents["salience"] > 0.5]
+        salient_ents["Labels"] = None
+        for i, row in salient_ents.iterrows():
+            if len(row['allTypes']) != 0:
+                names = [ent_type["name"] for ent_type in row['allTypes']]
+                if "organization" in names:
+                    salient_ents.loc[i,"Labels"] = 'company'
+                elif ("field of work" in names)  or ("industry" in names) or ("industry" in row['name']):
+                    salient_ents.loc[i,'Labels'] = 'industry'
+                elif "country" in names:
+                    salient_ents.loc[i,'Labels'] = 'country'
+                elif "location" in names:
+                    salient_ents.loc[i,'Labels'] = 'location'
+                elif "product" in names:
+                    salient_ents.loc[i,'Labels'] = 'product'
+                else:
+                    salient_ents.loc[i,'Labels'] = row['allTypes'][0]['name']
+        fin_ents = salient_ents[['name','salience','Labels']]
+        return fin_ents
+    return ents
+
+def legacy_extract_relationships(res):
+    '''
+    extract_relationships as it was before the columnar rewrite.
+    '''
+    rels =  pd.DataFrame.from_dict(res["facts"])
+    if not rels.empty:
+        for i, row in rels.iterrows():
+            rels.loc[i,"entity"] = row["entity"]["name"]
+            rels.loc[i,"property"] = row["property"]["name"]
+            rels.loc[i,"value"] = row["value"]["name"]
+            if row["evidence"] != []:
+                rels.loc[i,"evidence"] = row["evidence"][0].get("passage",None)
+        fin_rels = rels[['entity','property','value','evidence']]
+        return fin_rels
+    return rels
+
+def synthetic_response(size, seed = 0):
+    '''
+    Generates a response shaped like the Natural Language API's, with size entities and size facts.
+    '''
+    rng = random.Random(seed)
+    entities = []
+    for i in range(size):
+        types = rng.sample(TYPE_NAMES, rng.randint(0, 3))
+        name = f"Entity {i}" + (" industry" if rng.random() < 0.05 else "")
+        entities.append({
+            "name": name,
+            "salience": rng.random(),
+            "allTypes": [{"name": t} for t in types],
+        })
+    facts = []
+    for i in range(size):
+        evidence = [{"passage": f"Passage {i}"}] if rng.random() < 0.8 else []
+        facts.append({
+            "entity": {"name": f"Entity {rng.randrange(size)}"},
+            "property": {"name": rng.choice(["headquarters", "competitors", "product type", "industry"])},
+            "value": {"name": f"Value {i}"},
+            "evidence": evidence,
+        })
+    return {"entities": entities, "facts": facts}
+
+def best_time(func, arg, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for size in args.size:
+        res = synthetic_response(size)
+        pd.testing.assert_frame_equal(extract_entites(res), legacy_extract_entites(res), check_dtype=False)
+        pd.testing.assert_frame_equal(extract_relationships(res), legacy_extract_relationships(res), check_dtype=False)
+
+        for label, new, old in [("entities", extract_entites, legacy_extract_entites),
+                                ("facts", extract_relationships, legacy_extract_relationships)]:
+            new_time = best_time(new, res, args.repeat)
+            old_time = best_time(old, res, args.repeat)
+            print(f"{label:>8} n={size:<6} iterrows {old_time * 1000:9.1f} ms   "
+                  f"columnar {new_time * 1000:8.1f} ms   speedup {old_time / new_time:6.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+'''
+End-to-end throughput benchmark of generate_json_schema against the local fake services.
+
+For every number of companies N, a synthetic `companies` table with N tickers is written to a
+scratch directory next to copies of the lookup tables in data/. For every number of workers, the
+pipeline then runs in a fresh process with all services pointed at benchmarks/fake_services.py,
+the response cache off and rate limiting disabled. Companies per second and the p50/p99 latency of
+a single company (filings, Wikipedia, name and ticker lookups, fill and linking) are printed.
+
+Usage (from the repository root):
+    python er_extraction/benchmarks/bench_pipeline.py [--companies 20 100] [--workers 1 4 8]
+        [--latency-ms 50] [--jitter-ms 20] [--service-latency diffbot=300] [--error-rate 0.01]
+'''
+
+import os
+import sys
+import time
+import socket
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ER_DIR = os.path.join(BENCH_DIR, '..')
+DATA_DIR = os.path.join(ER_DIR, '..', 'data')
+sys.path.insert(0, ER_DIR)
+
+LOOKUP_TABLES = ["company_industry.csv", "CIK.csv", "NASDAQ_10-K_URLs.csv", "mapping_stock.csv",
+                 "country_aliases.csv", "world_cities.csv"]
+# Every host throttled by concurrency; a rate of 0 disables its token bucket
+HOSTS = ["nl.diffbot.com", "www.google.com", "www.geonames.org", "en.wikipedia.org", "finance.yahoo.com"]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_fake_services(args):
+    port = free_port()
+    command = [sys.executable, os.path.join(BENCH_DIR, "fake_services.py"), "--port", str(port),
+               "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+               "--service-latency", args.service_latency, "--error-rate", str(args.error_rate)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("fake services did not start")
+
+def make_workdir(companies, item_chars):
+    '''
+    Creates a scratch directory with data/ holding the lookup tables and a synthetic companies table.
+    '''
+    workdir = tempfile.mkdtemp(prefix="er_bench_")
+    os.makedirs(os.path.join(workdir, "data"))
+    os.makedirs(os.path.join(workdir, "output"))
+    for name in LOOKUP_TABLES:
+        shutil.copy(os.path.join(DATA_DIR, name), os.path.join(workdir, "data", name))
+
+    con = sqlite3.connect(os.path.join(workdir, "data", "ecmdatabase.db"))
+    con.execute("CREATE TABLE companies(stock_symbol TEXT PRIMARY KEY, name TEXT, item1 TEXT, item7 TEXT, filing_year INT)")
+    rows = []
+    for i in range(companies):
+        sentence = f"Company {i} designs and sells products in many markets. "
+        item1 = (sentence * (item_chars // len(sentence) + 1))[:item_chars]
+        item7 = f"Management discussion of Company {i}. " + item1[: item_chars // 2]
+        rows.append((f"B{i:05d}", f"Bench Company {i:05d}", item1, item7, 2024))
+    con.executemany("INSERT INTO companies VALUES (?, ?, ?, ?, ?)", rows)
+    con.commit()
+    con.close()
+    return workdir
+
+def run_once(workdir, service_url, workers):
+    '''
+    Runs the pipeline over every company in workdir. Runs in a fresh process so no memoised lookups are shared.
+    '''
+    os.chdir(workdir)
+    os.environ["ER_SERVICE_URLS"] = f"*={service_url}"
+    os.environ["ER_CACHE_MODE"] = "off"
+    os.environ["ER_RATE_LIMITS"] = ",".join(f"{host}=0" for host in HOSTS)
+    os.environ["ER_DEFAULT_RATE"] = "0"
+    os.environ["ER_TIMING_SAMPLES"] = "1"
+    os.environ["ER_EXTRACTION_WORKERS"] = str(workers)
+    sys.stdout = open(os.devnull, 'w')
+
+    import main_A
+    import instrumentation
+    start = time.perf_counter()
+    schema = main_A.generate_json_schema(main_A.create_json_schema(), limit=None, max_workers=workers)
+    elapsed = time.perf_counter() - start
+    stages = instrumentation.snapshot()
+    company = stages.get("company", {})
+    return {
+        "companies": company.get("calls", 0),
+        "errors": company.get("errors", 0),
+        "elapsed": elapsed,
+        "p50_ms": company.get("p50_ms", 0),
+        "p99_ms": company.get("p99_ms", 0),
+        "nodes": sum(len(nodes) for nodes in schema["nodes"].values()),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, nargs="+", default=[20, 100])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--item-chars", type=int, default=5000, help="characters of Item 1 per company")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--service-latency", default="", help="per-service latency, e.g. diffbot=300")
+    parser.add_argument("--error-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    fake, service_url = start_fake_services(args)
+    context = multiprocessing.get_context("spawn")
+    try:
+        print(f"{'companies':>9} {'workers':>7} {'seconds':>8} {'co/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'failed':>6} {'nodes':>6}")
+        for companies in args.companies:
+            workdir = make_workdir(companies, args.item_chars)
+            try:
+                for workers in args.workers:
+                    with context.Pool(1) as pool:
+                        result = pool.apply(run_once, (workdir, service_url, workers))
+                    print(f"{companies:>9} {workers:>7} {result['elapsed']:>8.2f} "
+                          f"{result['companies'] / result['elapsed']:>7.2f} {result['p50_ms']:>8.1f} "
+                          f"{result['p99_ms']:>8.1f} {result['errors']:>6} {result['nodes']:>6}")
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        fake.terminate()
+        fake.wait()
+
+if __name__ == "__main__":
+    main()
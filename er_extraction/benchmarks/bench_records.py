@@ -0,0 +1,97 @@
+'''
+Compares the memory held by a schema built from plain dicts against one built from the slotted
+records of kg_records, as the number of companies grows.
+
+Synthetic company fragments, shaped like the ones generate_json_schema produces (countries,
+competitors, suppliers, products, industries), are merged into a SchemaRegistry. The traced memory
+held once all companies are merged, per company and in total, is printed for both layouts, and the
+serialised JSON of both is checked to be identical.
+
+Usage (from the repository root):
+    python er_extraction/benchmarks/bench_records.py [--companies 500 2000 8000]
+'''
+
+import os
+import sys
+import json
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import kg_records
+from schema_registry import SchemaRegistry
+
+COUNTRIES = [("United States", "US", "USA"), ("China", "CN", "CHN"), ("Germany", "DE", "DEU"),
+             ("Japan", "JP", "JPN"), ("India", "IN", "IND"), ("Brazil", "BR", "BRA"), ("Ireland", "IE", "IRL")]
+
+def empty_schema():
+    return {"nodes": {label: [] for label in ["Company", "Country", "Region", "Industry", "Product"]},
+            "relationships": {rel_type: [] for rel_type in ["PARTNERS_WITH", "COMPETES_WITH", "SUBSIDIARY_OF",
+                              "HEADQUARTERS_IN", "OPERATES_IN_COUNTRY", "IS_INVOLVED_IN", "IS_IN",
+                              "OPERATES_IN_REGION", "PRODUCES"]}}
+
+def company_fragment(i, rng):
+    '''
+    One company's nodes and relationships as dicts, in the layout of create_json_schema.
+    '''
+    # names are built at runtime, as they are when parsed from API responses
+    name = "".join(["Company ", str(i)])
+    peers = ["".join(["Company ", str(rng.randrange(i + 50))]) for _ in range(12)]
+    products = ["".join(["Product ", str(rng.randrange(20000))]) for _ in range(8)]
+    countries = rng.sample(COUNTRIES, 4)
+    nodes = {
+        "Company": [{"name": name, "ticker_code": f"T{i}", "founded_year": None}]
+                   + [{"name": peer, "ticker_code": None, "founded_year": None} for peer in peers],
+        "Country": [{"name": c, "iso2": iso2, "iso3": iso3, "population": rng.randint(5, 1400),
+                     "gdp": rng.randint(1, 20000), "corporate_tax_rate": rng.randint(10, 50)}
+                    for c, iso2, iso3 in countries],
+        "Product": [{"name": product} for product in products],
+        "Industry": [{"name": "".join(["industry ", str(i % 40)]), "SIC_code": None, "industry_group": None,
+                      "subindustry_desc": None, "primary_activity": None}],
+    }
+    rels = {
+        "COMPETES_WITH": [{"company_name_1": name, "company_name_2": peer, "type": None,
+                           "company_ticker_1": f"T{i}", "company_ticker_2": None} for peer in peers[:6]],
+        "PARTNERS_WITH": [{"company_name_1": name, "company_name_2": peer, "type": "suppliers",
+                           "company_ticker_1": f"T{i}", "company_ticker_2": None} for peer in peers[6:]],
+        "OPERATES_IN_COUNTRY": [{"company_name": name, "country_name": c, "net sales": rng.randint(-3 * 10 ** 7, 3 * 10 ** 7),
+                                 "headcount": rng.randint(1, 10000), "company_ticker": f"T{i}"} for c, _, _ in countries],
+        "HEADQUARTERS_IN": [{"company_name": name, "country_name": countries[0][0], "company_ticker": f"T{i}"}],
+        "PRODUCES": [{"company_name": name, "product_name": product, "company_ticker": f"T{i}"} for product in products],
+        "IS_INVOLVED_IN": [{"company_name": name, "industry_name": "".join(["industry ", str(i % 40)]),
+                            "company_ticker": f"T{i}"}],
+    }
+    return {"nodes": nodes, "relationships": rels}
+
+def build(companies, use_records):
+    saved = dict(kg_records.RECORD_TYPES)
+    if not use_records:
+        kg_records.RECORD_TYPES.clear()
+    try:
+        rng = random.Random(0)
+        tracemalloc.start()
+        registry = SchemaRegistry(empty_schema())
+        for i in range(companies):
+            registry.merge(company_fragment(i, rng))
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return registry.schema, held, peak
+    finally:
+        kg_records.RECORD_TYPES.update(saved)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, nargs="+", default=[500, 2000, 8000])
+    args = parser.parse_args()
+
+    for companies in args.companies:
+        dict_schema, dict_held, dict_peak = build(companies, use_records=False)
+        record_schema, record_held, record_peak = build(companies, use_records=True)
+        assert json.dumps(dict_schema) == json.dumps(record_schema, default=kg_records.to_json)
+        for label, held, peak in [("dicts", dict_held, dict_peak), ("records", record_held, record_peak)]:
+            print(f"{companies:6} companies {label:>8}: held {held / 1024 ** 2:8.1f} MiB  "
+                  f"peak {peak / 1024 ** 2:8.1f} MiB  per company {held / companies / 1024:6.2f} KiB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+'''
+Compares building a schema with plain list appends (and a Region/IS_IN rebuild after every
+fill_entities call) against building it through SchemaRegistry.
+
+The nodes and relationships of an existing output file are replayed in batches, one batch per
+fill_entities call, and the time, peak traced memory and resulting sizes of both approaches are printed.
+
+Usage (from the repository root):
+    python er_extraction/benchmarks/bench_registry.py [--input output/merged_output.json] [--calls 80]
+'''
+
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from main_A import create_json_schema, create_region_node, create_is_in_rel, new_schema_registry
+import kg_records
+
+def batches(items, n):
+    size = max(1, -(-len(items) // n))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def build_with_lists(data, calls):
+    '''
+    Previous behaviour: append everything, rebuild regions for every country after each call.
+    '''
+    schema = create_json_schema()
+    node_batches = {label: list(batches(nodes, calls)) for label, nodes in data["nodes"].items() if label != "Region"}
+    for i in range(calls):
+        for label, label_batches in node_batches.items():
+            if i < len(label_batches):
+                schema["nodes"][label].extend(label_batches[i])
+        for cnty_node in schema["nodes"]["Country"]:
+            reg_node = create_region_node(cnty_node)
+            schema["nodes"]["Region"].append(reg_node)
+            schema["relationships"]["IS_IN"].append(create_is_in_rel(cnty_node,reg_node))
+    for rel_type, rels in data["relationships"].items():
+        if rel_type != "IS_IN":
+            schema["relationships"][rel_type].extend(rels)
+    return schema
+
+def build_with_registry(data, calls):
+    registry = new_schema_registry()
+    node_batches = {label: list(batches(nodes, calls)) for label, nodes in data["nodes"].items() if label != "Region"}
+    for i in range(calls):
+        for label, label_batches in node_batches.items():
+            if i < len(label_batches):
+                for node in label_batches[i]:
+                    registry.add_node(label, node)
+    for rel_type, rels in data["relationships"].items():
+        if rel_type != "IS_IN":
+            for rel in rels:
+                registry.add_rel(rel_type, rel)
+    return registry.schema
+
+def measure(build, data, calls):
+    # warm-up run so one-off lookup table loading is not timed
+    build(copy.deepcopy(data), calls)
+    data = copy.deepcopy(data)
+    tracemalloc.start()
+    start = time.perf_counter()
+    schema = build(data, calls)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return schema, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", default="output/merged_output.json")
+    parser.add_argument("--calls", type=int, default=80, help="number of fill_entities calls to replay")
+    args = parser.parse_args()
+
+    with open(args.input, 'r') as f:
+        data = json.load(f)
+
+    for label, build in [("lists", build_with_lists), ("registry", build_with_registry)]:
+        schema, elapsed, peak = measure(build, data, args.calls)
+        nodes = sum(len(v) for v in schema["nodes"].values())
+        rels = sum(len(v) for v in schema["relationships"].values())
+        size = len(json.dumps(schema, default=kg_records.to_json))
+        print(f"{label:>8}: {elapsed * 1000:8.1f} ms  peak {peak / 1024:9.1f} KiB  "
+              f"nodes {nodes:6}  relationships {rels:6}  "
+              f"regions {len(schema['nodes']['Region']):6}  json {size / 1024:8.1f} KiB")
+
+if __name__ == "__main__":
+    main()
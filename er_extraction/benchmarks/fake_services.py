@@ -0,0 +1,256 @@
+'''
+Local stand-in for every external service called by main_A.py, for benchmarks and offline runs.
+
+Serves, on one port:
+    POST /v1/                       Diffbot Natural Language API (entities and facts)
+    GET  /wiki/<title>              Wikipedia article pages, with ETag revalidation
+    GET  /search.html?q=<place>     geonames search results
+    GET  /v1/finance/quoteType/     Yahoo Finance quote types (?symbol=A,B,...)
+    GET  /search?q=<query>          Google search results linking to a Yahoo Finance quote page
+
+Diffbot responses are generated from a hash of the posted text, so the same text always gets the
+same response, or replayed in rotation from the JSON files of a directory such as output/cache/diffbot.
+Every request can be delayed and made to fail with a 503 at a given rate.
+
+Point the pipeline at it with ER_SERVICE_URLS="*=http://127.0.0.1:<port>".
+
+Usage (from the repository root):
+    python er_extraction/benchmarks/fake_services.py [--port 8700] [--latency-ms 50] [--jitter-ms 20]
+        [--service-latency diffbot=800,wikipedia=100] [--error-rate 0.01] [--canned output/cache/diffbot]
+'''
+
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import itertools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+# Places the local gazetteer knows, plus a few it does not, so that some lookups reach geonames
+CITIES = ["Cupertino, California", "Austin, Texas", "Seattle", "London", "Tokyo", "Munich", "Toronto",
+          "Shenzhen", "Bangalore", "Sao Paulo", "Dublin", "Singapore", "Mountain View", "Redmond",
+          "Springfield Research Park", "North Harbour Campus"]
+COUNTRIES = ["China", "Germany", "India", "Japan", "Mexico", "Brazil", "Ireland", "Canada", "France", "Israel"]
+INDUSTRIES = ["semiconductor industry", "software industry", "retail industry", "biotechnology industry"]
+# A fixed pool of other companies, so the same names recur across filings as they do in practice
+PEERS = [f"Peer Company {i}" for i in range(200)]
+
+def _parse_service_latency(spec):
+    latency = {}
+    for item in spec.split(","):
+        if "=" in item:
+            service, ms = item.split("=", 1)
+            latency[service.strip()] = float(ms)
+    return latency
+
+def synthetic_nl_response(text, size = 12):
+    '''
+    Description:
+    Generates a Natural Language API response for a text, deterministically from its hash.
+
+    Parameters:
+
+    text (str): Posted content.
+    size (int, optional): Number of peer companies and products mentioned.
+
+    Returns:
+
+    dict: Response with entities and facts.
+
+    '''
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).hexdigest())
+    subject = f"Subject {rng.randrange(10 ** 6)}"
+    peers = rng.sample(PEERS, size)
+    products = [f"Product {rng.randrange(10 ** 4)}" for _ in range(size)]
+    countries = rng.sample(COUNTRIES, 3)
+    city = rng.choice(CITIES)
+    industry = rng.choice(INDUSTRIES)
+
+    def entity(name, types, salience = None):
+        return {"name": name, "salience": rng.uniform(0.3, 1.0) if salience is None else salience,
+                "allTypes": [{"name": t} for t in types]}
+
+    def fact(name, prop, value):
+        return {"entity": {"name": name}, "property": {"name": prop}, "value": {"name": value},
+                "evidence": [{"passage": f"{name} {prop} {value}."}]}
+
+    entities = ([entity(subject, ["organization"], 0.95)]
+                + [entity(peer, ["organization"]) for peer in peers]
+                + [entity(product, ["product"]) for product in products]
+                + [entity(country, ["country", "location"]) for country in countries]
+                + [entity(industry, ["field of work"])])
+    facts = ([fact(subject, "headquarters", city), fact(subject, "industry", industry)]
+             + [fact(subject, "organization locations", country) for country in countries]
+             + [fact(subject, "competitors", peer) for peer in peers[:size // 2]]
+             + [fact(subject, "suppliers", peer) for peer in peers[size // 2:]]
+             + [fact(subject, "product type", product) for product in products])
+    return {"entities": entities, "facts": facts}
+
+def synthetic_ticker(query):
+    digest = hashlib.sha256(query.encode("utf-8")).digest()
+    return "".join(chr(ord("A") + b % 26) for b in digest[:4])
+
+class FakeServices:
+    '''
+    Configuration and counters shared by the request handlers.
+    '''
+    def __init__(self, latency_ms = 0, jitter_ms = 0, service_latency = None, error_rate = 0, canned = None, seed = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.service_latency = service_latency or {}
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.canned = None
+        if canned:
+            paths = sorted(os.path.join(root, name) for root, _, names in os.walk(canned)
+                           for name in names if name.endswith(".json"))
+            responses = []
+            for path in paths:
+                with open(path, 'r', encoding="utf-8") as f:
+                    entry = json.load(f)
+                # entries of the response cache wrap the response with its creation time
+                responses.append(entry["value"] if "created" in entry and "value" in entry else entry)
+            if responses:
+                self.canned = itertools.cycle(responses)
+
+    def delay(self, service):
+        '''
+        Sleeps for the service's latency and returns whether this request should fail.
+        '''
+        with self.lock:
+            self.requests[service] = self.requests.get(service, 0) + 1
+            base = self.service_latency.get(service, self.latency_ms)
+            delay = max(0.0, base + self.rng.uniform(-self.jitter_ms, self.jitter_ms))
+            fail = self.rng.random() < self.error_rate
+        time.sleep(delay / 1000)
+        return fail
+
+    def nl_response(self, text):
+        if self.canned is not None:
+            with self.lock:
+                return next(self.canned)
+        return synthetic_nl_response(text)
+
+def make_handler(services):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body, content_type, headers = None):
+            data = body.encode("utf-8") if isinstance(body, str) else body
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_json(self, status, obj):
+            self.send_body(status, json.dumps(obj), "application/json")
+
+        def fail(self, service):
+            if services.delay(service):
+                self.send_json(503, {"error": f"injected {service} failure"})
+                return True
+            return False
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+            if urlsplit(self.path).path.rstrip("/") != "/v1":
+                return self.send_json(404, {"error": "not found"})
+            if self.fail("diffbot"):
+                return
+            payload = json.loads(body or b"{}")
+            self.send_json(200, services.nl_response(payload.get("content", "")))
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            if url.path.startswith("/wiki/"):
+                if self.fail("wikipedia"):
+                    return
+                title = unquote(url.path[len("/wiki/"):])
+                etag = '"' + hashlib.sha256(title.encode("utf-8")).hexdigest()[:16] + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self.send_body(304, b"", "text/html", {"ETag": etag})
+                text = " ".join(f"{title} competes with {peer} and operates in {country}."
+                                for peer, country in zip(PEERS[:20], itertools.cycle(COUNTRIES)))
+                html = (f'<html><body><h1 id="firstHeading">{title}</h1>'
+                        f'<div id="mw-content-text"><p>{text}</p><p>{title} is headquartered in {CITIES[0]}.</p></div>'
+                        f'</body></html>')
+                return self.send_body(200, html, "text/html", {"ETag": etag})
+            if url.path == "/search.html":
+                if self.fail("geonames"):
+                    return
+                country = COUNTRIES[int(hashlib.sha256(query.get("q", [""])[0].encode("utf-8")).hexdigest(), 16) % len(COUNTRIES)]
+                slug = country.lower().replace(" ", "-")
+                return self.send_body(200, f'<a href="/countries/XX/{slug}.html">{country}</a>', "text/html")
+            if url.path.rstrip("/") == "/v1/finance/quoteType":
+                if self.fail("yahoo"):
+                    return
+                symbols = [s for s in query.get("symbol", [""])[0].split(",") if s]
+                result = [{"symbol": s, "longName": f"{s} Holdings Inc.", "quoteType": "EQUITY"} for s in symbols]
+                return self.send_json(200, {"quoteType": {"result": result, "error": None}})
+            if url.path == "/search":
+                if self.fail("google"):
+                    return
+                ticker = synthetic_ticker(query.get("q", [""])[0])
+                return self.send_body(200, f'<a href="https://finance.yahoo.com/quote/{ticker}/">{ticker}</a>', "text/html")
+            self.send_json(404, {"error": "not found"})
+
+    return Handler
+
+def serve(port = 0, **options):
+    '''
+    Description:
+    Starts the fake services in a background thread.
+
+    Parameters:
+
+    port (int, optional): Port to listen on. 0 picks a free one.
+    options (optional): latency_ms, jitter_ms, service_latency, error_rate, canned and seed, see FakeServices.
+
+    Returns:
+
+    tuple: (server, services). server.server_address holds the bound address; call server.shutdown() to stop.
+
+    '''
+    services = FakeServices(**options)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(services))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, services
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--service-latency", default="", help="per-service latency, e.g. diffbot=800,wikipedia=100")
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--canned", default=None, help="directory of Diffbot responses to replay, e.g. output/cache/diffbot")
+    args = parser.parse_args()
+
+    server, _ = serve(args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                      service_latency=_parse_service_latency(args.service_latency),
+                      error_rate=args.error_rate, canned=args.canned)
+    host, port = server.server_address
+    print(f"Fake services listening on http://{host}:{port}")
+    print(f'Use ER_SERVICE_URLS="*=http://{host}:{port}"')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+'''
+Checkpointed, resumable output for ER extraction.
+
+Each finished company is appended to an NDJSON stream as one line:
+    {"ticker": ..., "name": ..., "schema": {"nodes": {...}, "relationships": {...}}}
+and its ticker is then recorded in a progress manifest next to the stream. A rerun skips every
+ticker in the manifest, and merge_shards.merge builds the usual JSON schema from the stream.
+'''
+
+import os
+import json
+import threading
+import kg_records
+
+_write_lock = threading.Lock()
+
+def stream_paths(output_file):
+    '''
+    Description:
+    Derives the stream and manifest paths that belong to a JSON schema output file.
+
+    Parameters:
+
+    output_file (str): Path of the JSON schema, e.g. output/nasdaq_kg_schema.json.
+
+    Returns:
+
+    tuple: (stream_path, manifest_path), e.g. output/nasdaq_kg_schema.ndjson and output/nasdaq_kg_schema.progress.
+
+    '''
+    base, _ = os.path.splitext(output_file)
+    return (f"{base}.ndjson", f"{base}.progress")
+
+def completed_tickers(manifest_path):
+    '''
+    Description:
+    Reads the set of tickers that have already been written to the stream.
+
+    Parameters:
+
+    manifest_path (str): Path of the progress manifest.
+
+    Returns:
+
+    set: Tickers whose output is complete. Empty if there is no manifest yet.
+
+    '''
+    if not os.path.exists(manifest_path):
+        return set()
+    with open(manifest_path, 'r', encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+def append_company(stream_path, manifest_path, ticker, name, schema):
+    '''
+    Description:
+    Appends one company's nodes and relationships to the stream, then marks the ticker as complete.
+    The record is flushed to disk before the manifest is updated, so a ticker is never marked
+    complete without its output.
+
+    Parameters:
+
+    stream_path (str): Path of the NDJSON stream.
+    manifest_path (str): Path of the progress manifest.
+    ticker (str): Ticker of the company.
+    name (str): Name of the company.
+    schema (dict): The company's nodes and relationships, in the layout of create_json_schema.
+
+    '''
+    record = json.dumps({"ticker": ticker, "name": name, "schema": schema}, ensure_ascii=False, default=kg_records.to_json)
+    with _write_lock:
+        with open(stream_path, 'a', encoding="utf-8") as f:
+            f.write(record + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        with open(manifest_path, 'a', encoding="utf-8") as f:
+            f.write(ticker + "\n")
@@ -0,0 +1,139 @@
+'''
+Sentence-aware chunking of long documents for the Natural Language API, and merging of the
+per-chunk responses back into a single response.
+
+CHUNK_SIZE is the maximum number of characters per chunk and CHUNK_OVERLAP the number of
+characters of trailing sentences repeated at the start of the next chunk, so that facts spanning
+a chunk boundary are still seen whole. Setting ER_CHUNK_SIZE to 0 disables chunking.
+'''
+
+import os
+import re
+
+CHUNK_SIZE = int(os.getenv("ER_CHUNK_SIZE", 20000))
+CHUNK_OVERLAP = int(os.getenv("ER_CHUNK_OVERLAP", 500))
+
+# Sentence ends followed by whitespace, or glued to the next sentence after newlines were stripped
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|(?<=[a-z0-9)][.!?])(?=[A-Z])')
+
+def split_sentences(text):
+    '''
+    Description:
+    Splits text into sentences on terminal punctuation.
+
+    Parameters:
+
+    text (str): Text to split.
+
+    Returns:
+
+    list: Non-empty sentences, in order.
+
+    '''
+    return [sentence for sentence in _SENTENCE_END.split(text) if sentence and not sentence.isspace()]
+
+def chunk_text(text, size = None, overlap = None):
+    '''
+    Description:
+    Packs whole sentences into chunks of at most size characters. The last sentences of each chunk,
+    up to overlap characters, are repeated at the start of the next one. Sentences longer than size are
+    split at the size boundary.
+
+    Parameters:
+
+    text (str): Text to chunk.
+    size (int, optional): Maximum characters per chunk. Defaults to CHUNK_SIZE.
+    overlap (int, optional): Characters of overlap between consecutive chunks. Defaults to CHUNK_OVERLAP.
+
+    Returns:
+
+    list: Chunks of text. A text shorter than size, or size 0, gives a single chunk.
+
+    '''
+    size = CHUNK_SIZE if size is None else size
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    if size <= 0 or len(text) <= size:
+        return [text]
+
+    sentences = []
+    for sentence in split_sentences(text):
+        while len(sentence) > size:
+            sentences.append(sentence[:size])
+            sentence = sentence[size:]
+        sentences.append(sentence)
+
+    chunks = []
+    current, current_len = [], 0
+    for sentence in sentences:
+        if current and current_len + len(sentence) + 1 > size:
+            chunks.append(" ".join(current))
+            carried, carried_len = [], 0
+            for previous in reversed(current):
+                if carried_len + len(previous) + 1 > overlap or carried_len + len(previous) + len(sentence) + 2 > size:
+                    break
+                carried.insert(0, previous)
+                carried_len += len(previous) + 1
+            current, current_len = carried, carried_len
+        current.append(sentence)
+        current_len += len(sentence) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+def _fact_key(fact):
+    return (fact["entity"]["name"], fact["property"]["name"], fact["value"]["name"])
+
+def chunk_response(future):
+    '''
+    Returns the response of a chunk's future, or an error response in place of the exception it raised,
+    so that one failed chunk does not discard the rest of the document. See merge_responses.
+    '''
+    try:
+        return future.result()
+    except Exception as error:
+        return {"error": repr(error)}
+
+def merge_responses(responses):
+    '''
+    Description:
+    Merges the API responses of the chunks of one document. Entities with the same name are collapsed
+    into one, keeping the highest salience and the union of their types. Facts are deduplicated on
+    (entity, property, value).
+
+    Parameters:
+
+    responses (list): Responses of each chunk, in order. A failed chunk is any response without entities
+    and facts, such as the error response of chunk_response.
+
+    Returns:
+
+    dict: A single response with entities and facts. If no chunk succeeded, the first response is returned
+    unchanged so the caller can report the error.
+
+    '''
+    succeeded = [res for res in responses if isinstance(res, dict) and "entities" in res and "facts" in res]
+    if not succeeded:
+        return responses[0] if responses else None
+    if len(succeeded) < len(responses):
+        print(f"{len(responses) - len(succeeded)} of {len(responses)} chunks failed, merging the rest")
+    if len(succeeded) == 1:
+        return succeeded[0]
+
+    entities = {}
+    for res in succeeded:
+        for ent in res["entities"]:
+            stored = entities.get(ent["name"])
+            if stored is None:
+                entities[ent["name"]] = dict(ent, allTypes=list(ent.get("allTypes") or []))
+                continue
+            stored["salience"] = max(stored["salience"], ent["salience"])
+            seen_types = {ent_type["name"] for ent_type in stored["allTypes"]}
+            stored["allTypes"].extend(ent_type for ent_type in ent.get("allTypes") or []
+                                      if ent_type["name"] not in seen_types)
+
+    facts = {}
+    for res in succeeded:
+        for fact in res["facts"]:
+            facts.setdefault(_fact_key(fact), fact)
+
+    return {"entities": list(entities.values()), "facts": list(facts.values())}
@@ -0,0 +1,90 @@
+'''
+Bounded concurrency and per-host rate limiting for the ER extraction pipeline.
+
+MAX_WORKERS bounds how many companies are extracted at once. Every outbound HTTP call goes
+through throttle(host), which blocks on a token bucket for that host so that concurrent
+workers stay within each service's rate limit.
+
+Rates are configured with ER_RATE_LIMITS as a comma separated list of host=requests_per_second,
+e.g. "nl.diffbot.com=2,en.wikipedia.org=10". Hosts without an entry use DEFAULT_RATE.
+When ER_PROCESS_COUNT extraction processes run side by side, each gets an equal share of every rate.
+'''
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.getenv("ER_EXTRACTION_WORKERS", 8))
+DEFAULT_RATE = float(os.getenv("ER_DEFAULT_RATE", 5))
+PROCESS_COUNT = max(1, int(os.getenv("ER_PROCESS_COUNT", 1)))
+
+def _parse_rate_limits(spec):
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            host, rate = item.split("=", 1)
+            rates[host.strip()] = float(rate)
+    return rates
+
+RATE_LIMITS = {
+    "nl.diffbot.com": 2,
+    "www.google.com": 0.5,
+    "www.geonames.org": 2,
+    "en.wikipedia.org": 10,
+    "finance.yahoo.com": 5,
+}
+RATE_LIMITS.update(_parse_rate_limits(os.getenv("ER_RATE_LIMITS", "")))
+
+class TokenBucket:
+    '''
+    Thread-safe token bucket allowing `rate` acquisitions per second with bursts of up to `capacity`.
+    '''
+    def __init__(self, rate, capacity = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Blocks until a token is available, then consumes it.
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+def throttle(host):
+    '''
+    Description:
+    Waits until a request to the given host is allowed by its rate limit.
+
+    Parameters:
+
+    host (str): Host name the request is sent to.
+
+    '''
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            rate = RATE_LIMITS.get(host, DEFAULT_RATE)
+            if rate <= 0:
+                return
+            bucket = _buckets[host] = TokenBucket(rate / PROCESS_COUNT)
+    bucket.acquire()
+
+# Individual requests (Item 1, Item 7, Wikipedia) are submitted here by company workers.
+# It is kept separate from the company pool so that a company worker waiting on its
+# requests can never starve the pool that runs them.
+REQUEST_POOL = ThreadPoolExecutor(max_workers=MAX_WORKERS * 3, thread_name_prefix="er-request")
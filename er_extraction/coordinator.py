@@ -0,0 +1,141 @@
+'''
+Runs ER extraction over the whole `companies` table in several worker processes.
+
+The companies, in the (name, stock_symbol) order used by ecm_store.iter_companies, are split into
+contiguous ranges of equal size, one per process. Each worker runs generate_json_schema over its
+range and writes its own checkpoint stream, output/<base>_shard_<i>_of_<n>.ndjson, with its own
+progress manifest, so a rerun with the same number of processes resumes every shard, and its own
+run report, output/<base>_shard_<i>_of_<n>.report.json.
+Once all workers have exited, the shards are merged in ticker order into one deduplicated schema.
+
+The per-host rate limits are split evenly between the processes (see concurrency.PROCESS_COUNT).
+
+Usage (from the directory containing data/ and output/):
+    python coordinator.py [--processes 4] [--limit N] [--output merged_output.json]
+'''
+
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import ecm_store
+import main_A
+import instrumentation
+import merge_shards
+
+def shard_ranges(keys, processes):
+    '''
+    Description:
+    Splits ordered company keys into contiguous ranges of nearly equal size.
+
+    Parameters:
+
+    keys (list): (name, stock_symbol) of every company, in iteration order.
+    processes (int): Number of ranges.
+
+    Returns:
+
+    list: (start_after, until) of each non-empty range, as taken by generate_json_schema: the key before the
+    range, or None for the first one, and the last key of the range.
+
+    '''
+    ranges = []
+    size, extra = divmod(len(keys), processes)
+    offset = 0
+    for i in range(processes):
+        count = size + (1 if i < extra else 0)
+        if count == 0:
+            continue
+        start_after = tuple(keys[offset - 1]) if offset > 0 else None
+        ranges.append((start_after, tuple(keys[offset + count - 1])))
+        offset += count
+    return ranges
+
+def shard_stream_path(output_file, index, processes):
+    base, _ = os.path.splitext(output_file)
+    return f"{base}_shard_{index}_of_{processes}.ndjson"
+
+def run_shard(index, start_after, until, stream_path, max_workers = None):
+    '''
+    Description:
+    Extracts one range of companies into its own stream. Runs in a worker process.
+
+    Parameters:
+
+    index (int): Shard number.
+    start_after (tuple): (name, stock_symbol) of the company before the range, or None for the first range.
+    until (tuple): (name, stock_symbol) of the last company of the range.
+    stream_path (str): Path of the shard's NDJSON stream.
+    max_workers (int, optional): Companies extracted at once in this process.
+
+    Returns:
+
+    tuple: (index, error), where error is None if the whole range was extracted.
+
+    '''
+    try:
+        main_A.generate_json_schema(main_A.create_json_schema(), start_after = start_after, until = until,
+                                    max_workers = max_workers, stream_path = stream_path)
+        return (index, None)
+    except Exception as error:
+        return (index, repr(error))
+    finally:
+        instrumentation.write_report(instrumentation.report_path(stream_path), shard = index, stream = stream_path)
+        ecm_store.close()
+
+def run(processes, output_file, limit = None, max_workers = None):
+    '''
+    Description:
+    Extracts the companies in parallel worker processes and merges their shards into output_file.
+
+    Parameters:
+
+    processes (int): Number of worker processes.
+    output_file (str): Path of the merged JSON schema.
+    limit (int, optional): Only extract the first limit companies. Defaults to all of them.
+    max_workers (int, optional): Companies extracted at once in each process.
+
+    Returns:
+
+    dict: Merge statistics, see merge_shards.merge.
+
+    '''
+    keys = ecm_store.company_keys()[:limit]
+    ecm_store.close()
+    ranges = shard_ranges(keys, processes)
+    stream_paths = [shard_stream_path(output_file, i, processes) for i in range(len(ranges))]
+    print(f"Extracting {len(keys)} companies in {len(ranges)} processes")
+
+    # Workers are spawned, not forked, so they do not inherit this process's threads and connections,
+    # and they read ER_PROCESS_COUNT when importing concurrency
+    os.environ["ER_PROCESS_COUNT"] = str(len(ranges))
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, len(ranges)), mp_context=context) as pool:
+        futures = [pool.submit(run_shard, i, start_after, until, stream_paths[i], max_workers)
+                   for i, (start_after, until) in enumerate(ranges)]
+        for future in as_completed(futures):
+            index, error = future.result()
+            if error is None:
+                print(f"Shard {index} finished: {stream_paths[index]}")
+            else:
+                print(f"Shard {index} stopped early, rerun to resume: {error}")
+
+    stats = merge_shards.merge(stream_paths, output_file, indent = None)
+    print(f"Merged {len(stream_paths)} shards into {output_file}")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=int(os.getenv("ER_PROCESSES", os.cpu_count() or 1)))
+    parser.add_argument("--limit", type=int, default=None, help="only extract the first N companies")
+    parser.add_argument("--workers", type=int, default=None, help="companies extracted at once per process")
+    parser.add_argument("--output", default=os.getenv("ER_EXTRACTION_OUTPUT", "merged_output.json"),
+                        help="merged schema file name, written to output/")
+    args = parser.parse_args()
+
+    if not os.path.exists('output'):
+        os.makedirs('output')
+    run(max(1, args.processes), f"output/{args.output}", limit = args.limit, max_workers = args.workers)
+
+if __name__ == "__main__":
+    main()
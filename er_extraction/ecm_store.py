@@ -0,0 +1,145 @@
+'''
+Read-only data access to the `companies` table of data/ecmdatabase.db.
+
+A single long-lived read-only connection is shared by the whole process. Queries are fixed,
+parameterised statements, so sqlite compiles each of them once and reuses it from its statement cache.
+
+There is no index on (name, stock_symbol), and the read-only connection cannot create one, so any
+query ordered on it scans and sorts the whole table. iter_companies therefore runs that query once,
+over the keys and rowids only, and then fetches the filings of each batch by rowid, so the large
+item1/item7 texts are never sorted and each batch costs only primary-key lookups.
+'''
+
+import bisect
+import sqlite3
+import threading
+
+DB_PATH = 'data/ecmdatabase.db'
+
+SELECT_COMPANY = '''
+SELECT name, stock_symbol, item1, item7
+FROM companies
+WHERE stock_symbol = ?'''
+
+SELECT_COMPANY_BY_ROWID = '''
+SELECT name, stock_symbol, item1, item7
+FROM companies
+WHERE rowid = ?'''
+
+SELECT_COMPANY_ROWIDS = '''
+SELECT name, stock_symbol, rowid
+FROM companies
+ORDER BY name, stock_symbol'''
+
+SELECT_COMPANY_KEYS = '''
+SELECT name, stock_symbol
+FROM companies
+ORDER BY name, stock_symbol'''
+
+_connection = None
+_lock = threading.Lock()
+
+def get_connection():
+    '''
+    Description:
+    Returns the process-wide read-only connection, opening it on first use.
+
+    Returns:
+
+    sqlite3.Connection: Connection to DB_PATH, shared between threads. Use it while holding the store's lock.
+
+    '''
+    global _connection
+    if _connection is None:
+        with _lock:
+            if _connection is None:
+                _connection = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False)
+    return _connection
+
+def close():
+    '''
+    Closes the shared connection. A later call reopens it.
+    '''
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+
+def get_company(ticker):
+    '''
+    Description:
+    Fetches one company by ticker.
+
+    Parameters:
+
+    ticker (str): Company ticker symbol.
+
+    Returns:
+
+    tuple: (name, stock_symbol, item1, item7), or None if the ticker is not in the database.
+
+    '''
+    con = get_connection()
+    with _lock:
+        return con.execute(SELECT_COMPANY, (ticker,)).fetchone()
+
+def iter_companies(start_after = None, limit = None, batch_size = 50, until = None, skip = None):
+    '''
+    Description:
+    Streams companies ordered by (name, stock_symbol). The keys of all companies are read in one query,
+    then the rows are fetched by rowid, batch_size at a time.
+
+    Parameters:
+
+    start_after (tuple, optional): (name, stock_symbol) of the last company already processed. Iteration starts after it.
+    limit (int, optional): Maximum number of companies to yield. Defaults to all of them.
+    batch_size (int, optional): Number of rows fetched while holding the store's lock.
+    until (tuple, optional): (name, stock_symbol) of the last company to yield. Defaults to the last one in the table.
+    skip (callable, optional): Called with each stock_symbol. Companies it returns True for are passed over
+    without being read, and do not count towards limit.
+
+    Returns:
+
+    generator: Tuples of (name, stock_symbol, item1, item7).
+
+    '''
+    con = get_connection()
+    with _lock:
+        keys = con.execute(SELECT_COMPANY_ROWIDS).fetchall()
+    start, end = 0, len(keys)
+    if start_after is not None:
+        start = bisect.bisect_right(keys, tuple(start_after), key=lambda key: key[:2])
+    if until is not None:
+        end = bisect.bisect_right(keys, tuple(until), key=lambda key: key[:2])
+    remaining = limit
+    i = start
+    while i < end and (remaining is None or remaining > 0):
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        rowids = []
+        while i < end and len(rowids) < size:
+            _, stock_symbol, rowid = keys[i]
+            i += 1
+            if skip is None or not skip(stock_symbol):
+                rowids.append(rowid)
+        with _lock:
+            rows = [con.execute(SELECT_COMPANY_BY_ROWID, (rowid,)).fetchone() for rowid in rowids]
+        for row in rows:
+            if row is not None:
+                yield row
+        if remaining is not None:
+            remaining -= len(rowids)
+
+def company_keys():
+    '''
+    Description:
+    Lists the keys of every company, in the order iter_companies streams them.
+
+    Returns:
+
+    list: Tuples of (name, stock_symbol).
+
+    '''
+    con = get_connection()
+    with _lock:
+        return con.execute(SELECT_COMPANY_KEYS).fetchall()
@@ -0,0 +1,184 @@
+'''
+Local city/alias to country resolution.
+
+Builds an in-memory index once from data/country_aliases.csv and the bundled city table
+data/world_cities.csv (GeoNames cities with a population of at least 15,000, plus US states).
+Country names are returned in the pycountry_convert spelling, so they map straight back to
+ISO codes in create_country_node.
+
+Only unambiguous names are resolved locally. Continents and world regions ("Asia", "EMEA") are
+not countries and resolve to "Not Found", even where a small town shares their name. A name
+used by places in several countries resolves locally only if its largest place dwarfs the others,
+as for London; otherwise ("Santa Clara") it is left to Geonames. OVERRIDES holds curated answers
+for names the tables get wrong, such as "Korea" or "England".
+'''
+
+import re
+import threading
+import unicodedata
+import pandas as pd
+import pycountry_convert as pc
+
+ALIASES_PATH = 'data/country_aliases.csv'
+CITIES_PATH = 'data/world_cities.csv'
+
+NOT_FOUND = "Not Found"
+
+# Continents and world regions, normalised. They are never a single country
+REGION_NAMES = {
+    "africa", "north africa", "sub saharan africa", "west africa", "east africa", "southern africa",
+    "america", "americas", "north america", "south america", "latin america", "central america", "caribbean",
+    "asia", "east asia", "south asia", "southeast asia", "south east asia", "central asia", "asia pacific", "apac",
+    "europe", "western europe", "eastern europe", "central europe", "northern europe", "southern europe",
+    "scandinavia", "nordics", "nordic countries", "emea", "middle east", "oceania", "australasia", "pacific",
+    "antarctica", "worldwide", "international",
+}
+
+# Curated answers (normalised name -> ISO alpha-2) for names the tables leave ambiguous or get wrong
+OVERRIDES = {
+    "korea": "KR", "south korea": "KR", "republic of korea": "KR",
+    "england": "GB", "scotland": "GB", "wales": "GB", "northern ireland": "GB", "great britain": "GB",
+    "britain": "GB", "uk": "GB", "u k": "GB",
+    "us": "US", "u s": "US", "usa": "US", "u s a": "US", "united states of america": "US",
+    "holland": "NL", "taiwan": "TW", "russia": "RU", "vietnam": "VN",
+}
+
+# A place name shared by several countries is resolved locally only if its most populous place is
+# at least this many times more populous than the most populous one in any other country
+DOMINANCE = 10
+
+_countries = None
+_places = None
+_index_lock = threading.Lock()
+
+def normalize_place_name(name):
+    '''
+    Description:
+    Normalises a place name for matching by folding accents, case and punctuation.
+
+    Parameters:
+
+    name (str): Place name.
+
+    Returns:
+
+    str: Normalised name, e.g. "São Paulo" -> "sao paulo".
+
+    '''
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", name.lower()).split())
+
+def _country_name(alpha2):
+    try:
+        return pc.country_alpha2_to_country_name(alpha2)
+    except KeyError:
+        return None
+
+def _load_index():
+    global _countries, _places
+    alpha3_to_alpha2 = pc.map_country_alpha3_to_country_alpha2()
+
+    countries = {}
+    for alpha2 in pc.map_country_alpha2_to_country_name():
+        name = _country_name(alpha2)
+        if name:
+            countries[normalize_place_name(name)] = name
+    try:
+        aliases = pd.read_csv(ALIASES_PATH, usecols=['iso3', 'Alias'], dtype=str, keep_default_na=False)
+        alias_countries = {}
+        for iso3, alias_field in zip(aliases['iso3'], aliases['Alias']):
+            name = _country_name(alpha3_to_alpha2.get(iso3))
+            if name is None:
+                continue
+            for alias in alias_field.split(' or '):
+                alias_countries.setdefault(normalize_place_name(alias), set()).add(name)
+        # an alias of more than one country is left out, unless OVERRIDES settles it
+        for key, names in alias_countries.items():
+            if len(names) == 1 and key not in countries:
+                countries[key] = names.pop()
+    except FileNotFoundError:
+        print(f"Gazetteer: {ALIASES_PATH} not found, using country names only")
+    for key, alpha2 in OVERRIDES.items():
+        countries[key] = _country_name(alpha2)
+    for key in REGION_NAMES:
+        countries.pop(key, None)
+
+    places = {}
+    try:
+        cities = pd.read_csv(CITIES_PATH, dtype={'population': 'float'}, keep_default_na=False, na_values=[''])
+        # states have no population and rank above cities
+        cities['population'] = cities['population'].fillna(float('inf'))
+        largest = {}
+        for name, alpha2, population in zip(cities['name'], cities['country_code'], cities['population']):
+            key = normalize_place_name(name)
+            if key in REGION_NAMES:
+                continue
+            by_country = largest.setdefault(key, {})
+            by_country[alpha2] = max(population, by_country.get(alpha2, 0))
+        for key, by_country in largest.items():
+            ranked = sorted(by_country.items(), key=lambda item: item[1], reverse=True)
+            if len(ranked) > 1 and ranked[0][1] < DOMINANCE * ranked[1][1]:
+                continue
+            country = _country_name(ranked[0][0])
+            if country:
+                places[key] = country
+    except FileNotFoundError:
+        print(f"Gazetteer: {CITIES_PATH} not found, using country aliases only")
+
+    _countries, _places = countries, places
+
+def _ensure_index():
+    if _countries is None:
+        with _index_lock:
+            if _countries is None:
+                _load_index()
+
+def lookup_country(place):
+    '''
+    Description:
+    Resolves a city, state, country or country alias to a country name using the local index.
+    Comma separated locations such as "Cupertino, California" are resolved from the most
+    general part backwards.
+
+    Parameters:
+
+    place (str): Location name.
+
+    Returns:
+
+    str: Country name if found, NOT_FOUND for a continent or world region, otherwise None,
+    e.g. for unknown or ambiguous names.
+
+    '''
+    _ensure_index()
+    if place is None:
+        return None
+    parts = [normalize_place_name(place)]
+    if "," in str(place):
+        parts += [normalize_place_name(p) for p in reversed(str(place).split(","))]
+    for part in parts:
+        if part in _countries:
+            return _countries[part]
+    for part in parts:
+        if part in _places:
+            return _places[part]
+    if any(part in REGION_NAMES for part in parts):
+        return NOT_FOUND
+    return None
+
+def is_country(place):
+    '''
+    Description:
+    Checks whether a place name is a country name or country alias, rather than a city or state.
+
+    Parameters:
+
+    place (str): Location name.
+
+    Returns:
+
+    bool: True if the name is in the country index.
+
+    '''
+    _ensure_index()
+    return place is not None and normalize_place_name(place) in _countries
@@ -0,0 +1,149 @@
+'''
+Shared HTTP clients for the ER extraction pipeline.
+
+get_session returns one process-wide requests.Session whose connection pool is sized for the
+worker pools, so connections to each host are kept alive and reused. Transient failures
+(connection errors, 429 and 5xx responses) are retried with exponential backoff; when the retries
+run out the last error response is returned to the caller, as it would be without retries.
+
+get_yahoo_ticker returns a yahooquery Ticker kept per thread. Creating a Ticker opens a new
+session and fetches a crumb, so it is only done once per thread instead of once per lookup.
+
+SERVICE_URLS holds the base URL of every external service. ER_SERVICE_URLS overrides them as a comma
+separated list of service=url, e.g. "diffbot=http://127.0.0.1:8700,wikipedia=http://127.0.0.1:8700",
+or "*=http://127.0.0.1:8700" for all of them, to point the pipeline at benchmarks/fake_services.py.
+Yahoo Finance and Google are reached through yahooquery and googlesearch unless overridden.
+'''
+
+import os
+import re
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from yahooquery import Ticker
+from googlesearch import search
+import concurrency
+
+POOL_SIZE = concurrency.MAX_WORKERS * 3
+RETRIES = Retry(
+    total=3,
+    backoff_factor=0.5,
+    status_forcelist=[429, 500, 502, 503, 504],
+    allowed_methods=["GET", "POST"],
+    respect_retry_after_header=True,
+    # once retries run out, hand back the last 429/5xx response, as without retries, instead of raising RetryError
+    raise_on_status=False,
+)
+
+def _parse_service_urls(spec):
+    urls = {}
+    for item in spec.split(","):
+        if "=" in item:
+            service, url = item.split("=", 1)
+            urls[service.strip()] = url.strip().rstrip("/")
+    return urls
+
+SERVICE_URLS = {
+    "diffbot": "https://nl.diffbot.com",
+    "wikipedia": "https://en.wikipedia.org",
+    "geonames": "https://www.geonames.org",
+    # None uses the endpoints built into yahooquery and googlesearch
+    "yahoo": None,
+    "google": None,
+}
+_overrides = _parse_service_urls(os.getenv("ER_SERVICE_URLS", ""))
+if "*" in _overrides:
+    SERVICE_URLS = dict.fromkeys(SERVICE_URLS, _overrides.pop("*"))
+SERVICE_URLS.update(_overrides)
+
+_LINK = re.compile(r'<a[^>]+href="(https?://[^"]+)"')
+
+_session = None
+_session_lock = threading.Lock()
+_local = threading.local()
+
+def get_session():
+    '''
+    Description:
+    Returns the process-wide pooled HTTP session, creating it on first use.
+
+    Returns:
+
+    requests.Session: Session with keep-alive connection pools and retries for http and https.
+
+    '''
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=RETRIES)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+def get_yahoo_ticker(symbols):
+    '''
+    Description:
+    Returns this thread's yahooquery Ticker, pointed at the given symbols.
+
+    Parameters:
+
+    symbols (str or list): Ticker symbol(s) to query.
+
+    Returns:
+
+    yahooquery.Ticker: Ticker reusing this thread's Yahoo session and crumb.
+
+    '''
+    ticker = getattr(_local, "yahoo_ticker", None)
+    if ticker is None:
+        ticker = _local.yahoo_ticker = Ticker(symbols)
+    else:
+        ticker.symbols = symbols
+    return ticker
+
+def get_quote_types(symbols):
+    '''
+    Description:
+    Fetches the Yahoo Finance quote type (including longName) of many symbols in one request.
+
+    Parameters:
+
+    symbols (list): Ticker symbols.
+
+    Returns:
+
+    dict: Quote type of each symbol, as returned by yahooquery's Ticker.quote_type.
+
+    '''
+    base = SERVICE_URLS["yahoo"]
+    if base is None:
+        return get_yahoo_ticker(symbols).quote_type
+    response = get_session().get(f"{base}/v1/finance/quoteType/", params={"symbol": ",".join(symbols)})
+    response.raise_for_status()
+    return {quote["symbol"]: quote for quote in response.json()["quoteType"]["result"]}
+
+def search_links(query, stop = 1):
+    '''
+    Description:
+    Runs a Google search and returns the first result links.
+
+    Parameters:
+
+    query (str): Search query.
+    stop (int, optional): Number of links to return.
+
+    Returns:
+
+    list: Result URLs, in ranking order.
+
+    '''
+    base = SERVICE_URLS["google"]
+    if base is None:
+        return list(search(query, stop = stop))
+    response = get_session().get(f"{base}/search", params={"q": query})
+    response.raise_for_status()
+    return _LINK.findall(response.text)[:stop]
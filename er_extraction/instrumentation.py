@@ -0,0 +1,215 @@
+'''
+Lightweight per-stage timing and counters for the ER extraction pipeline.
+
+Each stage (an API call, a lookup, a fill function) is recorded under a name with @timed(stage)
+or `with span(stage):`. For every stage the number of calls and errors, the total time and a
+latency histogram are kept, plus the bytes sent and received for stages that talk to a service.
+write_report saves these, with percentiles estimated from the histogram and the hit rates of
+the response cache, as a JSON run report.
+
+Recording costs a clock read and a lock per span, so it is always on. With ER_TIMING_SAMPLES=1
+every duration is kept as well and the percentiles are exact, e.g. for benchmarks.
+'''
+
+import os
+import time
+import json
+import bisect
+import threading
+import functools
+from contextlib import contextmanager
+import response_cache
+
+# Upper bounds of the latency histogram buckets, in milliseconds; the last bucket is unbounded
+BUCKET_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+CACHE_NAMESPACES = ["diffbot", "geonames", "wikipedia", "yahoo"]
+KEEP_SAMPLES = os.getenv("ER_TIMING_SAMPLES", "0") == "1"
+
+_stages = {}
+_samples = {}
+_lock = threading.Lock()
+_started = time.time()
+
+def _new_stage():
+    return {"calls": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0,
+            "bytes_sent": 0, "bytes_received": 0, "histogram": [0] * (len(BUCKET_BOUNDS_MS) + 1)}
+
+def record(stage, elapsed, error = False):
+    '''
+    Description:
+    Records one call of a stage.
+
+    Parameters:
+
+    stage (str): Stage name.
+    elapsed (float): Duration of the call in seconds.
+    error (bool, optional): Whether the call raised.
+
+    '''
+    bucket = bisect.bisect_left(BUCKET_BOUNDS_MS, elapsed * 1000)
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = _new_stage()
+        stats["calls"] += 1
+        stats["errors"] += error
+        stats["total_s"] += elapsed
+        stats["max_s"] = max(stats["max_s"], elapsed)
+        stats["histogram"][bucket] += 1
+        if KEEP_SAMPLES:
+            _samples.setdefault(stage, []).append(elapsed)
+
+def add_bytes(stage, sent = 0, received = 0):
+    '''
+    Description:
+    Adds to the bytes sent and received by a stage.
+
+    Parameters:
+
+    stage (str): Stage name.
+    sent (int, optional): Bytes sent.
+    received (int, optional): Bytes received.
+
+    '''
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = _new_stage()
+        stats["bytes_sent"] += sent
+        stats["bytes_received"] += received
+
+@contextmanager
+def span(stage):
+    '''
+    Description:
+    Times the enclosed block as one call of a stage. An exception counts as an error and is re-raised.
+
+    Parameters:
+
+    stage (str): Stage name.
+
+    '''
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(stage, time.perf_counter() - start, error)
+
+def timed(stage):
+    '''
+    Description:
+    Decorator timing every call of a function as one call of a stage.
+
+    Parameters:
+
+    stage (str): Stage name.
+
+    Returns:
+
+    function: Decorator.
+
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _percentile(histogram, calls, q):
+    # upper bound of the bucket holding the q-th call; calls in the last bucket report the largest bound
+    rank = q * calls
+    seen = 0
+    for bound, count in zip(BUCKET_BOUNDS_MS, histogram):
+        seen += count
+        if seen >= rank:
+            return bound
+    return BUCKET_BOUNDS_MS[-1]
+
+def _exact_percentile(samples, q):
+    # nearest-rank percentile of sorted samples, in milliseconds
+    rank = max(0, min(len(samples) - 1, int(-(-q * len(samples) // 1)) - 1))
+    return round(samples[rank] * 1000, 2)
+
+def snapshot():
+    '''
+    Description:
+    Summarises the stages recorded so far.
+
+    Returns:
+
+    dict: Per stage: calls, errors, total_s, mean_ms, max_ms, p50_ms, p90_ms, p99_ms, bytes_sent,
+    bytes_received and the histogram as {"<=bound ms": count}. Percentiles are the upper bound of
+    their histogram bucket unless samples are kept.
+
+    '''
+    with _lock:
+        stages = {stage: dict(stats, histogram=list(stats["histogram"])) for stage, stats in _stages.items()}
+        samples = {stage: sorted(durations) for stage, durations in _samples.items()}
+
+    summary = {}
+    for stage, stats in sorted(stages.items()):
+        calls = stats["calls"]
+        labels = [f"<={bound}ms" for bound in BUCKET_BOUNDS_MS] + [f">{BUCKET_BOUNDS_MS[-1]}ms"]
+        summary[stage] = {
+            "calls": calls,
+            "errors": stats["errors"],
+            "total_s": round(stats["total_s"], 3),
+            "mean_ms": round(stats["total_s"] * 1000 / calls, 2) if calls else 0.0,
+            "max_ms": round(stats["max_s"] * 1000, 2),
+            "p50_ms": _percentile(stats["histogram"], calls, 0.5) if calls else 0,
+            "p90_ms": _percentile(stats["histogram"], calls, 0.9) if calls else 0,
+            "p99_ms": _percentile(stats["histogram"], calls, 0.99) if calls else 0,
+            "bytes_sent": stats["bytes_sent"],
+            "bytes_received": stats["bytes_received"],
+            "histogram": {label: count for label, count in zip(labels, stats["histogram"]) if count},
+        }
+        if samples.get(stage):
+            for q in (50, 90, 99):
+                summary[stage][f"p{q}_ms"] = _exact_percentile(samples[stage], q / 100)
+    return summary
+
+def write_report(path, **extra):
+    '''
+    Description:
+    Writes the run report: wall time, the stage summaries and the response cache hit rates.
+
+    Parameters:
+
+    path (str): Path of the JSON report.
+    extra (optional): Additional top-level fields, e.g. the number of companies processed.
+
+    Returns:
+
+    dict: The report.
+
+    '''
+    report = dict(extra)
+    report["wall_time_s"] = round(time.time() - _started, 3)
+    report["stages"] = snapshot()
+    report["caches"] = {namespace: response_cache.cache_stats(namespace) for namespace in CACHE_NAMESPACES}
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return report
+
+def report_path(output_file):
+    '''
+    Description:
+    Derives the run report path that belongs to a JSON schema output file.
+
+    Parameters:
+
+    output_file (str): Path of the JSON schema, e.g. output/nasdaq_kg_schema.json.
+
+    Returns:
+
+    str: e.g. output/nasdaq_kg_schema.report.json.
+
+    '''
+    base, _ = os.path.splitext(output_file)
+    return f"{base}.report.json"
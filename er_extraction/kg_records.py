@@ -0,0 +1,177 @@
+'''
+Compact record types for the nodes and relationships of the KG schema.
+
+Every node label and relationship type has a slotted record class listing its JSON fields in order.
+A record stores its values in slots instead of a per-object dict, so the field names ("company_name",
+"net sales", ...) are stored once per class rather than once per relationship, and the values of
+the key fields in KEY_FIELDS (names, tickers, ISO codes) are interned, so a company or country
+name shared by many relationships is stored once. Free-text fields such as descriptions are not
+interned, since interned strings are never freed.
+
+Records behave like the dicts they replace: fields are read and written with node["name"], get,
+in, items and keys, using the JSON field names. Fields that were never set are absent, exactly as
+with a dict, and fields outside the class's layout are kept in an overflow dict. to_dict, or
+json.dump(..., default=to_json), gives back the dict layout of create_json_schema unchanged.
+Like dicts, records are mutable and compare by value, so they are unhashable.
+'''
+
+import sys
+
+# Short, often repeated fields whose string values are interned
+KEY_FIELDS = {"name", "ticker_code", "source_city", "iso2", "iso3", "type", "company_name", "company_name_1", "company_name_2",
+              "company_ticker", "company_ticker_1", "company_ticker_2", "country_name", "region_name", "industry_name", "product_name"}
+
+class Record:
+    '''
+    Base class of the slotted node and relationship records. FIELDS lists the JSON field names in output order.
+    '''
+    __slots__ = ("_extra",)
+    FIELDS = ()
+    _ATTRS = {}
+    _INTERNED = frozenset()
+    # merge_attributes updates records in place, so a hash would not stay valid
+    __hash__ = None
+
+    def __init__(self, values = None):
+        self._extra = None
+        if values:
+            for key, value in values.items():
+                self[key] = value
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._ATTRS = {field: field.replace(" ", "_") for field in cls.FIELDS}
+        cls._INTERNED = frozenset(attr for field, attr in cls._ATTRS.items() if field in KEY_FIELDS)
+
+    def __setitem__(self, key, value):
+        attr = self._ATTRS.get(key)
+        if attr is not None:
+            if attr in self._INTERNED and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(self, attr, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __getitem__(self, key):
+        attr = self._ATTRS.get(key)
+        if attr is not None:
+            try:
+                return getattr(self, attr)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def keys(self):
+        return [key for key, _ in self.items()]
+
+    def items(self):
+        items = []
+        for field, attr in self._ATTRS.items():
+            try:
+                items.append((field, getattr(self, attr)))
+            except AttributeError:
+                pass
+        if self._extra:
+            items.extend(self._extra.items())
+        return items
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+def _record_class(name, fields):
+    return type(name, (Record,), {"__slots__": tuple(field.replace(" ", "_") for field in fields), "FIELDS": tuple(fields)})
+
+CompanyNode = _record_class("CompanyNode", ["name", "ticker_code", "founded_year"])
+CountryNode = _record_class("CountryNode", ["source_city", "name", "iso2", "iso3", "population", "gdp", "corporate_tax_rate"])
+RegionNode = _record_class("RegionNode", ["name", "m49"])
+IndustryNode = _record_class("IndustryNode", ["name", "SIC_code", "industry_group", "subindustry_desc", "primary_activity"])
+ProductNode = _record_class("ProductNode", ["name"])
+
+CompanyCompanyRel = _record_class("CompanyCompanyRel", ["company_name_1", "company_name_2", "type", "company_ticker_1", "company_ticker_2"])
+HeadquartersRel = _record_class("HeadquartersRel", ["company_name", "country_name", "company_ticker"])
+OperatesInCountryRel = _record_class("OperatesInCountryRel", ["company_name", "country_name", "net sales", "headcount", "company_ticker"])
+OperatesInRegionRel = _record_class("OperatesInRegionRel", ["company_name", "region_name", "net sales", "headcount", "company_ticker"])
+IsInRel = _record_class("IsInRel", ["country_name", "region_name"])
+InIndustryRel = _record_class("InIndustryRel", ["company_name", "industry_name", "company_ticker"])
+ProducesRel = _record_class("ProducesRel", ["company_name", "product_name", "company_ticker"])
+
+# Node label or relationship type -> record class
+RECORD_TYPES = {
+    "Company": CompanyNode,
+    "Country": CountryNode,
+    "Region": RegionNode,
+    "Industry": IndustryNode,
+    "Product": ProductNode,
+    "PARTNERS_WITH": CompanyCompanyRel,
+    "COMPETES_WITH": CompanyCompanyRel,
+    "SUBSIDIARY_OF": CompanyCompanyRel,
+    "HEADQUARTERS_IN": HeadquartersRel,
+    "OPERATES_IN_COUNTRY": OperatesInCountryRel,
+    "OPERATES_IN_REGION": OperatesInRegionRel,
+    "IS_IN": IsInRel,
+    "IS_INVOLVED_IN": InIndustryRel,
+    "PRODUCES": ProducesRel,
+}
+
+def compact(kind, data):
+    '''
+    Description:
+    Converts a node or relationship dict, e.g. one read back from a JSON file, into its record type.
+
+    Parameters:
+
+    kind (str): Node label or relationship type.
+    data (dict or Record): Node or relationship.
+
+    Returns:
+
+    Record: The record, or data unchanged if it already is one or kind has no record type.
+
+    '''
+    record_type = RECORD_TYPES.get(kind)
+    if record_type is None or isinstance(data, Record):
+        return data
+    return record_type(data)
+
+def to_json(obj):
+    '''
+    Description:
+    json.dump default hook serialising records as their dict layout.
+
+    Parameters:
+
+    obj (object): Object json could not serialise.
+
+    Returns:
+
+    dict: The record's fields.
+
+    '''
+    if isinstance(obj, Record):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
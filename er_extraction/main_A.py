@@ -1,21 +1,50 @@
 import json
 import requests 
-import sqlite3
 import pandas as pd
 import re
 import os
 
-from bs4 import BeautifulSoup
-from googlesearch import search
-from yahooquery import Ticker
+from bs4 import BeautifulSoup, SoupStrainer, FeatureNotFound
 import pycountry_convert as pc
 import random
 import warnings
+import threading
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import response_cache
+import concurrency
+import ticker_index
+import gazetteer
+import checkpoint
+import schema_registry
+import chunking
+import ecm_store
+import http_client
+import spacy_backend
+import instrumentation
+import kg_records
+import merge_shards
 warnings.filterwarnings('ignore')
 
 TOKEN = os.getenv("DIFFBOT_KEY")
 FIELDS = "entities,facts"
 HOST = "nl.diffbot.com"
+# diffbot sends texts to the Natural Language API, spacy analyses them locally (see spacy_backend)
+BACKEND = os.getenv("ER_EXTRACTION_BACKEND", "diffbot")
+
+# ticker -> full company name, filled by get_company_names
+_company_names = {}
+# company name -> future of its ticker, filled by resolve_company_tickers
+_company_tickers = {}
+_company_tickers_lock = threading.Lock()
+
+# Company name field of a relationship -> field holding the linked ticker
+COMPANY_TICKER_FIELDS = {
+    "company_name": "company_ticker",
+    "company_name_1": "company_ticker_1",
+    "company_name_2": "company_ticker_2",
+}
 
 def get_request(payload):
   '''
@@ -27,8 +56,25 @@ def get_request(payload):
     Returns:
 
     dict: Parsed JSON response from the API if successful; otherwise, prints error information and returns None.
+    Responses are served from the on-disk cache when the same payload has been sent before. In replay mode a
+    payload that is not cached gives an error response, see response_error. Only requests that reach the API
+    are timed, under the get_request stage.
   '''
-  res = requests.post("https://{}/v1/?fields={}&token={}".format(HOST, FIELDS, TOKEN), json=payload)
+  key = response_cache.payload_key(payload, FIELDS)
+  cached = response_cache.cache_get(key)
+  if cached is not None:
+    return cached
+  if response_cache.CACHE_MODE == "replay":
+    # an error response, so the pipelines report the miss instead of a rate limit
+    return {"error": "Replay mode: no cached response for this payload, the API was not called."}
+
+  concurrency.throttle(HOST)
+  try:
+    with instrumentation.span("get_request"):
+      res = http_client.get_session().post("{}/v1/?fields={}&token={}".format(http_client.SERVICE_URLS["diffbot"], FIELDS, TOKEN), json=payload)
+  except requests.RequestException as error:
+    return {"error": f"Natural Language API request failed: {error!r}"}
+  instrumentation.add_bytes("get_request", len(res.request.body or b""), len(res.content))
   ret = None
   try:
     ret = res.json()
@@ -36,8 +82,103 @@ def get_request(payload):
     print("Bad response: " + res.text)
     print(res.status_code)
     print(res.headers)
+  if isinstance(ret, dict) and "error" not in ret:
+    response_cache.cache_put(key, ret)
   return ret
 
+def response_error(res):
+    '''
+    Returns the error message of an error response, such as the API's rate limit or a replay-mode cache miss, or None.
+    '''
+    if isinstance(res, dict) and "error" in res:
+        return res["error"]
+    return None
+
+@instrumentation.timed("analyse_payload")
+def analyse_payload(payload, subject = None):
+    '''
+    Description:
+    Extracts entities and facts from the payload's content with the configured backend.
+
+    Parameters:
+
+    payload (dict): Dictionary containing the request data, including text content, language, and format.
+    subject (str, optional): Name of the company the text is about. Only used by the spacy backend.
+    Returns:
+
+    dict: Response with entities and facts, in the layout of the Natural Language API.
+    '''
+    if BACKEND == "spacy":
+        return spacy_backend.analyse(payload["content"], subject)
+    return get_request(payload)
+
+def submit_chunked_request(payload, subject = None):
+    '''
+    Description:
+    Splits the payload's content into sentence-aligned chunks and submits one API request per chunk to the request pool.
+
+    Parameters:
+
+    payload (dict): Dictionary containing the request data, including text content, language, and format.
+    subject (str, optional): Name of the company the text is about.
+    Returns:
+
+    list: Futures of the chunk responses, in document order. Combine their results with chunking.merge_responses.
+    '''
+    return [concurrency.REQUEST_POOL.submit(analyse_payload, dict(payload, content=chunk), subject)
+            for chunk in chunking.chunk_text(payload["content"])]
+
+def filing_payloads(record):
+    '''
+    Description:
+    Builds the payloads of a company's 10-K Item 1 and Item 7.
+
+    Parameters:
+
+    record (tuple): The company's (name, stock_symbol, item1, item7) row.
+    Returns:
+
+    tuple: (item1_payload, item7_payload).
+    '''
+    return tuple({
+    "content": item.replace('\n', ''),
+    "lang": "en",
+    "format": "plain text",
+    } for item in record[2:4])
+
+# Diffbot entity type -> label, in order of precedence
+ENTITY_TYPE_LABELS = [
+    ("organization", "company"),
+    ("field of work", "industry"),
+    ("industry", "industry"),
+    ("country", "country"),
+    ("location", "location"),
+    ("product", "product"),
+]
+_type_label_lookup = {}
+
+def classify_entity_types(type_names):
+    '''
+    Description:
+    Maps the type names of an entity onto a label. Results are memoised per distinct combination of types.
+
+    Parameters:
+
+    type_names (tuple): Names of all the entity's types, in the order returned by the API.
+    Returns:
+
+    str: company, industry, country, location or product, otherwise the first type name. None if there are no types.
+    '''
+    label = _type_label_lookup.get(type_names)
+    if label is None and type_names:
+        label = type_names[0]
+        for type_name, type_label in ENTITY_TYPE_LABELS:
+            if type_name in type_names:
+                label = type_label
+                break
+        _type_label_lookup[type_names] = label
+    return label
+
 def extract_entites(res):
     '''
     Extracts entities from the API response and filters them by salience. Adds a label to classify entities as company, industry, country, location, or product.
@@ -49,30 +190,29 @@ def extract_entites(res):
 
     DataFrame: Filtered entities with columns name, salience, and Labels.
     '''
-    ents = pd.DataFrame.from_dict(res["entities"])
-    if not ents.empty:
-        salient_ents = ents[ents["salience"] > 0.5]
-        salient_ents["Labels"] = None
-        for i, row in salient_ents.iterrows():
-            if len(row['allTypes']) != 0:
-                names = [ent_type["name"] for ent_type in row['allTypes']]
-                if "organization" in names:
-                    salient_ents.loc[i,"Labels"] = 'company'
-                elif ("field of work" in names)  or ("industry" in names) or ("industry" in row['name']):
-                    salient_ents.loc[i,'Labels'] = 'industry'
-                elif "country" in names:
-                    salient_ents.loc[i,'Labels'] = 'country'
-                elif "location" in names:
-                    salient_ents.loc[i,'Labels'] = 'location'
-                elif "product" in names:
-                    salient_ents.loc[i,'Labels'] = 'product'
-                else:
-                    salient_ents.loc[i,'Labels'] = row['allTypes'][0]['name']
-                
-
-        fin_ents = salient_ents[['name','salience','Labels']]
-        return fin_ents
-    return ents
+    entities = res["entities"]
+    if not entities:
+        return pd.DataFrame.from_dict(entities)
+
+    index, names, saliences, labels = [], [], [], []
+    for i, ent in enumerate(entities):
+        if not ent["salience"] > 0.5:
+            continue
+        type_names = tuple(ent_type["name"] for ent_type in ent.get("allTypes") or ())
+        label = classify_entity_types(type_names)
+        # entities named after an industry count as one unless they are organizations
+        if type_names and label != 'company' and "industry" in ent["name"]:
+            label = 'industry'
+        index.append(i)
+        names.append(ent["name"])
+        saliences.append(ent["salience"])
+        labels.append(label)
+
+    return pd.DataFrame({
+        "name": names,
+        "salience": pd.Series(saliences, index=index, dtype="float64"),
+        "Labels": pd.Series(labels, index=index, dtype=object),
+    }, index=index)
 
 def extract_relationships(res):
     '''
@@ -87,24 +227,47 @@ def extract_relationships(res):
     DataFrame: Filtered relationships with columns entity, property, value, and evidence.
 
     '''
-    rels =  pd.DataFrame.from_dict(res["facts"])
-    if not rels.empty:
-        for i, row in rels.iterrows():
-            rels.loc[i,"entity"] = row["entity"]["name"]
-            rels.loc[i,"property"] = row["property"]["name"]
-            rels.loc[i,"value"] = row["value"]["name"]
-            if row["evidence"] != []:
-                rels.loc[i,"evidence"] = row["evidence"][0].get("passage",None)
-        fin_rels = rels[['entity','property','value','evidence']]
-        return fin_rels
-    return rels
+    facts = res["facts"]
+    if not facts:
+        return pd.DataFrame.from_dict(facts)
+
+    return pd.DataFrame({
+        "entity": [fact["entity"]["name"] for fact in facts],
+        "property": [fact["property"]["name"] for fact in facts],
+        "value": [fact["value"]["name"] for fact in facts],
+        # facts without evidence keep their empty evidence list
+        "evidence": [fact["evidence"][0].get("passage",None) if fact["evidence"] != [] else fact["evidence"]
+                     for fact in facts],
+    })
 
 
 
+@instrumentation.timed("get_company_ticker")
 def get_company_ticker(self):
     '''
     Description:
-    Retrieves the ticker symbol of a company from a Yahoo Finance search result.
+    Retrieves the ticker symbol of a company. The offline ticker index is tried first;
+    a Yahoo Finance web search is only used when the name is not in the index.
+
+    Parameters:
+
+    self (str): Company name.
+    Returns:
+
+    str: The ticker symbol of the company.
+
+    '''
+    ticker = ticker_index.lookup_ticker(self)
+    if ticker is not None:
+        return ticker
+    return search_company_ticker(self)
+
+@lru_cache(maxsize=None)
+def search_company_ticker(self):
+    '''
+    Description:
+    Retrieves the ticker symbol of a company from a Yahoo Finance search result. Only the web search is timed,
+    under the search_company_ticker stage, so repeated names served by the memo do not count as calls.
 
     Parameters:
 
@@ -115,10 +278,10 @@ def get_company_ticker(self):
 
     '''
     searchval = 'yahoo finance '+ self
-    link = []
     #limits to the first link
-    for url in search(searchval, stop = 1):
-        link.append(url)
+    concurrency.throttle("www.google.com")
+    with instrumentation.span("search_company_ticker"):
+        link = http_client.search_links(searchval, stop = 1)
 
     link = str(link[0])
     link=link.split("/")
@@ -130,11 +293,128 @@ def get_company_ticker(self):
     print(ticker)
     return(ticker)
 
+def resolve_company_tickers(names):
+    '''
+    Description:
+    Resolves the tickers of many company names concurrently. Each distinct name is looked up once per run;
+    names already resolved, or being resolved by another thread, are not looked up again.
+
+    Parameters:
+
+    names (iterable): Company names.
+    Returns:
+
+    dict: Ticker of each name. A name whose lookup failed is left out and retried on the next call.
+
+    '''
+    futures = {}
+    with _company_tickers_lock:
+        for name in dict.fromkeys(names):
+            future = _company_tickers.get(name)
+            if future is None:
+                future = _company_tickers[name] = concurrency.REQUEST_POOL.submit(get_company_ticker, name)
+            futures[name] = future
+
+    tickers = {}
+    for name, future in futures.items():
+        try:
+            tickers[name] = future.result()
+        except Exception as e:
+            print(f"Error fetching ticker for {name}: {e}")
+            with _company_tickers_lock:
+                if _company_tickers.get(name) is future:
+                    del _company_tickers[name]
+    return tickers
+
+def link_company_tickers(schema):
+    '''
+    Description:
+    Attaches tickers to the company nodes and relationships of a schema built with unresolved company names.
+    The distinct names are collected first and resolved together with resolve_company_tickers, so the cost
+    grows with the number of distinct names rather than the number of facts. Names of companies whose
+    node already has a ticker are not looked up.
+
+    Parameters:
+
+    schema (dict): Schema in the layout of create_json_schema, updated in place.
+    Returns:
+
+    dict: The linked schema.
+
+    '''
+    known = {}
+    names = set()
+    for c_node in schema["nodes"].get("Company", []):
+        if c_node.get("ticker_code") is None:
+            names.add(c_node["name"])
+        else:
+            known.setdefault(c_node["name"], c_node["ticker_code"])
+    for rels in schema["relationships"].values():
+        for rel in rels:
+            names.update(rel[field] for field in COMPANY_TICKER_FIELDS if field in rel)
+
+    tickers = resolve_company_tickers(name for name in names if name not in known)
+    tickers.update(known)
+
+    for c_node in schema["nodes"].get("Company", []):
+        if c_node.get("ticker_code") is None:
+            c_node["ticker_code"] = tickers.get(c_node["name"])
+    for rels in schema["relationships"].values():
+        for rel in rels:
+            for field, ticker_field in COMPANY_TICKER_FIELDS.items():
+                if field in rel:
+                    rel[ticker_field] = tickers.get(rel[field])
+    return schema
+
+
+@instrumentation.timed("get_company_names")
+def get_company_names(tickers):
+    '''
+    Description:
+    Resolves the full names of many tickers with a single Yahoo Finance quote_type request.
+    Names already known, in memory or in the on-disk cache, are not requested again.
 
+    Parameters:
+
+    tickers (list): Company ticker symbols.
+    Returns:
+
+    dict: Full company name of each ticker that could be resolved.
+
+    '''
+    names = {}
+    missing = []
+    for ticker in dict.fromkeys(tickers):
+        name = _company_names.get(ticker)
+        if name is None:
+            name = response_cache.cache_get(response_cache.text_key(ticker), namespace = "yahoo")
+        if name is None:
+            missing.append(ticker)
+        else:
+            names[ticker] = _company_names[ticker] = name
+    if not missing:
+        return names
+
+    try:
+        concurrency.throttle("finance.yahoo.com")
+        quote_types = http_client.get_quote_types(missing)
+    except Exception as e:
+        print(f"Error fetching company names for {len(missing)} tickers: {e}")
+        return names
+
+    for ticker in missing:
+        quote = quote_types.get(ticker) if isinstance(quote_types, dict) else None
+        if isinstance(quote, dict) and quote.get('longName'):
+            names[ticker] = _company_names[ticker] = quote['longName']
+            response_cache.cache_put(response_cache.text_key(ticker), quote['longName'], namespace = "yahoo")
+    return names
+
+@instrumentation.timed("get_company_name")
 def get_company_name(ticker):
     
     '''
     Fetches the company's full name using the ticker symbol by querying Yahoo Finance.
+    Names prefetched with get_company_names are served from memory or disk without a request.
 
     Parameters:
 
@@ -145,18 +425,50 @@ def get_company_name(ticker):
 
     '''
 
-    try:
-        ticker_info = Ticker(ticker)
-        company_name = ticker_info.quote_type[ticker]['longName']
-        print(f"Found Company: {company_name}")
-        return company_name
-    except Exception as e:
-        print(f"Error fetching company name for ticker {ticker}: {e}")
+    company_name = get_company_names([ticker]).get(ticker)
+    if company_name is None:
+        print(f"Error fetching company name for ticker {ticker}")
         return ticker
+    print(f"Found Company: {company_name}")
+    return company_name
+
+def parse_wikipedia_article(html):
+    '''
+    Description:
+    Extracts the title and paragraph text of a Wikipedia article. Only the heading and the mw-content-text
+    element are parsed; the rest of the page is skipped.
+
+    Parameters:
+
+    html (str): HTML of the article page.
+    Returns:
+
+    str: Combined title and full text of the article.
+
+    '''
+    strainer = SoupStrainer(id=['firstHeading', 'mw-content-text'])
+    try:
+        soup = BeautifulSoup(html, 'lxml', parse_only=strainer)
+    except FeatureNotFound:
+        soup = BeautifulSoup(html, 'html.parser', parse_only=strainer)
+
+    title = soup.find('h1', {'id': 'firstHeading'}).text
+
+    content_div = soup.find('div', {'id': 'mw-content-text'})
+
+    paragraphs = content_div.find_all('p')
+
+    full_article_text = '\n\n'.join([p.text.strip() for p in paragraphs if p.text.strip()])
+
+    return f"{title}" + " " + f"{full_article_text}"
 
+@instrumentation.timed("get_wikipedia_article")
 def get_wikipedia_article(company_name_or_ticker):
     
     '''
+    Fetches a Wikipedia article through the shared HTTP session. The extracted text is stored on disk with the
+    page's ETag/Last-Modified validators, so an unchanged article costs one 304 response and no parsing.
+
     Parameters:
 
     company_name_or_ticker (str): The name or ticker symbol of the company.
@@ -165,25 +477,34 @@ def get_wikipedia_article(company_name_or_ticker):
     str: Combined title and full text of the Wikipedia article if successful, otherwise returns None.
 
     '''
-    search_url = f"https://en.wikipedia.org/wiki/{company_name_or_ticker}"
+    search_url = f"{http_client.SERVICE_URLS['wikipedia']}/wiki/{company_name_or_ticker}"
+    key = response_cache.text_key(search_url)
+    cached = response_cache.cache_get(key, namespace = "wikipedia")
+
+    headers = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
     
     try:
-        response = requests.get(search_url)
+        concurrency.throttle("en.wikipedia.org")
+        response = http_client.get_session().get(search_url, headers=headers)
+        instrumentation.add_bytes("get_wikipedia_article", received = len(response.content))
+        if response.status_code == 304 and cached is not None:
+            return cached["text"]
         response.raise_for_status()
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        title = soup.find('h1', {'id': 'firstHeading'}).text
-
-        content_div = soup.find('div', {'id': 'mw-content-text'})
-
-        paragraphs = content_div.find_all('p')
-
-        full_article_text = '\n\n'.join([p.text.strip() for p in paragraphs if p.text.strip()])
+        article = parse_wikipedia_article(response.text)
+        response_cache.cache_put(key, {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "text": article,
+        }, namespace = "wikipedia")
 
-        #print(f"Title: {title}")
-        #print(f"Full Article:\n{full_article_text}")
-        return f"{title}" + " " + f"{full_article_text}"
+        #print(f"Full Article:\n{article}")
+        return article
 
     except requests.exceptions.RequestException as e:
         print(f"Error fetching the Wikipedia article: {e}")
@@ -205,11 +526,14 @@ def wikipedia_ner_rel_pipeline(ticker):
     article = get_wikipedia_article(company_name)
     if article is None:
         return (None,None)
-    res = get_request({
+    res = analyse_payload({
     "content": article,
     "lang": "en",
     "format": "plain text with title",
-    })
+    }, company_name)
+    if response_error(res) is not None:
+        print(f"No Natural Language API response for {company_name}'s Wikipedia article: {response_error(res)}")
+        return (None, None)
     ents, rels = None, None
     try:
         ents = extract_entites(res)
@@ -224,39 +548,36 @@ def wikipedia_ner_rel_pipeline(ticker):
     
     return (ents, rels)
 
-def sec_10k_ner_rel_pipeline(ticker):
+def sec_10k_ner_rel_pipeline(ticker, record = None):
     '''
     Extracts entities and relationships from SEC 10-K's Item 1 and Item 7 forms for the specified company using Diffbot's NLP API requests.
 
     Parameters:
 
     ticker (str): Company ticker symbol.
+    record (tuple, optional): The company's (name, stock_symbol, item1, item7) row, if it has already been read from the database.
     Returns:
 
     tuple: DataFrames of entities and relationships extracted from 10-K sections.
     '''
 
-    dbpath = 'data/ecmdatabase.db'
-    con = sqlite3.connect(f"file:{dbpath}?mode=ro", uri=True)
-    with con:
-        result = con.execute(f"SELECT * from companies WHERE stock_symbol = '{ticker}';")
-        records = result.fetchall()
-        if records == []:
+    if record is None:
+        record = ecm_store.get_company(ticker)
+        if record is None:
             print(f"no records of company ticker {ticker} found in database.")
             return (None,None)
-        company_name = records[0][1]
-        item1 = records[0][2].replace('\n', '')
-        item7 = records[0][3].replace('\n', '')
-    item1_res = get_request({
-    "content": item1,
-    "lang": "en",
-    "format": "plain text",
-    })
-    item7_res = get_request({
-    "content": item7,
-    "lang": "en",
-    "format": "plain text",
-    })
+    company_name = record[0]
+    item1_payload, item7_payload = filing_payloads(record)
+    # Item 1 and Item 7 are independent, so all of their chunks are sent at the same time
+    item1_futures = submit_chunked_request(item1_payload, company_name)
+    item7_futures = submit_chunked_request(item7_payload, company_name)
+    # a chunk whose request raised is merged as a failed chunk, so the others are kept
+    item1_res = chunking.merge_responses([chunking.chunk_response(future) for future in item1_futures])
+    item7_res = chunking.merge_responses([chunking.chunk_response(future) for future in item7_futures])
+    for item, res in [("Item 1", item1_res), ("Item 7", item7_res)]:
+        if response_error(res) is not None:
+            print(f"No Natural Language API response for {company_name}'s 10-K {item}: {response_error(res)}")
+            return (None, None)
 
     try:
         item1_ents, item1_rels = extract_entites(item1_res), extract_relationships(item1_res)
@@ -340,7 +661,7 @@ def create_json_schema():
 
     return json_schema
 
-def create_company_node(name,ticker_code = None,founded_year = None):
+def create_company_node(name,ticker_code = None,founded_year = None, resolve_ticker = True):
     '''
     Description:
     Creates a dictionary for a company node with optional ticker and founded year attributes.
@@ -350,17 +671,18 @@ def create_company_node(name,ticker_code = None,founded_year = None):
     name (str): Company name.
     ticker_code (str, optional): Ticker code of the company.
     founded_year (int, optional): Year the company was founded.
+    resolve_ticker (bool, optional): Look up a missing ticker now. If False it is left None for link_company_tickers.
 
     Returns:
 
     dict: Dictionary containing the company node data.
 
     '''
-    c_node = {}
+    c_node = kg_records.CompanyNode()
 
     c_node["name"] = name
 
-    if ticker_code is None:
+    if ticker_code is None and resolve_ticker:
         c_node["ticker_code"] = get_company_ticker(name)
     else:
         c_node["ticker_code"] = ticker_code
@@ -368,10 +690,13 @@ def create_company_node(name,ticker_code = None,founded_year = None):
 
     return c_node
 
+@lru_cache(maxsize=4096)
 def city_to_country(city):
     '''
     Description:
-    Fetches the country name for a given city by querying the Geonames website.
+    Fetches the country name for a given city. The local gazetteer is tried first; the Geonames
+    website is only queried for places it does not know, and those answers are cached on disk.
+    Only the Geonames requests are timed, under the city_to_country stage.
 
     Parameters:
 
@@ -382,14 +707,33 @@ def city_to_country(city):
     str: Country name if found, otherwise Not Found.
 
     '''
-    response = requests.request("GET", f"https://www.geonames.org/search.html?q={city}&country=")
+    country = gazetteer.lookup_country(city)
+    if country is not None:
+        return country
+
+    key = response_cache.text_key(city)
+    country = response_cache.cache_get(key, namespace = "geonames")
+    if country is not None:
+        return country
+
+    concurrency.throttle("www.geonames.org")
+    try:
+        with instrumentation.span("city_to_country"):
+            response = http_client.get_session().get(f"{http_client.SERVICE_URLS['geonames']}/search.html?q={city}&country=")
+    except requests.RequestException as error:
+        print(f"Geonames request for {city} failed: {error!r}")
+        return "Not Found"
+    instrumentation.add_bytes("city_to_country", received = len(response.content))
     country_raw = re.findall("/countries.*\\.html", response.text)
     if len(country_raw) != 0:
         country_pred = country_raw[0].strip(".html").split("/")[-1]
         country = country_pred.replace('-',' ').title()
-        return country
     else:
-        return "Not Found"
+        country = "Not Found"
+    # an error page only means Geonames could not answer this time
+    if response.ok:
+        response_cache.cache_put(key, country, namespace = "geonames")
+    return country
 
 def country_to_continent(country_name):
     '''
@@ -426,7 +770,7 @@ def create_country_node(name,iso3=None,iso2=None, population = None, gdp = None,
     dict: Country node details.
 
     '''
-    cnty_node = {}
+    cnty_node = kg_records.CountryNode()
     
     if is_city:
         cnty_node["source_city"] = name
@@ -458,7 +802,7 @@ def create_region_node(cnty_node):
     dict: Region node data.
     
     '''
-    reg_node = {}
+    reg_node = kg_records.RegionNode()
     if cnty_node.get("iso2",None) is None:
         reg_node["name"] = "Not Found"
     else:
@@ -484,7 +828,7 @@ def create_industry_node(name,SIC_code = None, industry_group = None, subindustr
     dict: Industry node details.
 
     '''
-    ind_node = {}
+    ind_node = kg_records.IndustryNode()
     ind_node["name"] = name
     ind_node["SIC_code"] = SIC_code
     ind_node["industry_group"] = industry_group
@@ -506,7 +850,7 @@ def create_product_node(name):
     dict: Product node details.
 
     '''
-    pdt_node = {}
+    pdt_node = kg_records.ProductNode()
     pdt_node["name"] = name
     return pdt_node
 
@@ -527,7 +871,7 @@ def create_hq_rel(c_node, cnty_node):
     "cnty_node": The name of the country.
     
     '''
-    hq_rel = {}
+    hq_rel = kg_records.HeadquartersRel()
     hq_rel["company_name"] = c_node["name"]
     hq_rel["country_name"] = cnty_node["name"]
 
@@ -552,7 +896,7 @@ def create_operates_in_country_rel(c_node, cnty_node):
     "headcount": Randomly generated headcount (between 1 and 10,000).
 
     '''
-    oic_rel = {}
+    oic_rel = kg_records.OperatesInCountryRel()
     oic_rel["company_name"] = c_node["name"]
     oic_rel["country_name"] = cnty_node["name"]
     oic_rel["net sales"] = random.randint(-30000000,30000000)
@@ -578,7 +922,7 @@ def create_operates_in_region_rel(c_node, reg_node):
     "headcount": Randomly generated headcount (between 1 and 10,000).
 
     '''
-    oir_rel = {}
+    oir_rel = kg_records.OperatesInRegionRel()
     oir_rel["company_name"] = c_node["name"]
     oir_rel["region_name"] = reg_node["name"]
     oir_rel["net sales"] = random.randint(-30000000,30000000)
@@ -601,7 +945,7 @@ def create_is_in_rel(cnty_node, reg_node):
     "region_name": Name of the region.
 
     '''
-    is_in_rel = {}
+    is_in_rel = kg_records.IsInRel()
     is_in_rel["country_name"] = cnty_node["name"]
     is_in_rel["region_name"] = reg_node["name"]
 
@@ -628,7 +972,7 @@ def create_company_company_rel(c_node1, c_node2, type = None):
     "type": Type of relationship, if specified.
 
     '''
-    c_c_rel = {}
+    c_c_rel = kg_records.CompanyCompanyRel()
     c_c_rel["company_name_1"] = c_node1["name"]
     c_c_rel["company_name_2"] = c_node2["name"]
     c_c_rel["type"] = type
@@ -652,7 +996,7 @@ def create_in_industry_rel(c_node, ind_node):
     "industry_name": Name of the industry.
 
     '''
-    c_ind_rel = {}
+    c_ind_rel = kg_records.InIndustryRel()
     c_ind_rel["company_name"] = c_node["name"]
     c_ind_rel["industry_name"] = ind_node["name"]
     return c_ind_rel
@@ -674,129 +1018,251 @@ def create_produces_rel(c_node, pdt_node):
     "product_name": Name of the product.
 
     '''
-    c_pdt_rel = {}
+    c_pdt_rel = kg_records.ProducesRel()
     c_pdt_rel["company_name"] = c_node["name"]
     c_pdt_rel["product_name"] = pdt_node["name"]
 
     return c_pdt_rel
 
-def generate_json_schema(json, offset = 0):
+def new_schema_registry(json_schema = None):
+    '''
+    Description:
+    Creates a deduplicating registry over a JSON schema. Countries added to it get their region
+    and IS_IN relationship derived once, when they are first seen.
+
+    Parameters:
+
+    json_schema (dict, optional): Schema to populate. Defaults to a new empty schema.
+
+    Returns:
+
+    SchemaRegistry: Registry whose schema attribute is the populated JSON schema.
+
+    '''
+    if json_schema is None:
+        json_schema = create_json_schema()
+    return schema_registry.SchemaRegistry(json_schema, create_region_node, create_is_in_rel)
+
+def extract_company(stock_code, record = None):
+    '''
+    Description:
+    Runs the SEC 10-K and Wikipedia pipelines for one company concurrently.
+
+    Parameters:
+
+    stock_code (str): Company ticker symbol.
+    record (tuple, optional): The company's (name, stock_symbol, item1, item7) row, if already read from the database.
+
+    Returns:
+
+    tuple: Entity and relationship DataFrames from the 10-K and from Wikipedia, in the order
+    (sec_10k_ents, sec_10k_rels, wiki_ents, wiki_rels).
+
+    '''
+    wiki_future = concurrency.REQUEST_POOL.submit(wikipedia_ner_rel_pipeline, stock_code)
+    sec_10k_ents, sec_10k_rels = sec_10k_ner_rel_pipeline(stock_code, record)
+    wiki_ents, wiki_rels = wiki_future.result()
+    return (sec_10k_ents, sec_10k_rels, wiki_ents, wiki_rels)
+
+def generate_json_schema(json, start_after = None, limit = None, max_workers = None, stream_path = None, name_batch_size = 50, until = None):
     '''
     Description:
     Populates a JSON schema with entities and relationships from SEC 10-K and Wikipedia pipelines for companies in the database.
+    Companies are streamed from the database in (name, stock_symbol) order and up to max_workers of them are
+    extracted concurrently; their results are added to the schema as they complete. Company names found in the
+    extracted entities and facts are linked to tickers once per company, after its nodes and relationships are built.
+    If stream_path is given, each company is appended to that NDJSON stream as soon as it finishes, and companies
+    already recorded in its progress manifest are skipped without counting towards limit, so a rerun picks up
+    after them. The stream is then the only output: json is left untouched and no company is kept in memory
+    once written, see merge_shards.merge.
 
     Parameters:
 
     json (dict): The initial JSON schema to be populated.
-    offset (int, optional): Starting offset for the database query.
+    start_after (tuple, optional): (name, stock_symbol) of the company to start after. Defaults to the first company.
+    limit (int, optional): Number of companies to extract, not counting those skipped. Defaults to all of them.
+    max_workers (int, optional): Number of companies extracted at once. Defaults to ER_EXTRACTION_WORKERS.
+    stream_path (str, optional): Path of the NDJSON checkpoint stream.
+    name_batch_size (int, optional): Number of companies whose names are looked up on Yahoo Finance in one request.
+    until (tuple, optional): (name, stock_symbol) of the last company to extract. Defaults to the last company.
 
     Returns:
 
-    dict: JSON schema populated with nodes and relationships.
+    dict: JSON schema populated with nodes and relationships, or, if stream_path is given, the stream path and
+    the number of companies written and of companies in the range skipped as already done.
     
     '''
-    dbpath = 'data/ecmdatabase.db'
-    con = sqlite3.connect(f"file:{dbpath}?mode=ro", uri=True)
+    registry = new_schema_registry(json) if stream_path is None else None
 
-    def fill_entities(ents, c_name):
+    @instrumentation.timed("fill_entities")
+    def fill_entities(registry, ents, c_name):
         if ents is None:
             return None
         
         for _,ent in ents.iterrows():
             if ent["Labels"] =='company' and ent["name"] != c_name:
-                ticker = get_company_ticker(ent["name"])
-                json["nodes"]["Company"].append(create_company_node(ent["name"],ticker))
+                registry.add_node("Company", create_company_node(ent["name"], resolve_ticker = False))
             elif ent["Labels"] == 'industry':
-                json["nodes"]["Industry"].append(create_industry_node(ent["name"]))
+                registry.add_node("Industry", create_industry_node(ent["name"]))
             elif ent["Labels"] == 'country':
-                json["nodes"]["Country"].append(create_country_node(ent["name"]))
+                registry.add_node("Country", create_country_node(ent["name"]))
             elif ent["Labels"] == 'location':
-                json["nodes"]["Country"].append(create_country_node(ent["name"], is_city = True))
+                registry.add_node("Country", create_country_node(ent["name"], is_city = True))
             elif ent["Labels"] == 'product':
-                json["nodes"]["Product"].append(create_product_node(ent["name"]))
-
-        for cnty_node in json["nodes"]["Country"]:
-            reg_node = create_region_node(cnty_node)
-            json["nodes"]["Region"].append(reg_node)
-            json["relationships"]["IS_IN"].append(create_is_in_rel(cnty_node,reg_node))
+                registry.add_node("Product", create_product_node(ent["name"]))
     
-    def fill_relationships(rels):
+    @instrumentation.timed("fill_relationships")
+    def fill_relationships(registry, rels):
         if rels is None:
             return None
         
         for _, rel in rels.iterrows():
             if rel["property"] == "headquarters":
-                c_node = create_company_node(rel["entity"])
+                c_node = create_company_node(rel["entity"], resolve_ticker = False)
                 hq_node = create_country_node(rel["value"], is_city = True)
                 hq_rel = create_hq_rel(c_node, hq_node)
-                json["relationships"]["HEADQUARTERS_IN"].append(hq_rel)
+                registry.add_rel("HEADQUARTERS_IN", hq_rel)
             elif rel["property"] == "organization locations":
-                c_node = create_company_node(rel["entity"])
+                c_node = create_company_node(rel["entity"], resolve_ticker = False)
                 loc_node = create_country_node(rel["value"],is_city = True)
                 loc_rel = create_operates_in_country_rel(c_node, loc_node)
-                json["relationships"]["OPERATES_IN_COUNTRY"].append(loc_rel)
+                registry.add_rel("OPERATES_IN_COUNTRY", loc_rel)
             elif rel["property"] == "industry":
-                c_node = create_company_node(rel["entity"])
+                c_node = create_company_node(rel["entity"], resolve_ticker = False)
                 ind_node = create_industry_node(rel["value"])
                 works_rel = create_in_industry_rel(c_node, ind_node)
-                json["relationships"]["IS_INVOLVED_IN"].append(works_rel)
+                registry.add_rel("IS_INVOLVED_IN", works_rel)
             elif rel["property"] == "product type":
-                c_node = create_company_node(rel["entity"])
+                c_node = create_company_node(rel["entity"], resolve_ticker = False)
                 pdt_node = create_product_node(rel["value"])
                 produces_rel = create_produces_rel(c_node,pdt_node)
-                json["relationships"]["PRODUCES"].append(produces_rel)
+                registry.add_rel("PRODUCES", produces_rel)
 
             elif rel["property"] == "competitors":
-                c_node_1 = create_company_node(rel["entity"])
-                c_node_2 = create_company_node(rel["value"])
+                c_node_1 = create_company_node(rel["entity"], resolve_ticker = False)
+                c_node_2 = create_company_node(rel["value"], resolve_ticker = False)
                 cc_rel = create_company_company_rel(c_node_1,c_node_2)
-                json["relationships"]["COMPETES_WITH"].append(cc_rel)
+                registry.add_rel("COMPETES_WITH", cc_rel)
             elif rel["property"] == "suppliers":
-                c_node_1 = create_company_node(rel["entity"])
-                c_node_2 = create_company_node(rel["value"])
+                c_node_1 = create_company_node(rel["entity"], resolve_ticker = False)
+                c_node_2 = create_company_node(rel["value"], resolve_ticker = False)
                 cc_rel = create_company_company_rel(c_node_1,c_node_2, "suppliers")
-                json["relationships"]["PARTNERS_WITH"].append(cc_rel)
+                registry.add_rel("PARTNERS_WITH", cc_rel)
             elif rel["property"] == "subsidiary":
-                c_node_1 = create_company_node(rel["entity"])
-                c_node_2 = create_company_node(rel["value"])
+                c_node_1 = create_company_node(rel["entity"], resolve_ticker = False)
+                c_node_2 = create_company_node(rel["value"], resolve_ticker = False)
                 cc_rel = create_company_company_rel(c_node_2, c_node_1, "subsidiary")
-                json["relationships"]["SUBSIDIARY_OF"].append(cc_rel)
-    with con:
-        result = con.execute(f"SELECT name, stock_symbol from companies ORDER BY name LIMIT 10 OFFSET {offset};")
-        records = result.fetchall()
-        for record in records:
-            company_name = record[0]
-            stock_code = record[1]
-
-            print(f'Processing {company_name} with stock code {stock_code}')
-            
-            c_node = create_company_node(company_name,stock_code)
-            json["nodes"]["Company"].append(c_node)
-
-            sec_10k_ents, sec_10k_rels = sec_10k_ner_rel_pipeline(stock_code)
-            wiki_ents, wiki_rels = wikipedia_ner_rel_pipeline(stock_code)
-
-            fill_entities(sec_10k_ents,company_name)
-            fill_entities(wiki_ents,company_name)
-            fill_relationships(sec_10k_rels)
-            fill_relationships(wiki_rels)
+                registry.add_rel("SUBSIDIARY_OF", cc_rel)
+    done = set()
+    if stream_path is not None:
+        manifest_path = checkpoint.stream_paths(stream_path)[1]
+        done = checkpoint.completed_tickers(manifest_path)
+        if done:
+            print(f"Skipping companies already in {manifest_path}")
+
+    @instrumentation.timed("company")
+    def build_company(company_name, stock_code, record):
+        try:
+            sec_10k_ents, sec_10k_rels, wiki_ents, wiki_rels = extract_company(stock_code, record)
+        finally:
+            if BACKEND == "spacy":
+                # whatever the pipelines did not use of the batch prefetch is not needed any more
+                spacy_backend.evict(company_name)
+
+        company_registry = new_schema_registry()
+        c_node = create_company_node(company_name,stock_code)
+        company_registry.add_node("Company", c_node)
+
+        # Nodes and relationships only carry company names here; the distinct names are linked to tickers in one pass
+        fill_entities(company_registry, sec_10k_ents,company_name)
+        fill_entities(company_registry, wiki_ents,company_name)
+        fill_relationships(company_registry, sec_10k_rels)
+        fill_relationships(company_registry, wiki_rels)
+        return link_company_tickers(company_registry.schema)
+
+    written = 0
+    def add_company(future, company_name, stock_code):
+        nonlocal written
+        company_schema = future.result()
+        if stream_path is not None:
+            checkpoint.append_company(stream_path, manifest_path, stock_code, company_name, company_schema)
+            written += 1
+        else:
+            registry.merge(company_schema)
+        print(f'Finished {company_name} with stock code {stock_code}')
+
+    max_workers = max_workers or concurrency.MAX_WORKERS
+    skipped = 0
+    def is_done(stock_code):
+        nonlocal skipped
+        if stock_code in done:
+            skipped += 1
+            return True
+        return False
+
+    companies = ecm_store.iter_companies(start_after = start_after, limit = limit, until = until, skip = is_done)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="er-company") as pool:
+        futures = {}
+        while True:
+            batch = list(islice(companies, name_batch_size))
+            if not batch:
+                break
+            # one Yahoo request resolves the names of the whole batch for the Wikipedia pipeline
+            get_company_names([record[1] for record in batch])
+            if BACKEND == "spacy":
+                # analyse the filings of the whole batch in one nlp.pipe call, spread over the spaCy processes
+                chunks = [(chunk, record[0]) for record in batch for payload in filing_payloads(record)
+                          for chunk in chunking.chunk_text(payload["content"])]
+                spacy_backend.prefetch([chunk for chunk, _ in chunks], [subject for _, subject in chunks])
+
+            for record in batch:
+                company_name, stock_code = record[0], record[1]
+                print(f'Processing {company_name} with stock code {stock_code}')
+                futures[pool.submit(build_company, company_name, stock_code, record)] = (company_name, stock_code)
+
+                # Bound the companies in flight, so only a few filings are held in memory at a time.
+                # Results are merged on this thread only, so the schema is never mutated concurrently
+                if len(futures) >= 2 * max_workers:
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        add_company(future, *futures.pop(future))
+
+        for future in as_completed(futures):
+            add_company(future, *futures[future])
     
+    if stream_path is not None:
+        return {"stream_path": stream_path, "companies": written, "skipped": skipped}
     return json
 
-empty_schema = create_json_schema()
-print("Generating schema")
-
-if not os.path.exists('output'):
-    os.makedirs('output')
-output_file = os.getenv("ER_EXTRACTION_OUTPUT", "nasdaq_kg_schema.json")
-try:
-    kg_json = generate_json_schema(empty_schema, offset = 0)
-    with open(f'output/{output_file}', 'w') as f:
-        json.dump(empty_schema, f)
+if __name__ == "__main__":
+    empty_schema = create_json_schema()
+    print("Generating schema")
+
+    if not os.path.exists('output'):
+        os.makedirs('output')
+    output_file = os.getenv("ER_EXTRACTION_OUTPUT", "nasdaq_kg_schema.json")
+    # Companies extracted per run, all of them by default. Finished companies are skipped without counting
+    # towards it, so the next run picks up after them
+    limit = int(os.getenv("ER_EXTRACTION_LIMIT", 0)) or None
+    stream_path, manifest_path = checkpoint.stream_paths(f'output/{output_file}')
+    try:
+        generate_json_schema(empty_schema, limit = limit, stream_path = stream_path)
         print("Schema generated successfully!")
-except Exception as error:
-    print("Error encountered. Schema generated is incomplete.")
-    print(error)
-    with open('output/nasdaq_kg_schema.json', 'w') as f:
-        json.dump(empty_schema, f)
+    except Exception as error:
+        print("Error encountered. Schema generated is incomplete.")
+        print(f"Completed companies are kept in {stream_path}; rerun to resume.")
+        print(error)
+
+    # The schema is always rebuilt from the stream, so it also contains companies finished in earlier runs.
+    # merge_shards deduplicates on disk, so the companies are never all held in memory
+    merge_shards.merge([stream_path], f'output/{output_file}', indent = None)
+
+    print(f"Diffbot response cache: {response_cache.cache_stats()}")
+    print(f"Geonames fallback cache: {response_cache.cache_stats('geonames')}")
+    print(f"Wikipedia article cache: {response_cache.cache_stats('wikipedia')}")
+    print(f"Yahoo company name cache: {response_cache.cache_stats('yahoo')}")
+
+    report_file = instrumentation.report_path(f'output/{output_file}')
+    instrumentation.write_report(report_file, output = f'output/{output_file}', backend = BACKEND)
+    print(f"Run report written to {report_file}")
 
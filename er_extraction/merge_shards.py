@@ -0,0 +1,282 @@
+'''
+Streaming, deduplicating merge of ER extraction outputs into one schema file.
+
+Inputs can be JSON schema files (e.g. output/nasdaq_kg_schema_rank_*.json) and checkpoint
+streams (*.ndjson, see checkpoint.py), in any mix. JSON files are read one at a time and stream
+records one line at a time, so at most one input file is held in memory. For streams, only the
+last record of each ticker is merged, since a ticker is written again when a run is interrupted
+between writing the stream and the manifest, and companies are merged in ticker order, so the
+output does not depend on the order in which workers finished them.
+
+Nodes and relationships are deduplicated on the keys of schema_registry: Country nodes by iso3 (or
+name), other nodes by name, relationships by their endpoint fields. A duplicate's attributes are
+merged into the first copy, as SchemaRegistry does. The merged entries are kept in an on-disk
+SQLite index instead of in memory and are written out one at a time, so memory stays bounded
+however large the output grows. Node labels, relationship types and entries keep first-seen order,
+and the file has the layout json.dump(schema, indent=4) gives.
+
+Merge statistics (records read, unique and merged per node label and relationship type) are
+printed and can be written to a JSON file.
+
+Usage (from the directory containing output/):
+    python merge_shards.py output/nasdaq_kg_schema_rank_*.json [--output output/merged_output.json]
+        [--stats output/merged_output.stats.json] [--indent 4]
+'''
+
+import os
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import kg_records
+from schema_registry import NODE_KEYS, REL_ENDPOINTS, merge_attributes
+
+class MergeIndex:
+    '''
+    On-disk index of the merged nodes and relationships, keyed by (section, kind, key).
+    section is "nodes" or "relationships", kind the node label or relationship type.
+    '''
+    def __init__(self, path = None):
+        self._tmpdir = None
+        if path is None:
+            self._tmpdir = tempfile.TemporaryDirectory(prefix="merge_shards_")
+            path = os.path.join(self._tmpdir.name, "index.db")
+        self.con = sqlite3.connect(path)
+        self.con.execute("PRAGMA journal_mode = OFF")
+        self.con.execute("PRAGMA synchronous = OFF")
+        self.con.execute("CREATE TABLE entries(section TEXT, kind TEXT, key TEXT, seq INTEGER, data TEXT, "
+                         "PRIMARY KEY(section, kind, key))")
+        self.kinds = {"nodes": [], "relationships": []}
+        self.stats = {"nodes": {}, "relationships": {}}
+        self.seq = 0
+
+    def declare(self, section, kind):
+        if kind not in self.stats[section]:
+            self.kinds[section].append(kind)
+            self.stats[section][kind] = {"read": 0, "unique": 0, "merged": 0}
+
+    def key(self, section, kind, entry):
+        if section == "nodes":
+            key_func = NODE_KEYS.get(kind)
+            key = key_func(entry) if key_func else sorted(entry.items())
+        else:
+            fields = REL_ENDPOINTS.get(kind)
+            key = [entry.get(field) for field in fields] if fields else sorted(entry.items())
+        return json.dumps(key, default=str)
+
+    def add(self, section, kind, entry):
+        '''
+        Description:
+        Inserts a node or relationship, or merges its attributes into the stored entry with the same key.
+
+        Parameters:
+
+        section (str): "nodes" or "relationships".
+        kind (str): Node label or relationship type.
+        entry (dict): Node or relationship.
+
+        '''
+        if entry is None:
+            return
+        self.declare(section, kind)
+        stats = self.stats[section][kind]
+        stats["read"] += 1
+        key = self.key(section, kind, entry)
+        row = self.con.execute("SELECT data FROM entries WHERE section = ? AND kind = ? AND key = ?",
+                               (section, kind, key)).fetchone()
+        if row is None:
+            stats["unique"] += 1
+            self.seq += 1
+            self.con.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?)",
+                             (section, kind, key, self.seq, json.dumps(entry, default=kg_records.to_json)))
+            return
+        stats["merged"] += 1
+        stored = json.loads(row[0])
+        before = dict(stored)
+        merge_attributes(stored, entry)
+        if stored != before:
+            self.con.execute("UPDATE entries SET data = ? WHERE section = ? AND kind = ? AND key = ?",
+                             (json.dumps(stored), section, kind, key))
+
+    def merge(self, fragment):
+        for section in ["nodes", "relationships"]:
+            for kind, entries in fragment.get(section, {}).items():
+                self.declare(section, kind)
+                for entry in entries:
+                    self.add(section, kind, entry)
+
+    def entries(self, section, kind):
+        for (data,) in self.con.execute("SELECT data FROM entries WHERE section = ? AND kind = ? ORDER BY seq",
+                                        (section, kind)):
+            yield json.loads(data)
+
+    def close(self):
+        self.con.close()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+def _indented(obj, indent, level):
+    text = json.dumps(obj, indent=indent)
+    return text.replace("\n", "\n" + " " * (indent * level)) if indent else text
+
+def write_schema(index, f, indent = 4):
+    '''
+    Description:
+    Writes the merged schema one entry at a time, byte for byte as json.dump(schema, f, indent=indent) would.
+
+    Parameters:
+
+    index (MergeIndex): Merged nodes and relationships.
+    f (file): Output file opened for writing.
+    indent (int, optional): JSON indent; None writes the compact form.
+
+    '''
+    if indent is None:
+        newline, pad, sep = "", lambda level: "", ", "
+    else:
+        newline, pad, sep = "\n", lambda level: " " * (indent * level), ","
+    colon = ": "
+    f.write("{")
+    for s, section in enumerate(["nodes", "relationships"]):
+        f.write(("" if s == 0 else sep) + newline + pad(1) + json.dumps(section) + colon)
+        kinds = index.kinds[section]
+        if not kinds:
+            f.write("{}")
+            continue
+        f.write("{")
+        for k, kind in enumerate(kinds):
+            f.write(("" if k == 0 else sep) + newline + pad(2) + json.dumps(kind) + colon + "[")
+            empty = True
+            for entry in index.entries(section, kind):
+                f.write(("" if empty else sep) + newline + pad(3) + _indented(entry, indent, 3))
+                empty = False
+            f.write("]" if empty else newline + pad(2) + "]")
+        f.write(newline + pad(1) + "}")
+    f.write(newline + "}")
+
+def iter_fragments(input_paths, stats):
+    '''
+    Description:
+    Yields the schema fragments of the inputs in merge order: JSON schema files whole, one at a time,
+    and the records of stream files in ticker order, last record per ticker only.
+
+    Parameters:
+
+    input_paths (list): JSON schema and NDJSON stream files, in order.
+    stats (dict): Input statistics, updated in place.
+
+    Returns:
+
+    generator: Schema fragments in the layout of create_json_schema.
+
+    '''
+    stream_paths = []
+    for path in input_paths:
+        if path.endswith(".ndjson"):
+            stream_paths.append(path)
+            continue
+        with open(path, 'r', encoding="utf-8") as f:
+            try:
+                fragment = json.load(f)
+            except json.JSONDecodeError as e:
+                print(f"Error decoding {path}: {e}")
+                stats["invalid_files"] += 1
+                continue
+        stats["files"] += 1
+        yield fragment
+
+    if not stream_paths:
+        return
+    # first pass: position of the last record of every ticker; second pass: read only those
+    latest = {}
+    for path in stream_paths:
+        stats["files"] += 1
+        with open(path, 'rb') as f:
+            offset = f.tell()
+            for line in iter(f.readline, b""):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping incomplete record in {path}")
+                    stats["invalid_records"] += 1
+                else:
+                    stats["stream_records"] += 1
+                    latest[record["ticker"]] = (path, offset)
+                offset = f.tell()
+    stats["superseded_records"] = stats["stream_records"] - len(latest)
+    handles = {}
+    try:
+        for ticker in sorted(latest):
+            path, offset = latest[ticker]
+            f = handles.get(path) or handles.setdefault(path, open(path, 'rb'))
+            f.seek(offset)
+            yield json.loads(f.readline())["schema"]
+    finally:
+        for f in handles.values():
+            f.close()
+
+def merge(input_paths, output_file, indent = 4, index_path = None):
+    '''
+    Description:
+    Merges JSON schema files and checkpoint streams into one deduplicated schema file.
+
+    Parameters:
+
+    input_paths (list): JSON schema and NDJSON stream files, in order.
+    output_file (str): Path of the merged schema.
+    indent (int, optional): JSON indent of the output; None writes the compact form.
+    index_path (str, optional): Path of the SQLite merge index. Defaults to a temporary file.
+
+    Returns:
+
+    dict: Merge statistics.
+
+    '''
+    start = time.perf_counter()
+    stats = {"files": 0, "invalid_files": 0, "stream_records": 0, "invalid_records": 0, "superseded_records": 0}
+    index = MergeIndex(index_path)
+    try:
+        for fragment in iter_fragments(input_paths, stats):
+            index.merge(fragment)
+        tmp_file = output_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            write_schema(index, f, indent)
+        os.replace(tmp_file, output_file)
+        stats["nodes"] = index.stats["nodes"]
+        stats["relationships"] = index.stats["relationships"]
+    finally:
+        index.close()
+    for section in ["nodes", "relationships"]:
+        stats[f"{section}_read"] = sum(s["read"] for s in stats[section].values())
+        stats[f"{section}_unique"] = sum(s["unique"] for s in stats[section].values())
+    stats["output_bytes"] = os.path.getsize(output_file)
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    return stats
+
+def print_stats(stats):
+    print(f"Merged {stats['files']} files ({stats['invalid_files']} unreadable, "
+          f"{stats['superseded_records']} superseded stream records) in {stats['seconds']} s")
+    for section in ["nodes", "relationships"]:
+        print(f"{section}: {stats[f'{section}_read']} read, {stats[f'{section}_unique']} unique")
+        for kind, s in stats[section].items():
+            if s["read"]:
+                print(f"    {kind:<22} {s['read']:>9} read {s['unique']:>9} unique {s['merged']:>9} merged")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="JSON schema files and/or .ndjson checkpoint streams")
+    parser.add_argument("--output", default="output/merged_output.json")
+    parser.add_argument("--stats", default=None, help="also write the merge statistics to this JSON file")
+    parser.add_argument("--indent", type=int, default=4, help="JSON indent of the output, 0 for compact")
+    args = parser.parse_args()
+
+    stats = merge(args.inputs, args.output, indent = args.indent or None)
+    print_stats(stats)
+    print(f"Merged schema written to {args.output}")
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(stats, f, indent=4)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+'''
+Content-addressed on-disk cache for responses from the Natural Language API (and other slow lookups).
+
+Entries are stored as one JSON file per key under CACHE_DIR/<namespace>/<key[:2]>/<key>.json,
+where the key is a SHA-256 hash of the request. Entries older than CACHE_MAX_AGE seconds are
+treated as misses, and the least recently used entries are evicted once the cache grows past
+CACHE_MAX_BYTES.
+
+CACHE_MODE controls how the cache is used:
+    "readwrite" - serve hits from disk and store new responses (default).
+    "replay"    - serve hits from disk only. Misses are never sent to the API and nothing is written.
+    "off"       - bypass the cache entirely.
+'''
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+CACHE_DIR = os.getenv("ER_CACHE_DIR", "output/cache")
+CACHE_MODE = os.getenv("ER_CACHE_MODE", "readwrite")
+CACHE_MAX_BYTES = int(os.getenv("ER_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+CACHE_MAX_AGE = int(os.getenv("ER_CACHE_MAX_AGE", 90 * 24 * 60 * 60))
+
+# hits/misses/writes per namespace; evictions are counted across the whole cache
+CACHE_STATS = {"evictions": 0}
+
+_lock = threading.Lock()
+_cache_bytes = None
+
+def payload_key(payload, fields):
+    '''
+    Description:
+    Computes the cache key of an API request from the fields that determine its response.
+
+    Parameters:
+
+    payload (dict): Request payload with content, lang and format.
+    fields (str): Comma separated list of fields requested from the API.
+
+    Returns:
+
+    str: Hex SHA-256 digest identifying the request.
+
+    '''
+    canonical = json.dumps({
+        "content": payload.get("content"),
+        "lang": payload.get("lang"),
+        "format": payload.get("format"),
+        "fields": fields,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def text_key(text):
+    '''
+    Description:
+    Computes the cache key of a plain text lookup, such as a city name.
+
+    Parameters:
+
+    text (str): Text being looked up.
+
+    Returns:
+
+    str: Hex SHA-256 digest of the text.
+
+    '''
+    return hashlib.sha256(str(text).encode("utf-8")).hexdigest()
+
+def _entry_path(key, namespace):
+    return os.path.join(CACHE_DIR, namespace, key[:2], f"{key}.json")
+
+def _count(stat, namespace = None, n = 1):
+    with _lock:
+        if namespace is None:
+            CACHE_STATS[stat] += n
+        else:
+            counters = CACHE_STATS.setdefault(namespace, {"hits": 0, "misses": 0, "writes": 0})
+            counters[stat] += n
+
+def cache_get(key, namespace = "diffbot"):
+    '''
+    Description:
+    Looks up a cached response. Expired entries are removed and counted as misses.
+
+    Parameters:
+
+    key (str): Cache key, see payload_key.
+    namespace (str, optional): Sub-directory separating different kinds of cached data.
+
+    Returns:
+
+    object: The cached value if present and fresh, otherwise None.
+
+    '''
+    if CACHE_MODE == "off":
+        return None
+    path = _entry_path(key, namespace)
+    try:
+        with open(path, 'r', encoding="utf-8") as f:
+            entry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        _count("misses", namespace)
+        return None
+
+    now = time.time()
+    if now - entry.get("created", 0) > CACHE_MAX_AGE:
+        if CACHE_MODE == "readwrite":
+            _remove(path)
+        _count("misses", namespace)
+        return None
+
+    try:
+        # atime marks recency of use for LRU eviction
+        os.utime(path, (now, os.stat(path).st_mtime))
+    except OSError:
+        pass
+    _count("hits", namespace)
+    return entry["value"]
+
+def cache_put(key, value, namespace = "diffbot"):
+    '''
+    Description:
+    Stores a response in the cache. Does nothing unless CACHE_MODE is "readwrite".
+
+    Parameters:
+
+    key (str): Cache key, see payload_key.
+    value (object): JSON serialisable value to store.
+    namespace (str, optional): Sub-directory separating different kinds of cached data.
+
+    '''
+    global _cache_bytes
+    if CACHE_MODE != "readwrite":
+        return
+    path = _entry_path(key, namespace)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = json.dumps({"created": time.time(), "value": value}, ensure_ascii=False).encode("utf-8")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _count("writes", namespace)
+
+    with _lock:
+        if _cache_bytes is None:
+            _cache_bytes = _cache_size()
+        else:
+            _cache_bytes += len(data)
+        over_budget = _cache_bytes > CACHE_MAX_BYTES
+    if over_budget:
+        evict_cache()
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _cache_entries():
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if name.endswith(".json"):
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st
+
+def _cache_size():
+    return sum(st.st_size for _, st in _cache_entries())
+
+def evict_cache():
+    '''
+    Description:
+    Removes expired entries, then removes least recently used entries until the cache
+    is below 90% of CACHE_MAX_BYTES.
+
+    Returns:
+
+    int: Number of entries evicted.
+
+    '''
+    global _cache_bytes
+    if CACHE_MODE != "readwrite":
+        return 0
+    now = time.time()
+    evicted = 0
+    live = []
+    for path, st in _cache_entries():
+        if now - st.st_mtime > CACHE_MAX_AGE:
+            _remove(path)
+            evicted += 1
+        else:
+            live.append((st.st_atime, st.st_size, path))
+
+    total = sum(size for _, size, _ in live)
+    target = CACHE_MAX_BYTES * 0.9
+    if total > CACHE_MAX_BYTES:
+        live.sort()
+        for _, size, path in live:
+            if total <= target:
+                break
+            _remove(path)
+            total -= size
+            evicted += 1
+
+    with _lock:
+        _cache_bytes = total
+    _count("evictions", n = evicted)
+    return evicted
+
+def cache_stats(namespace = "diffbot"):
+    '''
+    Description:
+    Returns a snapshot of the cache counters of a namespace together with its hit rate.
+
+    Parameters:
+
+    namespace (str, optional): Sub-directory separating different kinds of cached data.
+
+    Returns:
+
+    dict: hits, misses, writes, hit_rate and the cache-wide evictions count.
+
+    '''
+    with _lock:
+        stats = dict(CACHE_STATS.get(namespace, {"hits": 0, "misses": 0, "writes": 0}))
+        stats["evictions"] = CACHE_STATS["evictions"]
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
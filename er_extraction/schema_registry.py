@@ -0,0 +1,165 @@
+'''
+Keyed node and relationship registries for the KG schema.
+
+SchemaRegistry wraps a schema dict in the layout of create_json_schema and inserts nodes and
+relationships through hash indexes, so each node or relationship is stored once. Inserting a
+duplicate merges its attributes into the stored entry instead. Region nodes and IS_IN
+relationships are derived when a country is first inserted, not rebuilt for every country.
+Inserted dicts are stored as the compact records of kg_records.
+'''
+
+import kg_records
+
+# Node label -> function computing the key of a node
+NODE_KEYS = {
+    # Company nodes are keyed by name: kg_construction collects every name of a ticker
+    # into Company.names, so distinct names of the same company must be kept
+    "Company": lambda node: node.get("name"),
+    "Country": lambda node: node.get("iso3") or node.get("name"),
+    "Region": lambda node: node.get("name"),
+    "Industry": lambda node: node.get("name"),
+    "Product": lambda node: node.get("name"),
+}
+
+# Relationship type -> fields identifying its endpoints
+REL_ENDPOINTS = {
+    "PARTNERS_WITH": ("company_name_1", "company_name_2"),
+    "COMPETES_WITH": ("company_name_1", "company_name_2"),
+    "SUBSIDIARY_OF": ("company_name_1", "company_name_2"),
+    "HEADQUARTERS_IN": ("company_name", "country_name"),
+    "OPERATES_IN_COUNTRY": ("company_name", "country_name"),
+    "IS_INVOLVED_IN": ("company_name", "industry_name"),
+    "IS_IN": ("country_name", "region_name"),
+    "OPERATES_IN_REGION": ("company_name", "region_name"),
+    "PRODUCES": ("company_name", "product_name"),
+}
+
+def merge_attributes(stored, new):
+    '''
+    Description:
+    Merges the attributes of a duplicate into a stored node or relationship, in place.
+    Attributes missing or None in the stored entry are taken from the duplicate; existing values are kept.
+
+    Parameters:
+
+    stored (dict): Node or relationship already in the registry.
+    new (dict): Duplicate being inserted.
+
+    Returns:
+
+    dict: The updated stored entry.
+
+    '''
+    for attr, value in new.items():
+        if stored.get(attr) is None and value is not None:
+            stored[attr] = value
+    return stored
+
+class SchemaRegistry:
+    '''
+    Deduplicating view over a schema dict. Nodes and relationships added through the registry
+    are appended to the schema's lists, which remain the output.
+
+    If create_region_node and create_is_in_rel are given, they are used to derive the region and
+    IS_IN relationship of each newly inserted country.
+    '''
+    def __init__(self, schema, create_region_node = None, create_is_in_rel = None):
+        self.schema = schema
+        self.create_region_node = create_region_node
+        self.create_is_in_rel = create_is_in_rel
+        self.nodes = {label: {} for label in schema["nodes"]}
+        self.rels = {rel_type: {} for rel_type in schema["relationships"]}
+        existing = {"nodes": schema["nodes"], "relationships": schema["relationships"]}
+        self.schema["nodes"] = {label: [] for label in existing["nodes"]}
+        self.schema["relationships"] = {rel_type: [] for rel_type in existing["relationships"]}
+        self.merge(existing)
+
+    def node_key(self, label, node):
+        key_func = NODE_KEYS.get(label)
+        return key_func(node) if key_func else tuple(sorted(node.items()))
+
+    def rel_key(self, rel_type, rel):
+        fields = REL_ENDPOINTS.get(rel_type)
+        if fields is None:
+            return tuple(sorted(rel.items()))
+        return tuple(rel.get(field) for field in fields)
+
+    def add_node(self, label, node):
+        '''
+        Description:
+        Inserts a node, or merges it into the stored node with the same key.
+        A country inserted for the first time also adds its region and IS_IN relationship.
+
+        Parameters:
+
+        label (str): Node label, e.g. Company.
+        node (dict): Node data.
+
+        Returns:
+
+        dict: The node stored in the registry.
+
+        '''
+        node = kg_records.compact(label, node)
+        index = self.nodes.setdefault(label, {})
+        key = self.node_key(label, node)
+        stored = index.get(key)
+        if stored is not None:
+            return merge_attributes(stored, node)
+
+        index[key] = node
+        self.schema["nodes"].setdefault(label, []).append(node)
+        if label == "Country" and self.create_region_node is not None:
+            reg_node = self.add_node("Region", self.create_region_node(node))
+            self.add_rel("IS_IN", self.create_is_in_rel(node, reg_node))
+        return node
+
+    def add_rel(self, rel_type, rel):
+        '''
+        Description:
+        Inserts a relationship, or merges it into the stored relationship with the same endpoints.
+
+        Parameters:
+
+        rel_type (str): Relationship type, e.g. COMPETES_WITH.
+        rel (dict): Relationship data.
+
+        Returns:
+
+        dict: The relationship stored in the registry.
+
+        '''
+        if rel is None:
+            return None
+        rel = kg_records.compact(rel_type, rel)
+        index = self.rels.setdefault(rel_type, {})
+        key = self.rel_key(rel_type, rel)
+        stored = index.get(key)
+        if stored is not None:
+            return merge_attributes(stored, rel)
+
+        index[key] = rel
+        self.schema["relationships"].setdefault(rel_type, []).append(rel)
+        return rel
+
+    def merge(self, fragment):
+        '''
+        Description:
+        Inserts every node and relationship of a schema fragment.
+
+        Parameters:
+
+        fragment (dict): Schema in the layout of create_json_schema.
+
+        Returns:
+
+        SchemaRegistry: The registry itself.
+
+        '''
+        for label, nodes in fragment.get("nodes", {}).items():
+            for node in nodes:
+                self.add_node(label, node)
+        for rel_type, rels in fragment.get("relationships", {}).items():
+            for rel in rels:
+                self.add_rel(rel_type, rel)
+        return self
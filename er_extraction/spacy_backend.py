@@ -0,0 +1,246 @@
+'''
+Local spaCy NER and relation extraction, used instead of the Diffbot Natural Language API
+when ER_EXTRACTION_BACKEND=spacy.
+
+Texts are analysed with nlp.pipe in batches of SPACY_BATCH_SIZE. With SPACY_PROCESSES above 1,
+prefetch sends the batches to a pool of that many worker processes, each with its own copy of the
+pipeline. The workers are spawned rather than forked, since the caller runs many threads.
+Only the components needed for entities and sentences are loaded: the tagger, parser, lemmatizer
+and similar pipes are excluded, and sentence boundaries come from the senter component (or a
+rule-based sentencizer if the model has none).
+
+Each text is turned into a response in the layout of the Natural Language API, so
+extract_entites and extract_relationships in main_A.py work on it unchanged:
+    ORG -> organization, PRODUCT -> product, GPE -> country or location.
+An entity's salience grows with its number of mentions, so entities mentioned only once fall
+below the 0.5 salience cut-off. Facts are found per sentence from trigger phrases, e.g. a
+sentence naming an organization and a GPE after "headquartered in" gives a headquarters fact.
+Sentences that say "we" or "the Company" refer to the company the text is about, if known.
+'''
+
+import os
+import re
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import gazetteer
+
+SPACY_MODEL = os.getenv("ER_SPACY_MODEL", "en_core_web_sm")
+SPACY_PROCESSES = int(os.getenv("ER_SPACY_PROCESSES", 1))
+SPACY_BATCH_SIZE = int(os.getenv("ER_SPACY_BATCH_SIZE", 8))
+
+UNUSED_PIPES = ["tagger", "parser", "attribute_ruler", "lemmatizer", "morphologizer", "textcat", "textcat_multilabel"]
+
+# spaCy entity label -> Natural Language API entity type
+ENTITY_TYPES = {
+    "ORG": "organization",
+    "PRODUCT": "product",
+    "GPE": "location",
+}
+
+# (property, trigger phrase, spaCy label of the value), in the property names the API uses
+FACT_PATTERNS = [
+    ("headquarters", re.compile(r"\b(headquarter\w*|head office|based in)\b", re.I), "GPE"),
+    ("organization locations", re.compile(r"\b(operat\w* in|operations in|facilit(y|ies) in|offices? in|presence in|located in)\b", re.I), "GPE"),
+    ("competitors", re.compile(r"\b(compet\w*|rivals?)\b", re.I), "ORG"),
+    ("suppliers", re.compile(r"\b(suppl(y|ies|ied|ier|iers)|vendors?)\b", re.I), "ORG"),
+    ("subsidiary", re.compile(r"\b(subsidiar(y|ies)|wholly[- ]owned|acquired)\b", re.I), "ORG"),
+    ("product type", re.compile(r"\b(produc\w*|manufactur\w*|sells?|offers?|launch\w*)\b", re.I), "PRODUCT"),
+]
+SELF_REFERENCE = re.compile(r"\b(we|our|the company)\b", re.I)
+
+_nlp = None
+_nlp_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+# subject -> {text -> response}, filled by prefetch and consumed by analyse, dropped by evict
+_prefetched = {}
+_prefetched_lock = threading.Lock()
+
+def get_nlp():
+    '''
+    Description:
+    Loads the spaCy pipeline on first use, with only the components needed for NER and sentences.
+
+    Returns:
+
+    spacy.Language: The loaded pipeline.
+
+    '''
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                try:
+                    import spacy
+                except ImportError:
+                    raise ImportError("The spacy backend needs spaCy and a model: pip install spacy && python -m spacy download en_core_web_sm")
+                nlp = spacy.load(SPACY_MODEL, exclude=UNUSED_PIPES)
+                if "senter" in nlp.disabled:
+                    nlp.enable_pipe("senter")
+                elif "senter" not in nlp.pipe_names:
+                    nlp.add_pipe("sentencizer", first=True)
+                # the shared tok2vec only feeds the tagger and parser in the core models
+                if "tok2vec" in nlp.pipe_names and not nlp.get_pipe("tok2vec").listening_components:
+                    nlp.disable_pipe("tok2vec")
+                _nlp = nlp
+    return _nlp
+
+def get_pool():
+    '''
+    Returns the pool of SPACY_PROCESSES spawned worker processes, starting it on first use.
+    Each worker loads the pipeline once.
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=SPACY_PROCESSES, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=get_nlp)
+    return _pool
+
+def close_pool():
+    '''
+    Shuts the worker processes down. The next prefetch starts them again.
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+atexit.register(close_pool)
+
+def _salience(mentions):
+    return 1 - 1 / (1 + mentions)
+
+def _entity_type(ent):
+    if ent.label_ == "GPE" and gazetteer.is_country(ent.text):
+        return "country"
+    return ENTITY_TYPES[ent.label_]
+
+def _fact(entity, prop, value, evidence):
+    return {
+        "entity": {"name": entity},
+        "property": {"name": prop},
+        "value": {"name": value},
+        "evidence": [{"passage": evidence}],
+    }
+
+def doc_to_response(doc, subject = None):
+    '''
+    Description:
+    Converts an analysed document into a response in the layout of the Natural Language API.
+
+    Parameters:
+
+    doc (spacy.tokens.Doc): Analysed text.
+    subject (str, optional): Name of the company the text is about, used for sentences that say "we" or "the Company".
+
+    Returns:
+
+    dict: Response with entities (name, salience, allTypes) and facts (entity, property, value, evidence).
+
+    '''
+    mentions = {}
+    types = {}
+    for ent in doc.ents:
+        if ent.label_ in ENTITY_TYPES:
+            mentions[ent.text] = mentions.get(ent.text, 0) + 1
+            types.setdefault(ent.text, _entity_type(ent))
+    entities = [{"name": name, "salience": _salience(count), "allTypes": [{"name": types[name]}]}
+                for name, count in mentions.items()]
+
+    facts = {}
+    for sent in doc.sents:
+        sent_ents = [ent for ent in sent.ents if ent.label_ in ENTITY_TYPES]
+        if not sent_ents:
+            continue
+        orgs = [ent.text for ent in sent_ents if ent.label_ == "ORG"]
+        default_subject = subject if subject is not None and SELF_REFERENCE.search(sent.text) else None
+        for prop, trigger, value_label in FACT_PATTERNS:
+            if not trigger.search(sent.text):
+                continue
+            if value_label == "ORG":
+                # "we compete with A and B": the other organizations of the sentence are the values
+                entity = default_subject or (orgs[0] if orgs else None)
+            else:
+                entity = orgs[0] if orgs else default_subject
+            if entity is None:
+                continue
+            for value in (ent.text for ent in sent_ents if ent.label_ == value_label):
+                if value != entity:
+                    facts.setdefault((entity, prop, value), _fact(entity, prop, value, sent.text))
+    return {"entities": entities, "facts": list(facts.values())}
+
+def analyse_batch(batch):
+    '''
+    Analyses a batch of (text, subject) pairs with nlp.pipe. Returns their responses in order.
+    '''
+    nlp = get_nlp()
+    return [doc_to_response(doc, subject) for doc, subject in nlp.pipe(batch, as_tuples=True, batch_size=SPACY_BATCH_SIZE)]
+
+def _locked_batch(batch):
+    with _nlp_lock:
+        return analyse_batch(batch)
+
+def prefetch(texts, subjects = None):
+    '''
+    Description:
+    Analyses many texts at once with nlp.pipe, in batches of SPACY_BATCH_SIZE spread over the
+    SPACY_PROCESSES worker processes, and keeps the responses for the next analyse call on each
+    text with the same subject. In a single process the pipeline is only locked one batch at a time,
+    so analyse calls from other threads are not held up for the whole prefetch.
+
+    Parameters:
+
+    texts (list): Texts to analyse.
+    subjects (list, optional): Company each text is about, aligned with texts.
+
+    '''
+    subjects = subjects or [None] * len(texts)
+    pending = [(text, subject) for text, subject in zip(texts, subjects) if text]
+    if not pending:
+        return
+    batches = [pending[i:i + SPACY_BATCH_SIZE] for i in range(0, len(pending), SPACY_BATCH_SIZE)]
+    if SPACY_PROCESSES > 1:
+        results = get_pool().map(analyse_batch, batches)
+    else:
+        get_nlp()
+        results = (_locked_batch(batch) for batch in batches)
+    for batch, responses in zip(batches, results):
+        with _prefetched_lock:
+            for (text, subject), response in zip(batch, responses):
+                _prefetched.setdefault(subject, {})[text] = response
+
+def evict(subject):
+    '''
+    Drops the prefetched responses of a company that analyse did not consume, once the company is done.
+    '''
+    with _prefetched_lock:
+        _prefetched.pop(subject, None)
+
+def analyse(text, subject = None):
+    '''
+    Description:
+    Returns the response for one text, from prefetch if it was analysed there for the same subject,
+    otherwise by analysing it now.
+
+    Parameters:
+
+    text (str): Text to analyse.
+    subject (str, optional): Name of the company the text is about.
+
+    Returns:
+
+    dict: Response in the layout of the Natural Language API.
+
+    '''
+    with _prefetched_lock:
+        response = _prefetched.get(subject, {}).pop(text, None)
+    if response is not None:
+        return response
+    nlp = get_nlp()
+    with _nlp_lock:
+        doc = nlp(text)
+    return doc_to_response(doc, subject)
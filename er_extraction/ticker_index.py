@@ -0,0 +1,159 @@
+'''
+Offline company name to ticker resolution.
+
+Builds an in-memory index from the company/ticker tables in data/ and resolves names by
+exact match on a normalised form of the name, falling back to fuzzy matching. Results are
+memoised, so each distinct name is only resolved once per process.
+'''
+
+import os
+import re
+import difflib
+import sqlite3
+import threading
+import unicodedata
+from functools import lru_cache
+import pandas as pd
+
+# (path, name columns, ticker column)
+TICKER_SOURCES = [
+    ('data/company_industry.csv', ['Company Name', 'Tradestyle'], 'Ticker'),
+    ('data/CIK.csv', ['Company'], 'Symbol'),
+    ('data/NASDAQ_10-K_URLs.csv', ['Company Name'], 'ticker'),
+    ('data/mapping_stock.csv', ['company_name'], 'ticker'),
+]
+
+# Source -> lookup database written by merge_csv.py, read instead of the source when it is up to date
+LOOKUP_ARTIFACTS = {
+    'data/mapping_stock.csv': 'data/mapping_stock.db',
+}
+
+# Legal-form and filler words dropped from the end (or start) of a company name
+COMPANY_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "companies",
+    "ltd", "limited", "plc", "llc", "lp", "llp", "holdings", "holding", "group",
+    "sa", "ag", "nv", "se", "ab", "asa", "spa", "bv", "gmbh", "kk", "the",
+}
+
+FUZZY_CUTOFF = 0.88
+
+_index = None
+_index_by_initial = None
+_tickers = None
+_index_lock = threading.Lock()
+
+def normalize_company_name(name):
+    '''
+    Description:
+    Normalises a company name for matching: folds accents and case, drops punctuation and
+    legal-form suffixes such as Inc., Corp. and Ltd.
+
+    Parameters:
+
+    name (str): Company name.
+
+    Returns:
+
+    str: Normalised name, e.g. "Amazon.com, Inc." -> "amazon com".
+
+    '''
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    name = name.lower().replace("&", " and ")
+    tokens = re.sub(r"[^a-z0-9]+", " ", name).split()
+    while tokens and tokens[-1] in COMPANY_SUFFIXES:
+        tokens.pop()
+    while tokens and tokens[0] == "the":
+        tokens.pop(0)
+    return " ".join(tokens)
+
+def _load_artifact(path, index, tickers):
+    '''
+    Loads a source from its lookup database, whose names are already normalised.
+    Returns False if there is no up-to-date database for the source.
+    '''
+    artifact = LOOKUP_ARTIFACTS.get(path)
+    if artifact is None or not os.path.exists(artifact):
+        return False
+    if os.path.exists(path) and os.path.getmtime(artifact) < os.path.getmtime(path):
+        return False
+    con = sqlite3.connect(f"file:{artifact}?mode=ro", uri=True)
+    try:
+        tickers.update(ticker.upper() for (ticker,) in con.execute("SELECT DISTINCT ticker FROM mapping"))
+        for key, ticker in con.execute("SELECT key, ticker FROM names"):
+            if key not in index:
+                index[key] = ticker
+    except sqlite3.DatabaseError as e:
+        print(f"Ticker index: skipping {artifact}: {e}")
+        return False
+    finally:
+        con.close()
+    return True
+
+def _load_index():
+    global _index, _index_by_initial, _tickers
+    index = {}
+    tickers = set()
+    for path, name_cols, ticker_col in TICKER_SOURCES:
+        if _load_artifact(path, index, tickers):
+            continue
+        try:
+            df = pd.read_csv(path, usecols=name_cols + [ticker_col], dtype=str, keep_default_na=False)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Ticker index: skipping {path}: {e}")
+            continue
+        for name_col in name_cols:
+            for name, ticker in zip(df[name_col], df[ticker_col]):
+                ticker = ticker.strip().upper()
+                if not ticker:
+                    continue
+                tickers.add(ticker)
+                key = normalize_company_name(name)
+                # earlier sources are more curated, so they win on conflicts
+                if key and key not in index:
+                    index[key] = ticker
+
+    by_initial = {}
+    for key in index:
+        by_initial.setdefault(key[0], []).append(key)
+
+    _index, _index_by_initial, _tickers = index, by_initial, tickers
+
+def _ensure_index():
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _load_index()
+
+@lru_cache(maxsize=None)
+def lookup_ticker(name):
+    '''
+    Description:
+    Resolves a company name to its ticker symbol using the offline index.
+
+    Parameters:
+
+    name (str): Company name, or a ticker symbol. A name in the index takes precedence over a ticker spelled the same way.
+
+    Returns:
+
+    str: Ticker symbol if the name could be resolved, otherwise None.
+
+    '''
+    _ensure_index()
+    if name is None:
+        return None
+    stripped = str(name).strip()
+    key = normalize_company_name(stripped)
+    # a company whose name is spelled like another company's ticker, e.g. BYD (not Boyd Gaming), is matched by name
+    if key in _index:
+        return _index[key]
+    if stripped.isupper() and stripped in _tickers:
+        return stripped
+    if not key:
+        return None
+
+    candidates = _index_by_initial.get(key[0], [])
+    match = difflib.get_close_matches(key, candidates, n=1, cutoff=FUZZY_CUTOFF)
+    if match:
+        return _index[match[0]]
+    return None
@@ -1,32 +1,20 @@
-import os
-import json
-import pandas as pd
+import argparse
+import sec_mapping
 
 # Define the directory path
-directory_path = 'data/sec_submissions'
+directory_path = sec_mapping.SUBMISSIONS_DIR
 
-columns = ["cik", "company_name", "ticker"]
-new_csv = pd.DataFrame(columns=columns)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map the CIK of every SEC submission file to its company name and tickers.")
+    parser.add_argument("--output", default='data/mapping_stock.csv', help="output .csv or .parquet file")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes, defaults to the number of CPUs")
+    args = parser.parse_args()
 
-# Loop through each file in the directory
-for filename in os.listdir(directory_path):
-    if filename.endswith('.json'):
-        file_path = os.path.join(directory_path, filename)
-        
-        # Open and read the JSON file
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-            print(f"Processed file: {filename}")
-            
-            cik = data['cik']
-            company_name = data['company_name']
-            tickers = data['tickers']
-            
-            for ticker in tickers:
-                new_row = pd.DataFrame([[cik, company_name, ticker]], columns=columns)
-                new_csv = pd.concat([new_csv, new_row], ignore_index=True)
+    json_files = sec_mapping.submission_files(directory_path)
 
-# Save the DataFrame to a CSV file
-new_csv.to_csv('data/mapping_stock.csv', index=False)
+    # Parse the JSON files in a process pool and stream their rows to the output file
+    with sec_mapping.RowWriter(args.output) as writer:
+        for _, rows in sec_mapping.iter_parsed(json_files, args.workers):
+            writer.write(rows)
 
-print("DataFrame saved as data/mapping_stock.csv")
\ No newline at end of file
+    print(f"Processed {len(json_files)} files, {writer.rows_written} rows saved as {args.output}")
@@ -1,47 +1,98 @@
 import os
-import json
-import pandas as pd
+import argparse
+import sec_mapping
 
 # Define the directory path
-directory_path = 'data/sec_submissions'
-
-# Define the columns for the DataFrame
-columns = ["cik", "company_name", "ticker"]
+directory_path = sec_mapping.SUBMISSIONS_DIR
 
 # Define the batch size
 batch_size = 1000
 
-# Initialize an empty DataFrame
-new_csv = pd.DataFrame(columns=columns)
-
-# Get the list of all JSON files
-json_files = [f for f in os.listdir(directory_path) if f.endswith('.json')]
-
-# Process files in batches
-for i in range(0, len(json_files), batch_size):
-    batch_files = json_files[i:i + batch_size]
-    
-    for filename in batch_files:
-        file_path = os.path.join(directory_path, filename)
-        
-        # Open and read the JSON file
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-            print(f"Processed file: {filename}")
-            
-            cik = data.get('cik', '')
-            company_name = data.get('company_name', '')
-            tickers = data.get('tickers', [])
-            
-            for ticker in tickers:
-                new_row = pd.DataFrame([[cik, company_name, ticker]], columns=columns)
-                new_csv = pd.concat([new_csv, new_row], ignore_index=True)
-    
-    # Save the DataFrame to a CSV file after processing each batch
-    path = 'data/mapping_stock/'
-    batch_csv_filename = f'mapping_batch_{i // batch_size + 1}.csv'
-    new_csv.to_csv(path + batch_csv_filename, index=False)
-    print(f"Batch {i // batch_size + 1} saved as {batch_csv_filename}")
-    
-    # Clear the DataFrame for the next batch
-    new_csv = pd.DataFrame(columns=columns)
\ No newline at end of file
+FORMATS = ["csv", "parquet"]
+
+def batch_path(output_dir, batch, format):
+    return os.path.join(output_dir, f'mapping_batch_{batch}.{format}')
+
+def update_batches(json_files, output_dir, format = "csv", workers = None, full = False):
+    '''
+    Description:
+    Brings the batch files of output_dir up to date with the submission files. Only files that are new or
+    changed since the last run are parsed, and only their batches rewritten. Each batch file is written to a
+    temporary file first and replaces the old one whole; batch files of the other format are deleted, so
+    merge_csv.py never reads a batch twice.
+
+    Parameters:
+
+    json_files (list): Paths of the submission files, in name order.
+    output_dir (str): Directory of the batch files and their manifest.
+    format (str, optional): "csv" or "parquet".
+    workers (int, optional): Parser processes. Defaults to the number of CPUs.
+    full (bool, optional): Ignore the manifest and reparse every file.
+
+    Returns:
+
+    dict: Files unchanged, touched, parsed and removed, and batches written and removed.
+
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, 'manifest.db')
+    if full and os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    manifest = sec_mapping.Manifest(manifest_path, batch_size)
+
+    # Get the new files and the ones touched since the last run
+    candidates, removed, unchanged = manifest.scan(json_files)
+    for filename in removed:
+        manifest.remove(filename)
+
+    # Touched files are hashed, and parsed only if their content changed, in a process pool
+    stats = {path: (size, mtime_ns) for path, _, size, mtime_ns in candidates}
+    parsed = 0
+    for file_path, sha256, rows in sec_mapping.iter_changed([(path, known_hash) for path, known_hash, _, _ in candidates], workers):
+        if manifest.record(os.path.basename(file_path), *stats[file_path], sha256, rows) is not None:
+            parsed += 1
+    # The batches these files dirtied are recorded with them, and stay dirty until rewritten
+    manifest.commit()
+
+    # Rewrite the dirty batches, and any batch whose file is missing, e.g. after a change of format
+    dirty = manifest.dirty_batches()
+    batches = manifest.batches()
+    written = 0
+    for batch in batches:
+        output_path = batch_path(output_dir, batch, format)
+        if batch in dirty or not os.path.exists(output_path):
+            with sec_mapping.RowWriter(output_path) as writer:
+                writer.write(list(manifest.batch_rows(batch)))
+            written += 1
+            print(f"Batch {batch} saved as {os.path.basename(output_path)}")
+        for other in FORMATS:
+            if other != format and os.path.exists(batch_path(output_dir, batch, other)):
+                os.remove(batch_path(output_dir, batch, other))
+        if batch in dirty:
+            manifest.clean(batch)
+    # Batches left without files
+    for batch in dirty.difference(batches):
+        for other in FORMATS:
+            if os.path.exists(batch_path(output_dir, batch, other)):
+                os.remove(batch_path(output_dir, batch, other))
+        manifest.clean(batch)
+        print(f"Batch {batch} removed")
+    manifest.close()
+
+    return {"unchanged": unchanged, "touched": len(candidates) - parsed, "parsed": parsed, "removed": len(removed),
+            "batches_written": written, "batches_removed": len(dirty.difference(batches))}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Map SEC submission files to (cik, company_name, ticker) rows, one output file per batch of files. "
+                                                 "Only files that are new or changed since the last run are parsed, and only their batches rewritten.")
+    parser.add_argument("--output-dir", default='data/mapping_stock', help="directory of the batch files")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes, defaults to the number of CPUs")
+    parser.add_argument("--full", action="store_true", help="ignore the manifest and reparse every file")
+    args = parser.parse_args()
+
+    json_files = sec_mapping.submission_files(directory_path)
+    stats = update_batches(json_files, args.output_dir, args.format, args.workers, args.full)
+
+    print(f"{len(json_files)} files: {stats['unchanged']} unchanged, {stats['touched']} touched but identical, "
+          f"{stats['parsed']} parsed, {stats['removed']} removed")
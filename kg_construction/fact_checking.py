@@ -261,7 +261,7 @@ def add_group_edges(node_keys: dict[str, str],
     (n:{src_label}{{{src_key}:$src_key_value}}),
     (m:{dst_label}{{{dst_key}:$dst_key_value}})
 MERGE (n)-[:{edge_label}]->(m)"""
-    graph_utils.execute_query_with_params(query, *group_edges)
+    graph_utils.execute_batched_write(query, group_edges)
 
 
 def fact_check_and_add(edges_to_add: tuple,
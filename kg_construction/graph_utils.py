@@ -1,28 +1,71 @@
 import os
-from neo4j import GraphDatabase, EagerResult
-from neo4j.exceptions import ServiceUnavailable
+import re
+import atexit
+import threading
+from typing import NamedTuple
+from neo4j import GraphDatabase, Driver, EagerResult, ManagedTransaction, ResultSummary, SummaryCounters
+from neo4j.exceptions import Neo4jError, DriverError, ServiceUnavailable
 
 URI = os.getenv("NEO4J_URI")
 AUTH = (os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD"))
+# Connections kept open by the driver's pool, and seconds to wait for a free one
+MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", 100))
+ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", 60))
+# Rows sent per UNWIND batch, each batch in its own transaction
+BATCH_SIZE = int(os.getenv("NEO4J_BATCH_SIZE", 1000))
 
-try:
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
-        driver.verify_connectivity()
-except ServiceUnavailable:
-    URI = URI.replace("neo4j+s", "neo4j+ssc")
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
+# Parameter references, and the string literals, quoted names and comments that may contain a "$" without one
+_TOKEN = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`|//[^\n]*|/\*.*?\*/)|\$(\w+)""", re.S)
+
+_driver = None
+_driver_lock = threading.Lock()
+
+def _connect(uri: str) -> Driver:
+    driver = GraphDatabase.driver(uri, auth=AUTH,
+                                  max_connection_pool_size=MAX_POOL_SIZE,
+                                  connection_acquisition_timeout=ACQUISITION_TIMEOUT)
+    try:
         driver.verify_connectivity()
+    except Exception:
+        driver.close()
+        raise
+    return driver
 
-print("Connection to graph database established.")
+def get_driver() -> Driver:
+    '''
+    Returns the process-wide driver, connecting on first use.
+    Queries borrow connections from its pool instead of opening their own.
+    '''
+    global _driver, URI
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                try:
+                    driver = _connect(URI)
+                except ServiceUnavailable:
+                    URI = URI.replace("neo4j+s", "neo4j+ssc")
+                    driver = _connect(URI)
+                _driver = driver
+                print("Connection to graph database established.")
+    return _driver
+
+def close_driver():
+    '''
+    Closes the process-wide driver and its pooled connections. The next query reconnects.
+    '''
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+atexit.register(close_driver)
 
 def execute_query(query: str) -> EagerResult:
     '''
     Executes a query without any parameters
     '''
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
-        result = driver.execute_query(query)
-    
-    return result
+    return get_driver().execute_query(query)
 
 def execute_query_with_params(query: str,
                               *param_dicts: dict[str, str]) -> list[EagerResult]:
@@ -31,13 +74,79 @@ def execute_query_with_params(query: str,
     Transaction based - All queries must be successful for changes to be committed.
     '''
     results = []
-    with GraphDatabase.driver(URI, auth=AUTH) as driver:
-        with driver.session(database="neo4j") as session:
-            with session.begin_transaction() as tx:
-                for param_dict in param_dicts:
-                    result = tx.run(query, param_dict)
-                    results.append(result.to_eager_result())
-                tx.commit()
+    with get_driver().session(database="neo4j") as session:
+        with session.begin_transaction() as tx:
+            for param_dict in param_dicts:
+                result = tx.run(query, param_dict)
+                results.append(result.to_eager_result())
+            tx.commit()
+    return results
+
+class BatchResult(NamedTuple):
+    '''
+    Outcome of one batch of execute_batched_write: rows[start:start + size] were written
+    with the given counters, or failed with error and were rolled back.
+    '''
+    start: int
+    size: int
+    counters: SummaryCounters | None
+    error: Exception | None
+
+class BatchWriteError(Exception):
+    '''
+    Raised by execute_batched_write once all batches have run, if any of them failed.
+    results holds the BatchResult of every batch.
+    '''
+    def __init__(self, message: str, results: list[BatchResult]):
+        super().__init__(message)
+        self.results = results
+
+def _parameter(match: re.Match) -> str:
+    return match.group(0) if match.group(2) is None else "row." + match.group(2)
+
+def unwind_query(query: str) -> str:
+    '''
+    Turns a query written for one parameter dict into one that runs once per row of $rows,
+    e.g. "MERGE (:Region{m49: $m49})" -> "UNWIND $rows AS row MERGE (:Region{m49: row.m49})".
+    A "$" inside a string literal, a quoted name or a comment is left as it is.
+    Queries that already use $rows are returned unchanged.
+    '''
+    if any(match.group(2) == "rows" for match in _TOKEN.finditer(query)):
+        return query
+    return "UNWIND $rows AS row\n" + _TOKEN.sub(_parameter, query)
+
+def _run_batch(tx: ManagedTransaction, query: str, rows: list[dict]) -> ResultSummary:
+    return tx.run(query, rows=rows).consume()
+
+def execute_batched_write(query: str,
+                          rows: list[dict[str, object]],
+                          batch_size: int | None = None,
+                          raise_on_error: bool = True) -> list[BatchResult]:
+    '''
+    Executes a write query over many rows, sending batch_size rows per round trip as $rows.
+    query is either written for one parameter dict, as for execute_query_with_params, or
+    UNWINDs $rows itself (see unwind_query).
+    Each batch is its own transaction, retried on transient errors - a failed batch is rolled back
+    without stopping the others. Once all batches have run, BatchWriteError is raised if any failed,
+    unless raise_on_error is False, in which case the caller checks the returned results.
+    '''
+    query = unwind_query(query)
+    batch_size = batch_size or BATCH_SIZE
+    rows = list(rows)
+    results = []
+    with get_driver().session(database="neo4j") as session:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            try:
+                summary = session.execute_write(_run_batch, query, batch)
+                results.append(BatchResult(start, len(batch), summary.counters, None))
+            except (Neo4jError, DriverError) as e:
+                print(f"Batch of rows {start} to {start + len(batch) - 1} failed: {e}")
+                results.append(BatchResult(start, len(batch), None, e))
+    failed = [result for result in results if result.error is not None]
+    if failed and raise_on_error:
+        raise BatchWriteError(f"{len(failed)} of {len(results)} batches failed, "
+                              f"{sum(result.size for result in failed)} rows not written: {failed[0].error}", results)
     return results
 
 def reset_graph():
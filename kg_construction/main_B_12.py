@@ -119,8 +119,8 @@
 regions = pd.concat([continents, subregions, itdregions], ignore_index=True)\
             .astype({'m49': int})
 region_nodes = regions.to_dict('records')
-graph_utils.execute_query_with_params("MERGE (:Region{m49: $m49, name: $name})",
-                                      *region_nodes)
+graph_utils.execute_batched_write("MERGE (:Region{m49: $m49, name: $name})",
+                                  region_nodes)
 
 print("Country Nodes")
 countries = df_m49[['ISO-alpha3 Code', 'ISO-alpha2 Code', 'Country or Area']]\
@@ -132,8 +132,8 @@
                         'Country or Area': 'name'
                     })
 country_nodes = countries.to_dict('records')
-graph_utils.execute_query_with_params("MERGE (:Country{iso3: $iso3, name: $name, iso2: $iso2})",
-                                      *country_nodes)
+graph_utils.execute_batched_write("MERGE (:Country{iso3: $iso3, name: $name, iso2: $iso2})",
+                                  country_nodes)
 
 print("Country IS_IN Region Relationships")
 country_continent = df_m49[['ISO-alpha3 Code', 'Region Code']]\
@@ -159,11 +159,11 @@
                             })
 country_region = pd.concat([country_continent, country_subregion, country_itdregion], ignore_index=True)
 isin_relationships = country_region.to_dict('records')
-graph_utils.execute_query_with_params('''
+graph_utils.execute_batched_write('''
 MATCH
     (c:Country{iso3: $iso3}),
     (r:Region{m49: $m49})
-MERGE (c)-[:IS_IN]->(r)''', *isin_relationships)
+MERGE (c)-[:IS_IN]->(r)''', isin_relationships)
 
 print("Country Aliases")
 def split_alias(row):
@@ -181,14 +181,14 @@ def split_alias(row):
         .drop_duplicates()\
         .rename(columns={'Alias': 'alias'})
 country_aliases = aliases.to_dict('records')
-graph_utils.execute_query_with_params('''
+graph_utils.execute_batched_write('''
 MERGE (c:Country {iso3: $iso3})
 SET c.aliases = 
     CASE
         WHEN c.aliases IS NULL THEN [$alias]
         WHEN NOT $alias IN c.aliases THEN c.aliases + $alias
         ELSE c.aliases
-    END''', *country_aliases)
+    END''', country_aliases)
 
 print("Country Statistics")
 def get_worldbank(indicator: str) -> pd.DataFrame:
@@ -228,13 +228,13 @@ def get_worldbank(indicator: str) -> pd.DataFrame:
               'corporate_tax_rate': 'corporate_tax_rate'
           })
 country_stats = stats[stats['year'] == '2022'].to_dict('records')
-graph_utils.execute_query_with_params('''
+graph_utils.execute_batched_write('''
 MATCH (c:Country {iso3: $iso3})
 SET
     c.population = $population,
     c.gdp = $gdp,
     c.pv = $pv,
-    c.corporate_tax_rate = $corporate_tax_rate''', *country_stats)
+    c.corporate_tax_rate = $corporate_tax_rate''', country_stats)
 
 print("Sector Nodes")
 gics_url = 'https://github.com/bautheac/GICS/raw/0c2b0e4c0ca56a0e520301fd978fc095ed4fc328/data/standards.rda'
@@ -274,7 +274,7 @@ def gics_wrangling(df):
             'sector_name': 'name'
         })
 sector_nodes = sector.to_dict('records')
-graph_utils.execute_query_with_params("MERGE (:Sector{gics: $gics, name: $name})", *sector_nodes)
+graph_utils.execute_batched_write("MERGE (:Sector{gics: $gics, name: $name})", sector_nodes)
 
 print("Industry Nodes")
 industry = df_standards[['subindustry_id', 'subindustry_name', 'primary_activity']] \
@@ -288,7 +288,7 @@ def gics_wrangling(df):
 industry_desc_embed = EMBEDDING_MODEL.encode(industry['description'].to_numpy())
 industry['embedding'] = list(map(list, industry_desc_embed))
 insustry_nodes = industry.to_dict('records')
-graph_utils.execute_query_with_params("MERGE (:Industry{gics: $gics, name: $name, description: $description, embedding: $embedding})", *insustry_nodes)
+graph_utils.execute_batched_write("MERGE (:Industry{gics: $gics, name: $name, description: $description, embedding: $embedding})", insustry_nodes)
 
 print("Industry PART_OF Sector Relationships")
 industry_sector = df_standards[['subindustry_id', 'sector_id']] \
@@ -298,11 +298,11 @@ def gics_wrangling(df):
                       'sector_id': 'sector_gics'
                   })
 part_of_relationships = industry_sector.to_dict('records')
-graph_utils.execute_query_with_params('''
+graph_utils.execute_batched_write('''
 MATCH
     (i:Industry{gics: $industry_gics}),
     (s:Sector{gics: $sector_gics})
-MERGE (i)-[:PART_OF]->(s)''', *part_of_relationships)
+MERGE (i)-[:PART_OF]->(s)''', part_of_relationships)
 print()
 
 #################################
@@ -359,7 +359,7 @@ def company_validate(data):
 companies = validated_data['nodes']['Company']
 for company in companies:
     company['founded_year'] = company['founded_year'] or ""
-graph_utils.execute_query_with_params('''
+graph_utils.execute_batched_write('''
 MERGE (c:Company {ticker: $ticker_code})
 SET c.names = 
     CASE
@@ -367,7 +367,7 @@ def company_validate(data):
         WHEN NOT $name IN c.names THEN c.names + $name
         ELSE c.names
     END,
-    c.founded_year = $founded_year''', *companies)
+    c.founded_year = $founded_year''', companies)
 
 print()
 
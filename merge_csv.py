@@ -1,20 +1,169 @@
-import pandas as pd
 import os
+import sys
+import csv
+import sqlite3
+import argparse
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'er_extraction'))
+from ticker_index import normalize_company_name
 
 folder_path = 'data/mapping_stock'
-csv_files = [f for f in os.listdir(folder_path)]
+output_file = 'data/mapping_stock.csv'
 
-df_list = []
+# Rows inserted into the merge database at once
+INSERT_BATCH = 10000
 
-for file in csv_files:
-    file_path = os.path.join(folder_path, file)
-    df = pd.read_csv(file_path)
-    df_list.append(df)
+def batch_files(folder_path):
+    '''
+    Description:
+    Lists the mapping batch files of a folder, CSV or Parquet as written by generate_mapping_batch.py, in name order.
 
-merged_df = pd.concat(df_list, ignore_index=True)
+    Parameters:
 
-output_file = 'data/mapping_stock.csv'
-merged_df.to_csv(output_file, index=False)
+    folder_path (str): Folder of the batch files.
+
+    Returns:
+
+    list: Paths of the batch files. Other files are ignored.
+
+    '''
+    return [os.path.join(folder_path, f) for f in sorted(os.listdir(folder_path))
+            if f.endswith(('.csv', '.parquet'))]
+
+def iter_batch_rows(file_path):
+    '''
+    Yields the (cik, company_name, ticker) rows of a batch file one at a time.
+    '''
+    if file_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file_path).iter_batches(columns=["cik", "company_name", "ticker"]):
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+        return
+    with open(file_path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield row["cik"], row["company_name"], row["ticker"]
+
+def clean_row(cik, company_name, ticker):
+    '''
+    Types a row for the merge: cik as an integer, so that zero-padded and plain CIKs match, names and tickers stripped.
+    Returns None for rows without a cik or ticker.
+    '''
+    try:
+        cik = int(cik)
+    except (TypeError, ValueError):
+        return None
+    ticker = (ticker or '').strip()
+    if not ticker:
+        return None
+    return cik, (company_name or '').strip(), ticker
+
+def merge(files, db_path):
+    '''
+    Description:
+    Merges batch files into a SQLite database, deduplicating on (cik, ticker) on disk, so memory stays
+    bounded however many batches there are. The first row of a pair wins; a later non-empty company
+    name fills in an empty one. The database doubles as the lookup artifact of ticker_index: it holds
+    the mapping indexed by ticker and a table of normalised company names.
+
+    Parameters:
+
+    files (list): Batch files, in order.
+    db_path (str): Path of the database to create.
+
+    Returns:
+
+    dict: Rows read, skipped and unique.
+
+    '''
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    con.execute("CREATE TABLE mapping(cik INTEGER NOT NULL, company_name TEXT NOT NULL, ticker TEXT NOT NULL, "
+                "PRIMARY KEY(cik, ticker))")
+    insert = ("INSERT INTO mapping VALUES (?, ?, ?) ON CONFLICT(cik, ticker) DO UPDATE "
+              "SET company_name = excluded.company_name WHERE mapping.company_name = ''")
+    stats = {"files": len(files), "read": 0, "skipped": 0}
+    for file_path in files:
+        rows = []
+        for row in iter_batch_rows(file_path):
+            stats["read"] += 1
+            row = clean_row(*row)
+            if row is None:
+                stats["skipped"] += 1
+                continue
+            rows.append(row)
+            if len(rows) >= INSERT_BATCH:
+                con.executemany(insert, rows)
+                rows = []
+        con.executemany(insert, rows)
+        con.commit()
+
+    con.execute("CREATE INDEX mapping_ticker ON mapping(ticker)")
+    # normalised company name -> ticker, the first pair of a name winning, for ticker_index
+    con.execute("CREATE TABLE names(key TEXT PRIMARY KEY, ticker TEXT NOT NULL)")
+    names = con.cursor()
+    for company_name, ticker in con.execute("SELECT company_name, ticker FROM mapping WHERE company_name != '' ORDER BY rowid"):
+        key = normalize_company_name(company_name)
+        if key:
+            names.execute("INSERT OR IGNORE INTO names VALUES (?, ?)", (key, ticker.upper()))
+    con.commit()
+    stats["unique"] = con.execute("SELECT COUNT(*) FROM mapping").fetchone()[0]
+    con.close()
+    return stats
+
+def write_outputs(db_path, csv_path, parquet_path = None, row_group_size = 100000):
+    '''
+    Description:
+    Streams the merged mapping, in first-seen order, to a CSV file and optionally a typed Parquet file.
+
+    Parameters:
+
+    db_path (str): Merge database.
+    csv_path (str): Output CSV path.
+    parquet_path (str, optional): Output Parquet path, with cik as int64 and company_name and ticker as strings.
+    row_group_size (int, optional): Rows per Parquet row group.
+
+    '''
+    con = sqlite3.connect(db_path)
+    cursor = con.execute("SELECT cik, company_name, ticker FROM mapping ORDER BY rowid")
+    writer = None
+    if parquet_path:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([("cik", pa.int64()), ("company_name", pa.string()), ("ticker", pa.string())])
+        writer = pq.ParquetWriter(parquet_path, schema)
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        out = csv.writer(f)
+        out.writerow(["cik", "company_name", "ticker"])
+        while True:
+            rows = cursor.fetchmany(row_group_size)
+            if not rows:
+                break
+            out.writerows(rows)
+            if writer is not None:
+                writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type) for column, field
+                                                         in zip(zip(*rows), schema)], schema=schema))
+    if writer is not None:
+        writer.close()
+    con.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the mapping batches of data/mapping_stock, deduplicated on (cik, ticker).")
+    parser.add_argument("--input", default=folder_path, help="folder of the batch files")
+    parser.add_argument("--output", default=output_file, help="merged CSV; the .parquet and .db files are written next to it")
+    args = parser.parse_args()
+
+    base, _ = os.path.splitext(args.output)
+    csv_files = batch_files(args.input)
+    tmp_db = base + '.db.tmp'
+    stats = merge(csv_files, tmp_db)
+    write_outputs(tmp_db, args.output, base + '.parquet')
+    # ticker_index only trusts the database if it is not older than the CSV
+    os.utime(tmp_db)
+    os.replace(tmp_db, base + '.db')
 
-print(f'Merged {len(csv_files)} CSV files into {output_file}')
+    print(f"Merged {stats['files']} files into {args.output}: {stats['read']} rows read, "
+          f"{stats['unique']} unique (cik, ticker) pairs, {stats['skipped']} rows without cik or ticker skipped")
+    print(f"Typed copy written to {base}.parquet, lookup index to {base}.db")
@@ -0,0 +1,355 @@
+'''
+Parsing of the EDGAR submission files in data/sec_submissions into (cik, company_name, ticker) rows,
+shared by generate_mapping.py and generate_mapping_batch.py.
+
+Files are parsed in a process pool, a chunk of files per task, and every submission yields one row
+tuple per ticker. Rows are written out as they arrive, so the whole mapping is never held in memory.
+orjson is used to parse the JSON when it is installed, the standard json module otherwise.
+
+Manifest records the (size, mtime, content hash) and rows of every parsed file, so that a rerun
+only parses files that are new or changed since the last run.
+'''
+
+import os
+import csv
+import json
+import sqlite3
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+SUBMISSIONS_DIR = 'data/sec_submissions'
+COLUMNS = ["cik", "company_name", "ticker"]
+# Submission files parsed by one task of the process pool
+CHUNK_SIZE = int(os.getenv("SEC_MAPPING_CHUNK_SIZE", 256))
+
+def submission_files(directory_path = SUBMISSIONS_DIR):
+    '''
+    Description:
+    Lists the JSON submission files of a directory in name order.
+
+    Parameters:
+
+    directory_path (str): Directory holding the submission files.
+
+    Returns:
+
+    list: Paths of the JSON files.
+
+    '''
+    return [os.path.join(directory_path, filename) for filename in sorted(os.listdir(directory_path))
+            if filename.endswith('.json')]
+
+def parse_submission(file_path):
+    '''
+    Description:
+    Reads one submission file into its mapping rows.
+
+    Parameters:
+
+    file_path (str): Path of the JSON submission file.
+
+    Returns:
+
+    list: A (cik, company_name, ticker) tuple per ticker of the company.
+
+    '''
+    with open(file_path, 'rb') as file:
+        return submission_rows(file.read())
+
+def submission_rows(content):
+    '''
+    Returns the (cik, company_name, ticker) rows of the raw JSON of a submission file.
+    '''
+    data = loads(content)
+    cik = data.get('cik', '')
+    company_name = data.get('company_name', '')
+    return [(cik, company_name, ticker) for ticker in data.get('tickers', [])]
+
+def parse_chunk(file_paths):
+    '''
+    Parses a chunk of submission files in a worker process. Returns (file_path, rows) pairs in input order.
+    '''
+    return [(file_path, parse_submission(file_path)) for file_path in file_paths]
+
+def parse_if_changed(file_path, known_hash):
+    '''
+    Description:
+    Hashes a submission file and parses it unless its content hash is known_hash.
+
+    Parameters:
+
+    file_path (str): Path of the JSON submission file.
+    known_hash (str): SHA-256 of the file when it was last parsed, or None.
+
+    Returns:
+
+    tuple: (sha256, rows), rows being None if the content is unchanged.
+
+    '''
+    with open(file_path, 'rb') as file:
+        content = file.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if digest == known_hash:
+        return digest, None
+    return digest, submission_rows(content)
+
+def parse_changed_chunk(entries):
+    '''
+    Runs parse_if_changed over a chunk of (file_path, known_hash) pairs in a worker process.
+    Returns (file_path, sha256, rows) triples in input order.
+    '''
+    return [(file_path,) + parse_if_changed(file_path, known_hash) for file_path, known_hash in entries]
+
+def _map_chunks(func, items, workers):
+    chunks = [items[i:i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+    if workers == 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            yield from func(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # map keeps results in order, so output is deterministic whatever the completion order
+        for results in pool.map(func, chunks):
+            yield from results
+
+def iter_changed(entries, workers = None):
+    '''
+    Description:
+    Hashes, and parses if changed, submission files in a process pool, in input order.
+
+    Parameters:
+
+    entries (list): (file_path, known_hash) pairs, known_hash None for files never parsed.
+    workers (int, optional): Worker processes. Defaults to the number of CPUs; 1 parses in this process.
+
+    Returns:
+
+    generator: (file_path, sha256, rows) triples, rows being None for files whose content is unchanged.
+
+    '''
+    return _map_chunks(parse_changed_chunk, entries, workers)
+
+def iter_parsed(file_paths, workers = None):
+    '''
+    Description:
+    Parses submission files in a process pool, yielding each file's rows in input order.
+
+    Parameters:
+
+    file_paths (list): Paths of the submission files.
+    workers (int, optional): Worker processes. Defaults to the number of CPUs; 1 parses in this process.
+
+    Returns:
+
+    generator: (file_path, rows) pairs.
+
+    '''
+    return _map_chunks(parse_chunk, file_paths, workers)
+
+def iter_rows(file_paths, workers = None):
+    '''
+    Yields the (cik, company_name, ticker) rows of every submission file in input order.
+    '''
+    for _, rows in iter_parsed(file_paths, workers):
+        yield from rows
+
+class RowWriter:
+    '''
+    Streams mapping rows to a CSV or Parquet file, chosen by the extension of the output path.
+    Parquet is written a row group at a time with cik as an integer column.
+    Rows go to a temporary file next to the output, which only replaces the output once the writer is
+    closed without an error, so an interrupted run never leaves a partial file behind.
+    '''
+    def __init__(self, output_path, row_group_size = 100000):
+        self.output_path = output_path
+        self.tmp_path = output_path + '.tmp'
+        self.parquet = output_path.endswith('.parquet')
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._pending = []
+        self._writer = None
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self._schema = pa.schema([("cik", pa.int64()), ("company_name", pa.string()), ("ticker", pa.string())])
+            self._writer = pq.ParquetWriter(self.tmp_path, self._schema)
+        else:
+            self._file = open(self.tmp_path, 'w', newline='', encoding='utf-8')
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(COLUMNS)
+
+    def write(self, rows):
+        if self.parquet:
+            self._pending.extend(rows)
+            if len(self._pending) >= self.row_group_size:
+                self._flush()
+        else:
+            self._csv.writerows(rows)
+        self.rows_written += len(rows)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        import pyarrow as pa
+        ciks, names, tickers = zip(*self._pending)
+        table = pa.Table.from_arrays([pa.array([int(cik) if cik not in ('', None) else None for cik in ciks], pa.int64()),
+                                      pa.array(names, pa.string()), pa.array(tickers, pa.string())], schema=self._schema)
+        self._writer.write_table(table)
+        self._pending = []
+
+    def close(self):
+        if self.parquet:
+            self._flush()
+            self._writer.close()
+        else:
+            self._file.close()
+        os.replace(self.tmp_path, self.output_path)
+
+    def discard(self):
+        '''
+        Closes the writer and deletes its temporary file, leaving the output as it was.
+        '''
+        if self.parquet:
+            self._writer.close()
+        else:
+            self._file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+class Manifest:
+    '''
+    SQLite record of the submission files behind a set of mapping batch files: for every file its size,
+    mtime, content hash, the batch it belongs to and the rows it produced.
+
+    A file keeps its batch for good and new files are appended to the last batch until it holds
+    batch_size files, so a changed file only ever dirties its own batch. Dirty batches are recorded in
+    the same transaction as the file changes and only cleared once their batch file has been rewritten,
+    so a run interrupted in between rewrites them on the next run.
+    '''
+    def __init__(self, path, batch_size):
+        self.path = path
+        self.batch_size = batch_size
+        self.con = sqlite3.connect(path)
+        self.con.execute("CREATE TABLE IF NOT EXISTS files(filename TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                         "sha256 TEXT, batch INTEGER)")
+        self.con.execute("CREATE TABLE IF NOT EXISTS rows(filename TEXT, seq INTEGER, cik, company_name, ticker, "
+                         "PRIMARY KEY(filename, seq))")
+        self.con.execute("CREATE INDEX IF NOT EXISTS files_batch ON files(batch)")
+        self.con.execute("CREATE TABLE IF NOT EXISTS dirty(batch INTEGER PRIMARY KEY)")
+        last = self.con.execute("SELECT batch, COUNT(*) FROM files GROUP BY batch ORDER BY batch DESC LIMIT 1").fetchone()
+        self.last_batch, self.last_count = last if last else (0, batch_size)
+
+    def scan(self, file_paths):
+        '''
+        Description:
+        Compares the submission files on disk with the manifest. Files whose size and mtime match
+        are taken as unchanged without being read.
+
+        Parameters:
+
+        file_paths (list): Paths of the submission files, in name order.
+
+        Returns:
+
+        tuple: (candidates, removed, unchanged). candidates lists (file_path, known_hash, size, mtime_ns)
+        of new or touched files, known_hash being None for new ones; removed lists the file names that
+        are gone; unchanged counts the files skipped.
+
+        '''
+        known = {filename: (size, mtime_ns, sha256) for filename, size, mtime_ns, sha256
+                 in self.con.execute("SELECT filename, size, mtime_ns, sha256 FROM files")}
+        candidates = []
+        unchanged = 0
+        for file_path in file_paths:
+            filename = os.path.basename(file_path)
+            stat = os.stat(file_path)
+            entry = known.pop(filename, None)
+            if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                unchanged += 1
+                continue
+            candidates.append((file_path, entry[2] if entry else None, stat.st_size, stat.st_mtime_ns))
+        return candidates, sorted(known), unchanged
+
+    def remove(self, filename):
+        '''
+        Drops a deleted file and its rows, and marks its batch dirty. Returns the batch it belonged to.
+        '''
+        batch = self.con.execute("SELECT batch FROM files WHERE filename = ?", (filename,)).fetchone()[0]
+        self.con.execute("DELETE FROM files WHERE filename = ?", (filename,))
+        self.con.execute("DELETE FROM rows WHERE filename = ?", (filename,))
+        self.con.execute("INSERT OR IGNORE INTO dirty VALUES (?)", (batch,))
+        return batch
+
+    def record(self, filename, size, mtime_ns, sha256, rows):
+        '''
+        Description:
+        Records the state of a scanned file. rows is None if its content hash is unchanged, in which case only
+        its size and mtime are updated; otherwise its batch is marked dirty.
+
+        Returns:
+
+        int: The file's batch if its rows changed, otherwise None.
+
+        '''
+        found = self.con.execute("SELECT batch FROM files WHERE filename = ?", (filename,)).fetchone()
+        if found is not None:
+            batch = found[0]
+        else:
+            if self.last_count >= self.batch_size:
+                self.last_batch += 1
+                self.last_count = 0
+            batch = self.last_batch
+            self.last_count += 1
+        self.con.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", (filename, size, mtime_ns, sha256, batch))
+        if rows is None:
+            return None
+        self.con.execute("DELETE FROM rows WHERE filename = ?", (filename,))
+        self.con.executemany("INSERT INTO rows VALUES (?, ?, ?, ?, ?)",
+                             [(filename, seq) + tuple(row) for seq, row in enumerate(rows)])
+        self.con.execute("INSERT OR IGNORE INTO dirty VALUES (?)", (batch,))
+        return batch
+
+    def batches(self):
+        return [batch for (batch,) in self.con.execute("SELECT DISTINCT batch FROM files ORDER BY batch")]
+
+    def dirty_batches(self):
+        '''
+        Returns the set of batches whose files changed since their batch file was last written.
+        '''
+        return {batch for (batch,) in self.con.execute("SELECT batch FROM dirty")}
+
+    def clean(self, batch):
+        '''
+        Marks a batch as written, once its batch file is in place.
+        '''
+        self.con.execute("DELETE FROM dirty WHERE batch = ?", (batch,))
+        self.con.commit()
+
+    def batch_rows(self, batch):
+        '''
+        Yields the rows of a batch's files, in file name order.
+        '''
+        cursor = self.con.execute("SELECT r.cik, r.company_name, r.ticker FROM files f JOIN rows r ON r.filename = f.filename "
+                                  "WHERE f.batch = ? ORDER BY f.filename, r.seq", (batch,))
+        for row in cursor:
+            yield row
+
+    def commit(self):
+        self.con.commit()
+
+    def close(self):
+        self.con.commit()
+        self.con.close()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# er_extraction and kg_construction modules import their siblings by plain name, as they do when run from their own directories
+for path in [ROOT, os.path.join(ROOT, 'er_extraction'), os.path.join(ROOT, 'kg_construction')]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
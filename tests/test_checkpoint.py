@@ -0,0 +1,94 @@
+import json
+import sqlite3
+import pytest
+import checkpoint
+import coordinator
+import ecm_store
+import main_A
+import merge_shards
+
+def fragment(*names):
+    return {"nodes": {"Company": [{"name": name, "ticker": name[:1]} for name in names]}, "relationships": {}}
+
+def merged(tmp_path, *stream_paths):
+    output_file = str(tmp_path / "merged.json")
+    stats = merge_shards.merge(list(stream_paths), output_file, indent = None)
+    with open(output_file, 'r', encoding="utf-8") as f:
+        return json.load(f), stats
+
+def test_resume_skips_completed_tickers(tmp_path):
+    stream_path, manifest_path = checkpoint.stream_paths(str(tmp_path / "kg.json"))
+    assert checkpoint.completed_tickers(manifest_path) == set()
+    checkpoint.append_company(stream_path, manifest_path, "A", "Alpha", fragment("Alpha"))
+    checkpoint.append_company(stream_path, manifest_path, "B", "Beta", fragment("Beta", "Alpha"))
+    assert checkpoint.completed_tickers(manifest_path) == {"A", "B"}
+
+def test_truncated_record_is_skipped(tmp_path):
+    stream_path, manifest_path = checkpoint.stream_paths(str(tmp_path / "kg.json"))
+    checkpoint.append_company(stream_path, manifest_path, "A", "Alpha", fragment("Alpha"))
+    # a run killed mid-write leaves a partial last line and no manifest entry
+    with open(stream_path, 'a', encoding="utf-8") as f:
+        f.write('{"ticker": "B", "name": "Be')
+    schema, stats = merged(tmp_path, stream_path)
+    assert [node["name"] for node in schema["nodes"]["Company"]] == ["Alpha"]
+    assert stats["invalid_records"] == 1
+    assert checkpoint.completed_tickers(manifest_path) == {"A"}
+
+def test_last_record_of_a_ticker_wins(tmp_path):
+    stream_path, manifest_path = checkpoint.stream_paths(str(tmp_path / "kg.json"))
+    checkpoint.append_company(stream_path, manifest_path, "B", "Beta", fragment("Beta", "Stale"))
+    checkpoint.append_company(stream_path, manifest_path, "A", "Alpha", fragment("Alpha", "Beta"))
+    checkpoint.append_company(stream_path, manifest_path, "B", "Beta", fragment("Beta"))
+    schema, stats = merged(tmp_path, stream_path)
+    # companies are merged in ticker order and shared nodes deduplicated
+    assert [node["name"] for node in schema["nodes"]["Company"]] == ["Alpha", "Beta"]
+    assert stats["superseded_records"] == 1
+
+@pytest.fixture
+def companies(tmp_path, monkeypatch):
+    db_path = tmp_path / "ecmdatabase.db"
+    con = sqlite3.connect(db_path)
+    con.execute("CREATE TABLE companies(stock_symbol TEXT PRIMARY KEY, name TEXT, item1 TEXT, item7 TEXT)")
+    con.executemany("INSERT INTO companies VALUES (?, ?, '', '')", [(f"T{i}", f"Co {i}") for i in range(5)])
+    con.commit()
+    con.close()
+    monkeypatch.setattr(ecm_store, "DB_PATH", str(db_path))
+    ecm_store.close()
+    extracted = []
+    monkeypatch.setattr(main_A, "extract_company", lambda stock_code, record: extracted.append(stock_code) or (None,) * 4)
+    monkeypatch.setattr(main_A, "get_company_names", lambda tickers: None)
+    monkeypatch.setattr(main_A, "BACKEND", "diffbot")
+    yield extracted
+    ecm_store.close()
+
+def test_rerun_extracts_only_the_remaining_companies(tmp_path, companies):
+    stream_path, manifest_path = checkpoint.stream_paths(str(tmp_path / "kg.json"))
+    # a first run stopped after two companies
+    checkpoint.append_company(stream_path, manifest_path, "T0", "Co 0", fragment("Co 0"))
+    checkpoint.append_company(stream_path, manifest_path, "T1", "Co 1", fragment("Co 1"))
+    stats = main_A.generate_json_schema(main_A.create_json_schema(), stream_path = stream_path, max_workers = 2)
+    assert sorted(companies) == ["T2", "T3", "T4"]
+    assert stats == {"stream_path": stream_path, "companies": 3, "skipped": 2}
+    assert checkpoint.completed_tickers(manifest_path) == {f"T{i}" for i in range(5)}
+
+def test_limit_counts_only_new_companies(tmp_path, companies):
+    stream_path, manifest_path = checkpoint.stream_paths(str(tmp_path / "kg.json"))
+    checkpoint.append_company(stream_path, manifest_path, "T0", "Co 0", fragment("Co 0"))
+    # a finished ticker outside the range read is not counted as skipped
+    checkpoint.append_company(stream_path, manifest_path, "T4", "Co 4", fragment("Co 4"))
+    for expected in [["T1", "T2"], ["T3"]]:
+        del companies[:]
+        stats = main_A.generate_json_schema(main_A.create_json_schema(), limit = 2, stream_path = stream_path, max_workers = 1)
+        assert companies == expected
+    assert stats == {"stream_path": stream_path, "companies": 1, "skipped": 4}
+
+def test_shards_stay_within_their_ranges_on_resume(tmp_path, companies):
+    keys = ecm_store.company_keys()
+    ranges = coordinator.shard_ranges(keys, 2)
+    assert ranges == [(None, ("Co 2", "T2")), (("Co 2", "T2"), ("Co 4", "T4"))]
+    stream_path, manifest_path = checkpoint.stream_paths(str(tmp_path / "shard_0.json"))
+    checkpoint.append_company(stream_path, manifest_path, "T0", "Co 0", fragment("Co 0"))
+    start_after, until = ranges[0]
+    main_A.generate_json_schema(main_A.create_json_schema(), start_after = start_after, until = until,
+                                stream_path = stream_path, max_workers = 1)
+    assert companies == ["T1", "T2"]
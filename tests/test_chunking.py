@@ -0,0 +1,32 @@
+from concurrent.futures import Future
+import chunking
+
+def response(*names):
+    return {"entities": [{"name": name, "salience": 0.5, "allTypes": []} for name in names],
+            "facts": [{"entity": {"name": name}, "property": {"name": "industry"}, "value": {"name": "Software"}}
+                      for name in names]}
+
+def resolved(result = None, error = None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+    return future
+
+def test_failed_chunk_does_not_discard_the_others(capsys):
+    futures = [resolved(response("Alpha")), resolved(error = TimeoutError("read timed out")), resolved(response("Beta"))]
+    responses = [chunking.chunk_response(future) for future in futures]
+    assert "TimeoutError" in responses[1]["error"]
+    merged = chunking.merge_responses(responses)
+    assert [ent["name"] for ent in merged["entities"]] == ["Alpha", "Beta"]
+    assert "1 of 3 chunks failed" in capsys.readouterr().out
+
+def test_single_surviving_chunk_reports_failures(capsys):
+    responses = [{"error": "HTTP 429"}, response("Alpha")]
+    assert chunking.merge_responses(responses) == responses[1]
+    assert "1 of 2 chunks failed" in capsys.readouterr().out
+
+def test_all_chunks_failed_returns_first_error():
+    responses = [{"error": "HTTP 429"}, {"error": "HTTP 500"}]
+    assert chunking.merge_responses(responses) == {"error": "HTTP 429"}
@@ -0,0 +1,51 @@
+import sqlite3
+import pytest
+import ecm_store
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    db_path = tmp_path / "ecmdatabase.db"
+    con = sqlite3.connect(db_path)
+    con.execute("CREATE TABLE companies(stock_symbol TEXT PRIMARY KEY, name TEXT, item1 TEXT, item7 TEXT)")
+    con.executemany("INSERT INTO companies VALUES (?, ?, ?, ?)",
+                    [(f"T{i}", f"Co {i}", f"item1 {i}", f"item7 {i}") for i in range(7)])
+    con.commit()
+    con.close()
+    monkeypatch.setattr(ecm_store, "DB_PATH", str(db_path))
+    ecm_store.close()
+    yield ecm_store
+    ecm_store.close()
+
+def test_get_company(store):
+    assert store.get_company("T3") == ("Co 3", "T3", "item1 3", "item7 3")
+    assert store.get_company("NOPE") is None
+
+def test_close_then_reopen(store):
+    assert store.get_company("T1") is not None
+    store.close()
+    assert store._connection is None
+    # a later call reopens the connection
+    assert store.get_company("T1") == ("Co 1", "T1", "item1 1", "item7 1")
+    store.close()
+    assert len(store.company_keys()) == 7
+
+def test_close_twice(store):
+    store.get_connection()
+    store.close()
+    store.close()
+
+def test_iter_companies_keyset_paging(store):
+    keys = store.company_keys()
+    rows = list(store.iter_companies(batch_size=3))
+    assert [(name, symbol) for name, symbol, _, _ in rows] == keys
+    resumed = list(store.iter_companies(start_after=keys[2], limit=3, batch_size=2))
+    assert [(name, symbol) for name, symbol, _, _ in resumed] == keys[3:6]
+
+def test_iter_companies_sorts_the_keys_once(store):
+    statements = []
+    store.get_connection().set_trace_callback(statements.append)
+    rows = list(store.iter_companies(batch_size=2))
+    assert len(rows) == 7
+    # one ordered query over the keys; the filings are then fetched by rowid
+    assert sum("ORDER BY" in statement for statement in statements) == 1
+    assert not any("ORDER BY" in statement and "item1" in statement for statement in statements)
@@ -0,0 +1,38 @@
+import os
+import pytest
+import gazetteer
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+@pytest.fixture(scope="module", autouse=True)
+def index():
+    patch = pytest.MonkeyPatch()
+    patch.setattr(gazetteer, "ALIASES_PATH", os.path.join(DATA, "country_aliases.csv"))
+    patch.setattr(gazetteer, "CITIES_PATH", os.path.join(DATA, "world_cities.csv"))
+    patch.setattr(gazetteer, "_countries", None)
+    patch.setattr(gazetteer, "_places", None)
+    yield
+    patch.undo()
+
+@pytest.mark.parametrize("place, country", [
+    ("Cupertino, California", "United States"),
+    ("Santa Clara, California", "United States"),
+    ("London", "United Kingdom"),
+    ("Tokyo", "Japan"),
+    ("Korea", "Korea, Republic of"),
+    ("England", "United Kingdom"),
+    ("U.S.", "United States"),
+])
+def test_resolved_locally(place, country):
+    assert gazetteer.lookup_country(place) == country
+
+def test_regions_are_not_countries():
+    # a town named Asia exists in the Philippines
+    assert gazetteer.lookup_country("Asia") == gazetteer.NOT_FOUND
+    assert gazetteer.lookup_country("Asia Pacific") == gazetteer.NOT_FOUND
+    assert not gazetteer.is_country("Europe")
+
+def test_ambiguous_names_are_left_to_geonames():
+    # Santa Clara, Cuba is larger than Santa Clara, California, but not by enough to decide
+    assert gazetteer.lookup_country("Santa Clara") is None
+    assert gazetteer.lookup_country("Nowhere Springs Research Park") is None
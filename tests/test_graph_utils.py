@@ -0,0 +1,56 @@
+import pytest
+from neo4j.exceptions import ConstraintError
+import graph_utils
+
+def test_unwind_query_rewrites_parameters():
+    assert graph_utils.unwind_query("MERGE (:Region{m49: $m49, name: $name})") == \
+        "UNWIND $rows AS row\nMERGE (:Region{m49: row.m49, name: row.name})"
+
+def test_unwind_query_leaves_literals_and_comments():
+    query = '''MATCH (c:Company {ticker: $ticker}) // keyed on $ticker
+SET c.note = 'costs $5', c.label = "$name", c.`$raw` = $value /* not $this */'''
+    assert graph_utils.unwind_query(query) == "UNWIND $rows AS row\n" + '''MATCH (c:Company {ticker: row.ticker}) // keyed on $ticker
+SET c.note = 'costs $5', c.label = "$name", c.`$raw` = row.value /* not $this */'''
+
+def test_unwind_query_keeps_explicit_unwind():
+    query = "UNWIND $rows AS r MERGE (:Sector{gics: r.gics})"
+    assert graph_utils.unwind_query(query) == query
+    # a "$rows" in a literal does not count as an explicit UNWIND
+    assert graph_utils.unwind_query("MERGE (:Note{text: '$rows', id: $id})").startswith("UNWIND $rows AS row\n")
+
+class FakeSession:
+    def __init__(self, fail_from):
+        self.fail_from = fail_from
+        self.batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute_write(self, func, query, rows):
+        self.batches.append(rows)
+        if rows[0]["id"] >= self.fail_from:
+            raise ConstraintError("null property")
+        return type("Summary", (), {"counters": len(rows)})()
+
+class FakeDriver:
+    def __init__(self, session):
+        self._session = session
+
+    def session(self, database):
+        return self._session
+
+def test_failed_batches_raise_after_all_batches_ran(monkeypatch):
+    session = FakeSession(fail_from = 4)
+    monkeypatch.setattr(graph_utils, "get_driver", lambda: FakeDriver(session))
+    rows = [{"id": i} for i in range(10)]
+    with pytest.raises(graph_utils.BatchWriteError) as error:
+        graph_utils.execute_batched_write("MERGE (:Node{id: $id})", rows, batch_size = 3)
+    assert len(session.batches) == 4
+    assert [(result.start, result.error is None) for result in error.value.results] == \
+        [(0, True), (3, True), (6, False), (9, False)]
+
+    results = graph_utils.execute_batched_write("MERGE (:Node{id: $id})", rows, batch_size = 3, raise_on_error = False)
+    assert [result.error is None for result in results] == [True, True, False, False]
@@ -0,0 +1,47 @@
+import pytest
+import http_client
+import response_cache
+import instrumentation
+import main_A
+from benchmarks import fake_services
+
+@pytest.fixture
+def failing_services(tmp_path, monkeypatch):
+    server, _ = fake_services.serve(error_rate=1.0)
+    url = "http://127.0.0.1:%d" % server.server_address[1]
+    monkeypatch.setattr(http_client, "SERVICE_URLS", dict(http_client.SERVICE_URLS, diffbot=url, geonames=url))
+    monkeypatch.setattr(http_client, "RETRIES", http_client.RETRIES.new(backoff_factor=0))
+    monkeypatch.setattr(http_client, "_session", None)
+    monkeypatch.setattr(response_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "readwrite")
+    yield url
+    http_client._session = None
+    server.shutdown()
+
+def test_exhausted_retries_return_the_error_response(failing_services):
+    res = main_A.get_request({"content": "Acme Corp makes anvils.", "lang": "en", "format": "plain text"})
+    assert main_A.response_error(res) == "injected diffbot failure"
+
+def test_geonames_failure_is_not_found_and_not_cached(failing_services):
+    # a name no other test looks up, since city_to_country is memoised for the whole run
+    assert main_A.city_to_country("Zzyzx Springs Campus") == "Not Found"
+    assert response_cache.cache_get(response_cache.text_key("Zzyzx Springs Campus"), namespace = "geonames") is None
+
+def test_connection_error_is_an_error_response(failing_services, monkeypatch):
+    monkeypatch.setattr(http_client, "SERVICE_URLS", dict(http_client.SERVICE_URLS, diffbot="http://127.0.0.1:9"))
+    res = main_A.get_request({"content": "Acme Corp makes anvils.", "lang": "en", "format": "plain text"})
+    assert "request failed" in main_A.response_error(res)
+
+def test_only_requests_that_reach_the_api_are_timed(failing_services, monkeypatch):
+    monkeypatch.setattr(instrumentation, "_stages", {})
+    payload = {"content": "Globex sells widgets.", "lang": "en", "format": "plain text"}
+    main_A.get_request(payload)
+    response_cache.cache_put(response_cache.payload_key(payload, main_A.FIELDS), {"entities": [], "facts": []})
+    assert main_A.get_request(payload) == {"entities": [], "facts": []}
+    main_A.city_to_country("Zzyzx Springs Annex")
+    # names the gazetteer knows, or already looked up, are not Geonames calls
+    main_A.city_to_country("Zzyzx Springs Annex")
+    main_A.city_to_country("France")
+    stages = instrumentation.snapshot()
+    assert stages["get_request"]["calls"] == 1
+    assert stages["city_to_country"]["calls"] == 1
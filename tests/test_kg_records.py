@@ -0,0 +1,24 @@
+import sys
+import json
+import pytest
+import kg_records
+
+def test_record_behaves_like_its_dict():
+    data = {"name": "Acme", "SIC_code": None, "primary_activity": "Makes anvils", "extra": 1}
+    node = kg_records.compact("Industry", dict(data))
+    assert node == data and node.get("missing") is None
+    assert json.loads(json.dumps(node, default=kg_records.to_json)) == data
+
+def test_record_is_unhashable():
+    node = kg_records.CompanyNode({"name": "Acme"})
+    with pytest.raises(TypeError):
+        hash(node)
+    with pytest.raises(TypeError):
+        {node}
+
+def test_only_key_fields_are_interned():
+    name = "".join(["Acme ", "Corp"])
+    description = "".join(["Makes ", "anvils"])
+    node = kg_records.IndustryNode({"name": name, "primary_activity": description})
+    assert node["name"] is sys.intern("Acme Corp")
+    assert node["primary_activity"] is description
@@ -0,0 +1,77 @@
+import os
+import json
+import pytest
+import sec_mapping
+import generate_mapping_batch
+import merge_csv
+
+@pytest.fixture
+def submissions(tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_mapping_batch, "batch_size", 2)
+    directory_path = tmp_path / "sec_submissions"
+    directory_path.mkdir()
+    for i in range(5):
+        write_submission(directory_path, i, [f"T{i}"])
+    return directory_path
+
+def write_submission(directory_path, i, tickers, mtime_ns = None):
+    path = os.path.join(directory_path, f"CIK{i:010d}.json")
+    with open(path, 'w') as f:
+        json.dump({"cik": i, "company_name": f"Company {i}", "tickers": tickers}, f)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def run(directory_path, output_dir, format = "csv"):
+    return generate_mapping_batch.update_batches(sec_mapping.submission_files(str(directory_path)), str(output_dir),
+                                                 format, workers = 1)
+
+def rows(output_dir):
+    return sorted(row for path in merge_csv.batch_files(str(output_dir)) for row in merge_csv.iter_batch_rows(path))
+
+def test_only_changed_batches_are_rewritten(submissions, tmp_path):
+    output_dir = tmp_path / "mapping_stock"
+    stats = run(submissions, output_dir)
+    assert (stats["parsed"], stats["batches_written"]) == (5, 3)
+    assert run(submissions, output_dir)["batches_written"] == 0
+
+    # new content in batch 2 (files 2 and 3); a changed mtime alone is hashed but not reparsed
+    write_submission(submissions, 3, ["T3", "T3B"], mtime_ns = 10**18)
+    os.utime(os.path.join(submissions, f"CIK{0:010d}.json"), ns=(10**18, 10**18))
+    stats = run(submissions, output_dir)
+    assert (stats["parsed"], stats["touched"], stats["batches_written"]) == (1, 1, 1)
+    assert ("3", "Company 3", "T3B") in rows(output_dir)
+
+    os.remove(os.path.join(submissions, f"CIK{4:010d}.json"))
+    stats = run(submissions, output_dir)
+    assert (stats["removed"], stats["batches_removed"]) == (1, 1)
+    assert sorted(os.listdir(output_dir)) == ["manifest.db", "mapping_batch_1.csv", "mapping_batch_2.csv"]
+
+def test_interrupted_rewrite_is_resumed(submissions, tmp_path, monkeypatch):
+    output_dir = tmp_path / "mapping_stock"
+    run(submissions, output_dir)
+    before = rows(output_dir)
+    write_submission(submissions, 0, ["T0", "T0B"], mtime_ns = 10**18)
+
+    def fail(self, rows):
+        raise KeyboardInterrupt
+    with monkeypatch.context() as m:
+        m.setattr(sec_mapping.RowWriter, "write", fail)
+        with pytest.raises(KeyboardInterrupt):
+            run(submissions, output_dir)
+    # the old batch file is left whole, and the batch is still dirty although its file was recorded
+    assert rows(output_dir) == before
+    assert not [f for f in os.listdir(output_dir) if f.endswith(".tmp")]
+
+    stats = run(submissions, output_dir)
+    assert (stats["parsed"], stats["batches_written"]) == (0, 1)
+    assert ("0", "Company 0", "T0B") in rows(output_dir)
+
+def test_format_change_replaces_every_batch(submissions, tmp_path):
+    output_dir = tmp_path / "mapping_stock"
+    run(submissions, output_dir)
+    stats = run(submissions, output_dir, "parquet")
+    assert stats["batches_written"] == 3
+    assert sorted(f for f in os.listdir(output_dir) if f != "manifest.db") == \
+        ["mapping_batch_1.parquet", "mapping_batch_2.parquet", "mapping_batch_3.parquet"]
+    assert [(int(cik), name, ticker) for cik, name, ticker in rows(output_dir)] == \
+        [(i, f"Company {i}", f"T{i}") for i in range(5)]
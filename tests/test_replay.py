@@ -0,0 +1,21 @@
+import pytest
+import response_cache
+import main_A
+
+@pytest.fixture
+def replay(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(response_cache, "CACHE_MODE", "replay")
+    monkeypatch.setattr(main_A, "BACKEND", "diffbot")
+
+def test_replay_miss_is_an_error_response(replay):
+    res = main_A.get_request({"content": "Acme Corp makes anvils.", "lang": "en", "format": "plain text"})
+    assert "Replay mode" in main_A.response_error(res)
+    assert main_A.response_error({"entities": [], "facts": []}) is None
+
+def test_replay_miss_is_reported_by_the_10k_pipeline(replay, capsys):
+    record = ("Acme Corp", "ACME", "Acme Corp makes anvils.", "Sales grew.")
+    assert main_A.sec_10k_ner_rel_pipeline("ACME", record) == (None, None)
+    out = capsys.readouterr().out
+    assert "Replay mode: no cached response" in out
+    assert "Rate Limit" not in out
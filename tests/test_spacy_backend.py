@@ -0,0 +1,49 @@
+import pytest
+import spacy_backend
+
+spacy = pytest.importorskip("spacy")
+
+TEXT = "Acme Corp is headquartered in France. We compete with Globex."
+
+def blank_pipeline():
+    nlp = spacy.blank("en")
+    ruler = nlp.add_pipe("entity_ruler")
+    ruler.add_patterns([{"label": "ORG", "pattern": "Acme Corp"}, {"label": "ORG", "pattern": "Globex"},
+                        {"label": "GPE", "pattern": "France"}])
+    return nlp
+
+@pytest.fixture
+def backend(monkeypatch):
+    nlp = blank_pipeline()
+    nlp.add_pipe("sentencizer", first=True)
+    monkeypatch.setattr(spacy_backend, "_nlp", nlp)
+    monkeypatch.setattr(spacy_backend, "_prefetched", {})
+    return spacy_backend
+
+def facts(response):
+    return sorted((f["entity"]["name"], f["property"]["name"], f["value"]["name"]) for f in response["facts"])
+
+def test_prefetched_responses_are_kept_per_subject(backend):
+    backend.prefetch([TEXT, TEXT], ["Acme Corp", "Initech"])
+    assert set(backend._prefetched) == {"Acme Corp", "Initech"}
+    response = backend.analyse(TEXT, "Acme Corp")
+    assert ("Acme Corp", "competitors", "Globex") in facts(response)
+    assert TEXT not in backend._prefetched["Acme Corp"]
+
+    # the same text prefetched for another company is not handed to this one, and is dropped with its company
+    backend.evict("Initech")
+    assert "Initech" not in backend._prefetched
+
+def test_prefetch_in_worker_processes(backend, tmp_path, monkeypatch):
+    model_path = tmp_path / "model"
+    blank_pipeline().to_disk(model_path)
+    # spawned workers import spacy_backend afresh, so they read the model from the environment
+    monkeypatch.setenv("ER_SPACY_MODEL", str(model_path))
+    monkeypatch.setattr(spacy_backend, "SPACY_PROCESSES", 2)
+    monkeypatch.setattr(spacy_backend, "SPACY_BATCH_SIZE", 1)
+    try:
+        backend.prefetch([TEXT, "Globex sells widgets."], ["Acme Corp", "Globex"])
+    finally:
+        backend.close_pool()
+    assert facts(backend.analyse(TEXT, "Acme Corp")) == facts(spacy_backend.doc_to_response(backend._nlp(TEXT), "Acme Corp"))
+    assert backend._prefetched["Globex"]
@@ -0,0 +1,21 @@
+import pytest
+import ticker_index
+
+@pytest.fixture
+def index(monkeypatch):
+    names = {"boyd gaming": "BYD", "byd": "BYDDY", "apple": "AAPL"}
+    monkeypatch.setattr(ticker_index, "_index", names)
+    monkeypatch.setattr(ticker_index, "_index_by_initial", {"b": ["boyd gaming", "byd"], "a": ["apple"]})
+    monkeypatch.setattr(ticker_index, "_tickers", set(names.values()))
+    ticker_index.lookup_ticker.cache_clear()
+    yield ticker_index
+    ticker_index.lookup_ticker.cache_clear()
+
+def test_name_wins_over_a_ticker_spelled_the_same(index):
+    assert index.lookup_ticker("BYD") == "BYDDY"
+    assert index.lookup_ticker("Boyd Gaming Corp") == "BYD"
+
+def test_listed_ticker_without_a_name_match(index):
+    assert index.lookup_ticker("AAPL") == "AAPL"
+    assert index.lookup_ticker("Apple Inc.") == "AAPL"
+    assert index.lookup_ticker("Zzyzx Holdings") is None